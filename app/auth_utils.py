@@ -23,6 +23,33 @@ oauth.register(
     }
 )
 
+def _fernet():
+    import base64
+    import hashlib
+    from cryptography.fernet import Fernet
+
+    return Fernet(base64.urlsafe_b64encode(hashlib.sha256(settings.secret_key.encode()).digest()))
+
+
+def encrypt_secret(value: Optional[str]) -> Optional[str]:
+    """Encrypt a stored credential (e.g. a Google refresh token) with a key derived from the app secret."""
+    if not value:
+        return None
+    return _fernet().encrypt(value.encode()).decode()
+
+
+def decrypt_secret(value: Optional[str]) -> Optional[str]:
+    """Reverse `encrypt_secret`; None if missing or unreadable (plaintext from before, or a rotated secret)."""
+    from cryptography.fernet import InvalidToken
+
+    if not value:
+        return None
+    try:
+        return _fernet().decrypt(value.encode()).decode()
+    except (InvalidToken, ValueError):
+        return None
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against a hashed password."""
     try:
@@ -0,0 +1,156 @@
+"""
+Content-addressed storage for uploaded photos, videos and documents.
+
+Files live once per SHA-256 under the storage key `blobs/<aa>/<bb>/<sha><ext>`
+(two levels of sharding keep directories small) in the configured storage
+backend (app/storage.py; locally that's `uploads/blobs/...`), and `Photo.filename` /
+`Document.file_path` hold `<sha><ext>`. A `Blob` row counts how many rows
+reference each file, so the same photo uploaded by five trip members is
+stored (and thumbnailed) once, and the file is unlinked only when the last
+reference goes away.
+
+Reference counts change with single UPDATE statements in the caller's
+transaction, so concurrent uploads and deletes can't lose an increment.
+Putting a blob's file and deleting it are serialized per SHA-256 by
+`blob_lock`: `remove_files` re-checks for a `Blob` row and deletes the
+objects while holding it, and `add_ref` counts its reference and puts or
+discards its file under the same lock, so a re-upload racing the last delete
+either sees the file gone and stores it again, or its row stops the delete.
+The lock is per process, which is what the single-connection SQLite setup
+runs as (uncommitted rows are visible to `remove_files` on that connection).
+Files uploaded before the store existed keep their old `<uuid><ext>` names
+in `uploads/<trip_id>/` and `uploads/docs/`, and are handled as before.
+"""
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, Optional
+import asyncio
+import logging
+import mimetypes
+import re
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import _session_factory
+from app.models import Blob
+from app.storage import storage
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR = Path(__file__).parent.parent / "uploads" / "blobs"
+TMP_DIR = BLOBS_DIR / "tmp"
+
+# "<sha><ext>" or a derived file such as "<sha>_640.webp"
+BLOB_NAME = re.compile(r"^([0-9a-f]{64})(?:_\d+)?\.[A-Za-z0-9]+$")
+
+_locks: Dict[str, asyncio.Lock] = {}
+_lock_users: Dict[str, int] = {}
+
+
+def blob_sha(filename: str) -> Optional[str]:
+    """The SHA-256 a stored filename refers to, or None for legacy uuid names."""
+    match = BLOB_NAME.match(filename or "")
+    return match.group(1) if match else None
+
+
+def blob_key(filename: str) -> str:
+    """Storage key of a blob (or a file derived from it, such as a thumbnail)."""
+    sha = blob_sha(filename)
+    return f"blobs/{sha[:2]}/{sha[2:4]}/{filename}"
+
+
+def blob_path(filename: str) -> Path:
+    """Where a blob lives on disk with local storage."""
+    sha = blob_sha(filename)
+    return BLOBS_DIR / sha[:2] / sha[2:4] / filename
+
+
+def local_copy(filename: str):
+    """Async context manager yielding a local path with the blob's bytes (a temp copy for remote storage)."""
+    return storage.local_copy(blob_key(filename))
+
+
+@asynccontextmanager
+async def blob_lock(sha256: str):
+    """Hold while changing whether a blob's file exists in storage (see module docstring)."""
+    lock = _locks.setdefault(sha256, asyncio.Lock())
+    _lock_users[sha256] = _lock_users.get(sha256, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        _lock_users[sha256] -= 1
+        if not _lock_users[sha256]:
+            del _lock_users[sha256], _locks[sha256]
+
+
+def _increment(sha256: str):
+    return update(Blob).where(Blob.sha256 == sha256).values(refcount=Blob.refcount + 1)
+
+
+async def add_ref(session: AsyncSession, tmp_path: Path, sha256: str, size: int, ext: str) -> str:
+    """
+    Take ownership of a freshly written temp file and count one reference to
+    it. If the content is already stored the temp file is discarded. Returns
+    the `<sha><ext>` filename to store on the row. Caller commits.
+    """
+    async with blob_lock(sha256):
+        filename = await add_stored_ref(session, sha256, size, ext)
+        key = blob_key(filename)
+        if await storage.exists(key):
+            tmp_path.unlink(missing_ok=True)
+        else:
+            await storage.put_file(key, tmp_path, mimetypes.guess_type(filename)[0])
+    return filename
+
+
+async def add_stored_ref(session: AsyncSession, sha256: str, size: int, ext: str) -> str:
+    """
+    Count one reference to content that is already in storage (e.g. uploaded
+    directly). Caller commits, and holds `blob_lock(sha256)` if the file could
+    be going away concurrently.
+    """
+    result = await session.execute(_increment(sha256))
+    if result.rowcount == 0:
+        try:
+            async with session.begin_nested():
+                session.add(Blob(sha256=sha256, size=size, ext=ext, refcount=1))
+        except IntegrityError:
+            # Another upload of the same bytes inserted it first.
+            await session.execute(_increment(sha256))
+
+    blob = await session.get(Blob, sha256)
+    return f"{sha256}{blob.ext}"
+
+
+async def release(session: AsyncSession, filename: str) -> bool:
+    """
+    Drop one reference. Returns True when it was the last one; the caller
+    should then `await remove_files(filename)` after committing.
+    """
+    sha = blob_sha(filename)
+    if not sha:
+        return False
+    await session.execute(
+        update(Blob).where(Blob.sha256 == sha).values(refcount=Blob.refcount - 1)
+    )
+    result = await session.execute(
+        delete(Blob).where(Blob.sha256 == sha, Blob.refcount <= 0)
+    )
+    return result.rowcount == 1
+
+
+async def remove_files(filename: str):
+    """Delete a blob and everything derived from it (thumbnails), unless it was re-added meanwhile."""
+    from app.thumbnails import THUMBNAIL_WIDTHS, thumbnail_filename
+
+    sha = blob_sha(filename)
+    async with blob_lock(sha):
+        async with _session_factory() as session:
+            if await session.get(Blob, sha) is not None:
+                return
+        for name in [filename] + [thumbnail_filename(filename, w) for w in THUMBNAIL_WIDTHS]:
+            await storage.delete(blob_key(name))
+    logger.info(f"Removed unreferenced blob {sha}")
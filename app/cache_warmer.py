@@ -0,0 +1,140 @@
+"""
+Background warmer for the map page caches.
+
+Every `cache_warmer_interval_seconds` the warmer picks trips that start within
+`cache_warmer_days_ahead` days or were created/edited in the last
+`cache_warmer_recent_hours`, and for each one resolves the destination and
+start location, fetches the route, loads Gemini recommendations and geocodes
+the itinerary, so the first person to open the map hits warm caches.
+
+Work runs `cache_warmer_concurrency` trips at a time. While Nominatim is
+backing off after a 429 the warmer waits it out, and while the Gemini
+circuit breaker is open it skips recommendations instead of queueing calls.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+import asyncio
+import logging
+
+from sqlalchemy import or_
+from sqlmodel import select
+
+from app.config import settings
+from app.database import _session_factory
+from app.geocoding import geocode_trip_itinerary, get_coordinates_async, nominatim_backoff_remaining
+from app.llm_executor import CircuitBreaker, llm_executor
+from app.models import Trip
+
+logger = logging.getLogger(__name__)
+
+_STARTUP_DELAY = 30.0  # let the app finish booting before the first scan
+
+
+class CacheWarmer:
+    def __init__(
+        self,
+        interval: float = settings.cache_warmer_interval_seconds,
+        days_ahead: int = settings.cache_warmer_days_ahead,
+        recent_hours: int = settings.cache_warmer_recent_hours,
+        concurrency: int = settings.cache_warmer_concurrency,
+    ):
+        self.interval = interval
+        self.days_ahead = days_ahead
+        self.recent_hours = recent_hours
+        self.concurrency = max(1, concurrency)
+        self._task: Optional[asyncio.Task] = None
+        # trip_id -> updated_at it was last warmed at; unchanged trips are skipped
+        self._warmed: Dict[int, Optional[datetime]] = {}
+        self.runs = self.trips_warmed = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        await asyncio.sleep(_STARTUP_DELAY)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Cache warmer run failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _candidates(self):
+        today = date.today()
+        recent = datetime.utcnow() - timedelta(hours=self.recent_hours)
+        async with _session_factory() as session:
+            result = await session.execute(
+                select(Trip).where(or_(
+                    Trip.start_date.between(today, today + timedelta(days=self.days_ahead)),
+                    Trip.created_at >= recent,
+                    Trip.updated_at >= recent,
+                )).order_by(Trip.start_date)
+            )
+            trips = result.scalars().all()
+        # Forget trips that left the window or were deleted, so the map only holds current candidates.
+        current = {t.id for t in trips}
+        self._warmed = {trip_id: at for trip_id, at in self._warmed.items() if trip_id in current}
+        return [t for t in trips if t.id not in self._warmed or self._warmed[t.id] != t.updated_at]
+
+    async def run_once(self) -> int:
+        """Warm every candidate trip once; returns how many were warmed."""
+        trips = await self._candidates()
+        if not trips:
+            return 0
+        self.runs += 1
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(trip: Trip):
+            async with semaphore:
+                await self._wait_for_upstreams()
+                try:
+                    await self.warm_trip(trip)
+                    self._warmed[trip.id] = trip.updated_at
+                    self.trips_warmed += 1
+                except Exception as e:
+                    logger.warning(f"Cache warm for trip {trip.id} failed: {e}")
+
+        await asyncio.gather(*(warm(t) for t in trips))
+        logger.info(f"Cache warmer warmed {len(trips)} trip(s)")
+        return len(trips)
+
+    async def _wait_for_upstreams(self):
+        backoff = nominatim_backoff_remaining()
+        if backoff > 0:
+            logger.info(f"Cache warmer pausing {backoff:.0f}s for Nominatim backoff")
+            await asyncio.sleep(backoff)
+
+    async def warm_trip(self, trip: Trip):
+        # Imported here: the maps router owns the recommendation cache and routing chain.
+        from app.routers.maps import recommendation_cache
+        from app.routing import routing
+
+        destination_coords = await get_coordinates_async(trip.destination)
+        start_coords = await get_coordinates_async(trip.start_location) if trip.start_location else None
+        if destination_coords and start_coords:
+            await routing.route([start_coords, destination_coords])
+
+        if settings.gemini_api_key and llm_executor.breaker.state != CircuitBreaker.OPEN:
+            await recommendation_cache.get(trip.destination)
+
+        await geocode_trip_itinerary(trip.id)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "trips_warmed": self.trips_warmed,
+            "tracked_trips": len(self._warmed),
+        }
+
+
+cache_warmer = CacheWarmer()
@@ -27,6 +27,38 @@ class Settings(BaseSettings):
     max_upload_size: int = 10485760  # 10MB
     allowed_extensions: str = "jpg,jpeg,png,gif,webp"
     upload_dir: str = "uploads"
+    max_resumable_upload_size: int = 524288000  # 500MB — videos via the resumable endpoint
+    resumable_upload_ttl: int = 86400  # abandoned resumable sessions are swept after a day idle
+    max_bulk_upload_files: int = 50  # files per multi-file gallery upload
+    max_bulk_upload_size: int = 262144000  # 250MB — whole body of a multi-file upload
+    media_workers: int = 2  # processes for thumbnailing and other image work
+    trip_storage_quota: int = 0  # bytes of photos, videos and documents per trip; 0 = unlimited
+    user_storage_quota: int = 0  # bytes a user may upload across all trips; 0 = unlimited
+    storage_reconcile_interval: int = 21600  # 6h between recomputing storage counters from the rows; 0 = off
+    metadata_backfill_enabled: bool = True  # read EXIF of photos uploaded before extraction existed
+    near_duplicate_max_distance: int = 10  # dHash bits (of 64) apart for photos to count as near-duplicates
+    image_normalize_enabled: bool = False  # re-encode uploaded photos (app/image_normalize.py)
+    image_max_dimension: int = 2560  # long side of normalized photos, in pixels
+    image_quality: int = 82  # JPEG/WebP quality of normalized photos
+    image_normalize_format: str = "jpeg"  # "jpeg" or "webp"
+    media_offload: str = ""  # "", "x-accel" (nginx) or "x-sendfile": let the proxy send file bodies
+    media_accel_prefix: str = "/protected-uploads"  # nginx internal location aliased to uploads/
+
+    # Object storage for uploads (app/storage.py): "local" (uploads/) or "s3"
+    storage_backend: str = "local"
+    s3_endpoint_url: str = ""  # e.g. https://s3.eu-west-1.amazonaws.com, or http://localhost:9000 for MinIO
+    s3_bucket: str = ""
+    s3_region: str = "us-east-1"
+    s3_access_key: str = ""
+    s3_secret_key: str = ""
+    s3_presign_expiry: int = 3600  # seconds presigned upload/download URLs stay valid
+
+    # Google Drive sync queue (app/drive_sync.py)
+    drive_sync_enabled: bool = True
+    drive_sync_chunk_size: int = 8388608  # 8MB per resumable request; must be a multiple of 256KB
+    drive_sync_max_attempts: int = 8
+    drive_sync_retry_base_seconds: int = 30  # doubles per failed attempt, capped at an hour
+    drive_sync_poll_seconds: int = 60  # also woken immediately when photos are queued
 
     # Email (for future use)
     smtp_host: str = "smtp.gmail.com"
@@ -40,6 +72,14 @@ class Settings(BaseSettings):
 
     # AI Integration
     gemini_api_key: str = ""
+    recommendation_cache_ttl: int = 604800        # 7 days — served fresh
+    recommendation_cache_stale_ttl: int = 2592000  # 30 days — served stale while refreshing
+    llm_max_workers: int = 4               # dedicated threads for blocking Gemini calls
+    llm_max_concurrency: int = 4
+    llm_timeout_seconds: float = 30.0
+    llm_stream_timeout_seconds: float = 180.0  # whole streamed itinerary
+    llm_breaker_failure_threshold: int = 5
+    llm_breaker_reset_seconds: float = 60.0
 
     # Google OAuth
     google_client_id: str = ""
@@ -50,6 +90,27 @@ class Settings(BaseSettings):
 
     # Maps Integration
     google_maps_api_key: str = ""
+    map_deadline_seconds: float = 8.0  # overall budget for geocoding + routing per request
+    nominatim_min_interval: float = 1.0  # seconds between Nominatim requests (usage policy)
+    geocode_retry_interval: int = 600  # min seconds between map views re-queuing a trip's unresolved stops
+    gazetteer_db_path: str = "db/gazetteer.sqlite3"  # built from app/data/gazetteer.tsv.gz
+    osrm_url: str = ""  # self-hosted OSRM, tried first when set
+    osrm_public_url: str = "https://router.project-osrm.org"
+    osrm_public_enabled: bool = True  # public demo server; disable in production load
+    routing_timeout_seconds: float = 15.0
+    routing_estimate_speed_kmh: float = 50.0  # offline estimate when no OSRM answers
+    routing_estimate_detour_factor: float = 1.3  # road distance / straight-line distance
+    tile_proxy_enabled: bool = False  # serve map tiles through /tiles with an on-disk cache
+    tile_upstream_url: str = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+    tile_cache_dir: str = "cache/tiles"
+    tile_cache_max_bytes: int = 512 * 1024 * 1024
+    tile_cache_fresh_seconds: int = 604800  # 7 days before revalidating upstream
+    tile_user_agent: str = "GojoTripPlanner/2.0 (contact@gojotrips.com)"
+    cache_warmer_enabled: bool = True  # pre-fill map caches for upcoming / recently edited trips
+    cache_warmer_interval_seconds: int = 900
+    cache_warmer_days_ahead: int = 14
+    cache_warmer_recent_hours: int = 24
+    cache_warmer_concurrency: int = 2
 
     # Web Push Notifications (VAPID)
     # Generate with: python -c "from py_vapid import Vapid; v=Vapid(); v.generate_keys(); print(v.private_key); print(v.public_key)"
@@ -66,11 +66,43 @@ async def init_db():
                     "ALTER TABLE photo ADD COLUMN caption TEXT;",
                     "ALTER TABLE expense ADD COLUMN category TEXT DEFAULT 'Other';",
                     "ALTER TABLE itineraryitem ADD COLUMN category TEXT DEFAULT 'Activity';",
+                    "ALTER TABLE itineraryitem ADD COLUMN latitude FLOAT;",
+                    "ALTER TABLE itineraryitem ADD COLUMN longitude FLOAT;",
+                    "ALTER TABLE itineraryitem ADD COLUMN geocoded_location TEXT;",
+                    "ALTER TABLE trip ADD COLUMN created_at TIMESTAMP;",
+                    "ALTER TABLE trip ADD COLUMN updated_at TIMESTAMP;",
+                    "ALTER TABLE photo ADD COLUMN sha256 TEXT;",
+                    "ALTER TABLE document ADD COLUMN sha256 TEXT;",
+                    "ALTER TABLE photo ADD COLUMN thumbnail_widths TEXT;",
+                    "CREATE INDEX IF NOT EXISTS ix_photo_sha256 ON photo (sha256);",
+                    "CREATE INDEX IF NOT EXISTS ix_photo_trip_uploaded ON photo (trip_id, uploaded_at, id);",
+                    'ALTER TABLE "user" ADD COLUMN drive_access_token TEXT;',
+                    'ALTER TABLE "user" ADD COLUMN drive_parent_folder_id TEXT;',
+                    "ALTER TABLE photo ADD COLUMN taken_at TIMESTAMP;",
+                    "ALTER TABLE photo ADD COLUMN width INTEGER;",
+                    "ALTER TABLE photo ADD COLUMN height INTEGER;",
+                    "ALTER TABLE photo ADD COLUMN orientation INTEGER;",
+                    "ALTER TABLE photo ADD COLUMN latitude FLOAT;",
+                    "ALTER TABLE photo ADD COLUMN longitude FLOAT;",
+                    "CREATE INDEX IF NOT EXISTS ix_photo_trip_taken ON photo (trip_id, taken_at, id);",
+                    "ALTER TABLE photo ADD COLUMN phash TEXT;",
+                    "ALTER TABLE trip ADD COLUMN keep_originals BOOLEAN DEFAULT FALSE;",
+                    "ALTER TABLE photo ADD COLUMN original_filename TEXT;",
+                    "ALTER TABLE trip ADD COLUMN storage_bytes BIGINT DEFAULT 0;",
+                    'ALTER TABLE "user" ADD COLUMN storage_bytes BIGINT DEFAULT 0;',
+                    "ALTER TABLE photo ADD COLUMN size_bytes INTEGER;",
+                    "ALTER TABLE document ADD COLUMN size_bytes INTEGER;",
+                    'ALTER TABLE "user" ADD COLUMN drive_refresh_token TEXT;',
+                    'ALTER TABLE "user" ADD COLUMN drive_token_expires_at TIMESTAMP;',
                 ]
 
                 for statement in migration_statements:
+                    # Each statement in its own savepoint: on PostgreSQL a failed
+                    # statement aborts the whole transaction, so an "already exists"
+                    # would otherwise make every later migration fail too.
                     try:
-                        await conn.execute(text(statement))
+                        async with conn.begin_nested():
+                            await conn.execute(text(statement))
                     except Exception as e:
                         err_str = str(e).lower()
                         # Skip "column already exists" from both SQLite and PostgreSQL
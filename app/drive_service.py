@@ -1,35 +1,80 @@
+from collections import OrderedDict
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, MediaFileUpload
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+import asyncio
+import httplib2
 import logging
 import os
+import threading
 from pathlib import Path
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+PARENT_FOLDER_NAME = 'Gojo Trips'
+_SERVICE_CACHE_SIZE = 64  # access tokens live an hour; this covers the active users
+
+# access token -> Drive service, most recently used last
+_services: "OrderedDict[str, object]" = OrderedDict()
+_services_lock = threading.Lock()
+
+
 def get_drive_service(access_token: str):
-    """Initialize Google Drive service with access token."""
+    """
+    Google Drive service for an access token. Built once per token from the
+    discovery document bundled with the client library (no fetch, parsed
+    once) and reused; each request gets its own HTTP connection, so one
+    service can be shared by threads.
+    """
+    with _services_lock:
+        service = _services.get(access_token)
+        if service is not None:
+            _services.move_to_end(access_token)
+            return service
+
     creds = Credentials(token=access_token)
-    return build('drive', 'v3', credentials=creds)
+
+    def build_request(http, *args, **kwargs):
+        # httplib2.Http isn't thread-safe
+        return HttpRequest(AuthorizedHttp(creds, http=httplib2.Http()), *args, **kwargs)
+
+    service = build(
+        'drive', 'v3', credentials=creds, requestBuilder=build_request,
+        static_discovery=True, cache_discovery=False,
+    )
+    with _services_lock:
+        _services[access_token] = service
+        while len(_services) > _SERVICE_CACHE_SIZE:
+            _services.popitem(last=False)
+    return service
+
+
+async def _execute(request):
+    """Run a blocking Drive API request in a thread."""
+    return await asyncio.get_running_loop().run_in_executor(None, request.execute)
+
 
 async def find_or_create_parent_folder(service) -> str:
     """Find or create the 'Gojo Trips' parent folder."""
-    query = "name = 'Gojo Trips' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-    results = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
+    query = f"name = '{PARENT_FOLDER_NAME}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
+    results = await _execute(service.files().list(q=query, spaces='drive', fields='files(id, name)'))
     files = results.get('files', [])
-    
+
     if files:
         return files[0]['id']
-    
+
     # Create folder
     file_metadata = {
-        'name': 'Gojo Trips',
+        'name': PARENT_FOLDER_NAME,
         'mimeType': 'application/vnd.google-apps.folder'
     }
-    folder = service.files().create(body=file_metadata, fields='id').execute()
+    folder = await _execute(service.files().create(body=file_metadata, fields='id'))
     return folder.get('id')
 
+
 async def create_trip_folder(service, trip_name: str, parent_id: str) -> str:
     """Create a folder for a specific trip under the parent folder."""
     file_metadata = {
@@ -37,26 +82,67 @@ async def create_trip_folder(service, trip_name: str, parent_id: str) -> str:
         'mimeType': 'application/vnd.google-apps.folder',
         'parents': [parent_id]
     }
-    folder = service.files().create(body=file_metadata, fields='id').execute()
+    folder = await _execute(service.files().create(body=file_metadata, fields='id'))
     return folder.get('id')
 
-async def upload_file_to_drive(service, file_path: Path, folder_id: str, media_type: str = 'image'):
-    """Upload a file to a specific Drive folder."""
-    if not file_path.exists():
-        logger.error(f"File not found for Drive upload: {file_path}")
-        return None
-    
-    file_metadata = {
-        'name': file_path.name,
-        'parents': [folder_id]
-    }
-    
-    mimetype = 'image/jpeg' if media_type == 'image' else 'video/mp4'
-    media = MediaFileUpload(str(file_path), mimetype=mimetype, resumable=True)
-    
-    try:
-        file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-        return file.get('id')
-    except Exception as e:
-        logger.error(f"Error uploading to Drive: {e}")
-        return None
+
+async def create_trip_folder_for_user(access_token: str, user, trip_name: str) -> Optional[str]:
+    """
+    Create a trip's Drive folder. The user's 'Gojo Trips' folder id is kept
+    on `user.drive_parent_folder_id` (caller commits), so after the first
+    trip this is a single API call. If that folder was deleted, it is looked
+    up or created again.
+    """
+    service = await asyncio.get_running_loop().run_in_executor(None, get_drive_service, access_token)
+    if user.drive_parent_folder_id:
+        try:
+            return await create_trip_folder(service, trip_name, user.drive_parent_folder_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            logger.info(f"Drive parent folder for user {user.id} is gone; finding it again")
+    user.drive_parent_folder_id = await find_or_create_parent_folder(service)
+    return await create_trip_folder(service, trip_name, user.drive_parent_folder_id)
+
+
+class DriveUpload:
+    """
+    One resumable upload. `next_chunk` is blocking (run it in a thread) and
+    returns the Drive file id once the last chunk is accepted, else None.
+    `resumable_uri` and `progress` can be saved and passed back to
+    `GoogleDriveClient.upload` to continue after a crash or restart.
+    """
+
+    def __init__(self, request):
+        self._request = request
+
+    @property
+    def resumable_uri(self) -> Optional[str]:
+        return self._request.resumable_uri
+
+    @property
+    def progress(self) -> int:
+        return self._request.resumable_progress
+
+    def next_chunk(self) -> Optional[str]:
+        _, response = self._request.next_chunk(num_retries=2)
+        return response.get("id") if response else None
+
+
+class GoogleDriveClient:
+    """The Drive calls the sync worker needs; tests substitute a fake with the same methods."""
+
+    def __init__(self, access_token: str):
+        self.service = get_drive_service(access_token)
+
+    def upload(self, file_path: Path, folder_id: str, mimetype: str, chunk_size: int,
+               resumable_uri: Optional[str] = None, progress: int = 0) -> DriveUpload:
+        media = MediaFileUpload(str(file_path), mimetype=mimetype, chunksize=chunk_size, resumable=True)
+        request = self.service.files().create(
+            body={"name": file_path.name, "parents": [folder_id]}, media_body=media, fields="id"
+        )
+        if resumable_uri:
+            # Continue an existing session from the last byte Drive acknowledged.
+            request.resumable_uri = resumable_uri
+            request.resumable_progress = progress
+        return DriveUpload(request)
@@ -0,0 +1,306 @@
+"""
+Background upload of gallery photos to Google Drive.
+
+Uploads used to run inline in the request with the blocking Drive client, so
+each one stalled the event loop for the whole transfer. Now a request only
+queues a `DriveSyncJob` row per photo; `DriveSyncWorker` picks due jobs and
+uploads them in `drive_sync_chunk_size` resumable chunks, each chunk in a
+thread. After every chunk the session URI and byte offset are saved, so a
+retry (or a restart) continues where the transfer stopped.
+
+Failures are retried with exponential backoff up to `drive_sync_max_attempts`.
+
+Google access tokens last about an hour, so the worker keeps the user's
+refresh token (from the offline-access sign-in; both are stored encrypted,
+see `auth_utils.encrypt_secret`) and swaps it for a new access token when the
+current one is about to expire or is rejected. Only when there is no refresh
+token, or Google revokes it, are the user's jobs set to `needs_auth`
+(`next_attempt_at` = None) instead of burning attempts; signing in with
+Google again stores fresh tokens and resumes them (`resume_user`).
+
+The worker talks to Drive through `client_factory(access_token)`, which
+returns a `GoogleDriveClient` by default, and refreshes tokens through
+`token_refresher(refresh_token)`; tests pass fakes for both.
+"""
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import asyncio
+import logging
+import mimetypes
+import random
+
+from sqlalchemy import and_, func, or_, update
+from sqlmodel import select
+
+from app.config import settings
+from app.database import _session_factory
+from app.models import DriveSyncJob, Photo, User
+
+logger = logging.getLogger(__name__)
+
+_MAX_BACKOFF = 3600.0
+_TOKEN_MARGIN = timedelta(minutes=2)  # refresh this long before the access token expires
+GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+
+
+class DriveAuthError(Exception):
+    """Google rejected the refresh token; the user has to sign in again."""
+
+
+def _default_client(access_token: str):
+    from app.drive_service import GoogleDriveClient
+    return GoogleDriveClient(access_token)
+
+
+async def _refresh_google_token(refresh_token: str) -> Tuple[str, int]:
+    """Exchange a refresh token for (access token, lifetime in seconds)."""
+    import httpx
+
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        resp = await client.post(GOOGLE_TOKEN_URL, data={
+            "client_id": settings.google_client_id,
+            "client_secret": settings.google_client_secret,
+            "refresh_token": refresh_token,
+            "grant_type": "refresh_token",
+        })
+    if resp.status_code in (400, 401):
+        # invalid_grant: revoked, expired or issued to another client
+        raise DriveAuthError(resp.text[:200])
+    resp.raise_for_status()
+    data = resp.json()
+    return data["access_token"], int(data.get("expires_in", 3600))
+
+
+def _http_status(error: Exception) -> Optional[int]:
+    resp = getattr(error, "resp", None)
+    status = getattr(resp, "status", None)
+    return int(status) if status is not None else None
+
+
+class DriveSyncWorker:
+    def __init__(
+        self,
+        client_factory: Callable = _default_client,
+        token_refresher: Callable = _refresh_google_token,
+        chunk_size: int = settings.drive_sync_chunk_size,
+        max_attempts: int = settings.drive_sync_max_attempts,
+        retry_base: float = settings.drive_sync_retry_base_seconds,
+        poll_interval: float = settings.drive_sync_poll_seconds,
+    ):
+        self.client_factory = client_factory
+        self.token_refresher = token_refresher
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.uploaded = self.retried = self.failed = self.refreshed = 0
+
+    def start(self):
+        if self._task is None:
+            # Created here so it belongs to the running event loop.
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _loop(self):
+        # A job left "uploading" by a crash or restart is simply due again.
+        async with _session_factory() as session:
+            await session.execute(
+                update(DriveSyncJob).where(DriveSyncJob.status == "uploading").values(status="pending")
+            )
+            await session.commit()
+        while True:
+            try:
+                while await self.run_once():
+                    pass
+            except Exception as e:
+                logger.error(f"Drive sync run failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def enqueue(self, session, user: User, folder_id: str, photo_ids: Iterable[int]):
+        """Queue photos for upload (caller commits, then calls `wake`). Uploads use the user's stored tokens."""
+        for photo_id in photo_ids:
+            session.add(DriveSyncJob(photo_id=photo_id, user_id=user.id, folder_id=folder_id))
+
+    async def resume_user(self, session, user_id: int):
+        """The user signed in again: make their jobs waiting on it due now (caller commits, then `wake`)."""
+        await session.execute(
+            update(DriveSyncJob)
+            .where(DriveSyncJob.user_id == user_id, or_(
+                DriveSyncJob.status == "needs_auth",
+                # paused before needs_auth existed
+                and_(DriveSyncJob.status == "pending", DriveSyncJob.next_attempt_at.is_(None)),
+            ))
+            .values(status="pending", next_attempt_at=datetime.utcnow())
+        )
+
+    async def _access_token(self, session, user: User) -> Optional[str]:
+        """
+        A usable access token for the user, refreshed (and saved) if it is
+        about to expire. None when there's nothing to refresh with. Raises
+        DriveAuthError if Google revoked the refresh token.
+        """
+        from app.auth_utils import decrypt_secret, encrypt_secret
+
+        token = decrypt_secret(user.drive_access_token)
+        expires_at = user.drive_token_expires_at
+        if token and (expires_at is None or expires_at - _TOKEN_MARGIN > datetime.utcnow()):
+            return token
+        refresh_token = decrypt_secret(user.drive_refresh_token)
+        if not refresh_token:
+            return None
+        token, expires_in = await self.token_refresher(refresh_token)
+        user.drive_access_token = encrypt_secret(token)
+        user.drive_token_expires_at = datetime.utcnow() + timedelta(seconds=expires_in)
+        session.add(user)
+        await session.commit()
+        self.refreshed += 1
+        return token
+
+    async def run_once(self) -> bool:
+        """Upload the next due job; returns False when nothing is due."""
+        async with _session_factory() as session:
+            result = await session.execute(
+                select(DriveSyncJob)
+                .where(DriveSyncJob.status == "pending", DriveSyncJob.next_attempt_at <= datetime.utcnow())
+                .order_by(DriveSyncJob.next_attempt_at, DriveSyncJob.id)
+                .limit(1)
+            )
+            job = result.scalar_one_or_none()
+            if job is None:
+                return False
+            # Claim it; a second worker process would see status != pending.
+            claimed = await session.execute(
+                update(DriveSyncJob)
+                .where(DriveSyncJob.id == job.id, DriveSyncJob.status == "pending")
+                .values(status="uploading", updated_at=datetime.utcnow())
+            )
+            await session.commit()
+            if claimed.rowcount != 1:
+                return True
+            await session.refresh(job)
+            await self._process(session, job)
+        return True
+
+    async def _process(self, session, job: DriveSyncJob):
+        from app.blob_store import local_copy
+
+        photo = await session.get(Photo, job.photo_id)
+        user = await session.get(User, job.user_id)
+        if photo is None:
+            await session.delete(job)
+            await session.commit()
+            return
+        try:
+            token = await self._access_token(session, user) if user else None
+        except DriveAuthError as e:
+            logger.info(f"Google refused to refresh user {user.id}'s token: {e}")
+            user.drive_refresh_token = None
+            session.add(user)
+            token = None
+        except Exception as e:
+            self._record_failure(job, e, user)
+            await session.commit()
+            return
+        if not token:
+            self._needs_auth(job)
+            await session.commit()
+            return
+
+        mimetype = mimetypes.guess_type(photo.filename)[0] or "application/octet-stream"
+        loop = asyncio.get_running_loop()
+        try:
+            async with local_copy(photo.filename) as file_path:
+                upload = await loop.run_in_executor(
+                    None, lambda: self.client_factory(token).upload(
+                        file_path, job.folder_id, mimetype, self.chunk_size, job.resumable_uri, job.bytes_sent
+                    )
+                )
+                file_id = None
+                while file_id is None:
+                    file_id = await loop.run_in_executor(None, upload.next_chunk)
+                    job.resumable_uri = upload.resumable_uri
+                    job.bytes_sent = upload.progress or job.bytes_sent
+                    job.updated_at = datetime.utcnow()
+                    session.add(job)
+                    await session.commit()
+        except Exception as e:
+            self._record_failure(job, e, user)
+            await session.commit()
+            return
+
+        job.status = "done"
+        job.drive_file_id = file_id
+        job.last_error = None
+        job.updated_at = datetime.utcnow()
+        session.add(job)
+        await session.commit()
+        self.uploaded += 1
+        logger.info(f"Uploaded photo {photo.id} to Drive ({file_id})")
+
+    def _needs_auth(self, job: DriveSyncJob):
+        job.status = "needs_auth"
+        job.next_attempt_at = None
+        job.last_error = "Sign in with Google again to resume Drive uploads"
+        job.updated_at = datetime.utcnow()
+
+    def _record_failure(self, job: DriveSyncJob, error: Exception, user: Optional[User] = None):
+        status = _http_status(error)
+        if status in (401, 403):
+            if user is None or not user.drive_refresh_token:
+                self._needs_auth(job)
+                return
+            # Treat the access token as expired so the retry refreshes it; counted
+            # as an attempt, so a token Drive keeps refusing still ends the job.
+            user.drive_token_expires_at = datetime.utcnow()
+        elif status in (404, 410):
+            # The upload session expired; start a fresh one next time.
+            job.resumable_uri = None
+            job.bytes_sent = 0
+
+        job.attempts += 1
+        job.last_error = str(error)[:500]
+        job.updated_at = datetime.utcnow()
+        if job.attempts >= self.max_attempts:
+            job.status = "failed"
+            self.failed += 1
+            logger.warning(f"Drive upload of photo {job.photo_id} failed for good: {error}")
+            return
+        delay = min(self.retry_base * 2 ** (job.attempts - 1), _MAX_BACKOFF)
+        job.status = "pending"
+        job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+        self.retried += 1
+        logger.info(f"Drive upload of photo {job.photo_id} failed ({error}); retry in {delay:.0f}s")
+
+    async def status_counts(self) -> Dict[str, int]:
+        async with _session_factory() as session:
+            result = await session.execute(
+                select(DriveSyncJob.status, func.count()).group_by(DriveSyncJob.status)
+            )
+            return dict(result.all())
+
+    def stats(self) -> Dict:
+        return {
+            "uploaded": self.uploaded, "retried": self.retried, "failed": self.failed, "refreshed": self.refreshed,
+        }
+
+
+drive_sync = DriveSyncWorker()
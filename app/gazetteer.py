@@ -0,0 +1,246 @@
+"""
+Offline gazetteer for resolving destinations without a network call.
+
+The bundled GeoNames extract (app/data/gazetteer.tsv.gz) is loaded once into
+a local SQLite file with:
+  - `place_name`: every normalized name and alternate name, indexed, for exact
+    lookups and prefix range scans (autocomplete);
+  - `place_trigram`: trigrams of every name in `place_name` (so a typo of
+    an alternate like "Bangalore" still finds Bengaluru), indexed, for
+    typo-tolerant fallback matching.
+The SQLite file is rebuilt automatically whenever the bundled extract changes.
+CITY_COORDS entries are loaded as high-priority aliases so regions like
+"Kerala" or "Coorg" keep resolving the way they always have.
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import gzip
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+Coords = Tuple[float, float]
+
+GAZETTEER_SOURCE = Path(__file__).parent / "data" / "gazetteer.tsv.gz"
+SCHEMA_VERSION = "2"
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_place_name(name: str) -> str:
+    """Lowercase, strip accents and punctuation: "São Paulo!" -> "sao paulo"."""
+    folded = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode()
+    return _NON_ALNUM.sub(" ", folded.lower()).strip()
+
+
+def _trigrams(norm: str) -> set:
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """Indexed place-name lookup backed by a local SQLite file."""
+
+    def __init__(self, source: Path = GAZETTEER_SOURCE, db_path: str = settings.gazetteer_db_path):
+        self.source = Path(source)
+        self.db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._conn is not None
+
+    def _fingerprint(self) -> str:
+        stat = self.source.stat()
+        return f"{SCHEMA_VERSION}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    def ensure_built(self):
+        """Open the index, (re)building it first if the bundled extract changed. Blocking."""
+        with self._lock:
+            if self._conn is not None:
+                return
+            if not self.source.exists():
+                logger.warning(f"Gazetteer source missing: {self.source}")
+                return
+            fingerprint = self._fingerprint()
+            if self._stored_fingerprint() != fingerprint:
+                self._build(fingerprint)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+
+    def _stored_fingerprint(self) -> Optional[str]:
+        if not self.db_path.exists():
+            return None
+        try:
+            with sqlite3.connect(str(self.db_path)) as conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+                return row[0] if row else None
+        except sqlite3.Error:
+            return None
+
+    def _build(self, fingerprint: str):
+        from app.geocoding import CITY_COORDS
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.db_path.with_suffix(".tmp")
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+        conn = sqlite3.connect(str(tmp_path))
+        conn.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE place (
+                id INTEGER PRIMARY KEY, name TEXT, country TEXT, admin1 TEXT,
+                lat REAL, lon REAL, population INTEGER, priority INTEGER DEFAULT 0
+            );
+            CREATE TABLE place_name (id INTEGER PRIMARY KEY, norm TEXT, place_id INTEGER, is_primary INTEGER);
+            CREATE TABLE place_trigram (trigram TEXT, name_id INTEGER);
+        """)
+
+        places, names = [], []
+        with gzip.open(self.source, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("#") or not line.strip():
+                    continue
+                geonameid, name, country, admin1, lat, lon, population, alternates = line.rstrip("\n").split("\t")
+                place_id = int(geonameid)
+                places.append((place_id, name, country, admin1, float(lat), float(lon), int(population), 0))
+                norm = normalize_place_name(name)
+                names.append((norm, place_id, 1))
+                seen = {norm}
+                for alt in filter(None, alternates.split(",")):
+                    alt_norm = normalize_place_name(alt)
+                    if alt_norm and alt_norm not in seen:
+                        seen.add(alt_norm)
+                        names.append((alt_norm, place_id, 0))
+
+        # Legacy hand-picked coordinates win: they override the most populous
+        # GeoNames place known by that name, or become their own place (e.g. states).
+        by_name = {}
+        for norm, place_id, _ in names:
+            by_name.setdefault(norm, []).append(place_id)
+        position = {place[0]: idx for idx, place in enumerate(places)}
+        primary_index = {
+            norm: max((position[pid] for pid in ids), key=lambda idx: places[idx][6])
+            for norm, ids in by_name.items()
+        }
+        for i, (city, (lat, lon)) in enumerate(CITY_COORDS.items(), start=1):
+            norm = normalize_place_name(city)
+            if norm in primary_index:
+                place = places[primary_index[norm]]
+                places[primary_index[norm]] = place[:4] + (lat, lon, place[6], 1)
+            else:
+                places.append((-i, city.title(), "IN", "", lat, lon, 0, 1))
+                names.append((norm, -i, 1))
+
+        conn.executemany("INSERT INTO place VALUES (?, ?, ?, ?, ?, ?, ?, ?)", places)
+        conn.executemany(
+            "INSERT INTO place_name VALUES (?, ?, ?, ?)",
+            ((name_id, *name) for name_id, name in enumerate(names, start=1)),
+        )
+        conn.executemany(
+            "INSERT INTO place_trigram VALUES (?, ?)",
+            ((t, name_id) for name_id, (norm, _, _) in enumerate(names, start=1) for t in _trigrams(norm)),
+        )
+        conn.executescript("""
+            CREATE INDEX ix_place_name_norm ON place_name (norm);
+            CREATE INDEX ix_place_trigram ON place_trigram (trigram);
+            ANALYZE;
+        """)
+        conn.execute("INSERT INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+        conn.commit()
+        conn.close()
+        os.replace(tmp_path, self.db_path)
+        logger.info(f"Gazetteer built: {len(places)} places, {len(names)} names")
+
+    def _best_exact(self, norm: str) -> Optional[Coords]:
+        row = self._conn.execute(
+            """
+            SELECT p.lat, p.lon FROM place_name n JOIN place p ON p.id = n.place_id
+            WHERE n.norm = ?
+            ORDER BY p.priority DESC, n.is_primary DESC, p.population DESC
+            LIMIT 1
+            """,
+            (norm,),
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def lookup(self, query: str, partial: bool = True) -> Optional[Coords]:
+        """
+        Resolve a destination locally: the whole query first, then (if
+        `partial`) each comma-separated part ("Manali, Himachal Pradesh" ->
+        "manali"). Returns None when not ready or nothing matches exactly.
+        """
+        if self._conn is None or not query:
+            return None
+        candidates = [query]
+        if partial and "," in query:
+            candidates += query.split(",")
+        for candidate in candidates:
+            norm = normalize_place_name(candidate)
+            if norm:
+                coords = self._best_exact(norm)
+                if coords:
+                    return coords
+        return None
+
+    def search(self, prefix: str, limit: int = 8) -> List[Dict]:
+        """Autocomplete: indexed prefix scan, then trigram similarity for typos."""
+        if self._conn is None:
+            return []
+        norm = normalize_place_name(prefix)
+        if not norm:
+            return []
+
+        # `norm >= ? AND norm < ?` is a range scan on ix_place_name_norm.
+        rows = self._conn.execute(
+            """
+            SELECT p.id, p.name, p.country, p.admin1, p.lat, p.lon
+            FROM place_name n JOIN place p ON p.id = n.place_id
+            WHERE n.norm >= ? AND n.norm < ?
+            GROUP BY p.id
+            ORDER BY p.priority DESC, MAX(n.is_primary) DESC, p.population DESC
+            LIMIT ?
+            """,
+            (norm, norm + "\x7f", limit),
+        ).fetchall()
+
+        if not rows and len(norm) >= 3:
+            grams = list(_trigrams(norm))
+            placeholders = ",".join("?" * len(grams))
+            # Scored per name, then each place ranked by its best-matching name.
+            fuzzy = self._conn.execute(
+                f"""
+                SELECT p.id, p.name, p.country, p.admin1, p.lat, p.lon
+                FROM (
+                    SELECT name_id, COUNT(*) AS score FROM place_trigram
+                    WHERE trigram IN ({placeholders})
+                    GROUP BY name_id
+                    HAVING COUNT(*) * 2 >= ?
+                ) m
+                JOIN place_name n ON n.id = m.name_id
+                JOIN place p ON p.id = n.place_id
+                GROUP BY p.id
+                ORDER BY MAX(m.score) DESC, p.population DESC
+                LIMIT ?
+                """,
+                (*grams, len(grams), limit),
+            ).fetchall()
+            rows = fuzzy
+
+        return [
+            {"name": r[1], "country": r[2], "admin1": r[3], "lat": r[4], "lon": r[5]}
+            for r in rows
+        ]
+
+
+gazetteer = Gazetteer()
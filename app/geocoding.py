@@ -0,0 +1,365 @@
+"""
+Geocoding helpers for trip destinations and start locations.
+
+Lookups go memo -> offline gazetteer -> Nominatim -> CITY_COORDS substring
+match. Results are memoized in-process so repeat map views never hit
+Nominatim for a place they've already resolved. `get_cached_coordinates`
+answers from the memo, the gazetteer and CITY_COORDS without any network
+I/O, which is what the map page uses to render immediately.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+import time
+
+import httpx
+
+from app.config import settings
+from app.database import _session_factory
+from app.gazetteer import gazetteer
+from app.models import Document, GeoPlace, ItineraryItem, Trip
+from app.spatial import haversine_km, replace_places
+from sqlmodel import select
+
+logger = logging.getLogger(__name__)
+
+Coords = Tuple[float, float]
+
+CITY_COORDS = {
+    "goa": (15.2993, 74.1240),
+    "delhi": (28.6139, 77.2090),
+    "mumbai": (19.0760, 72.8777),
+    "jaipur": (26.9124, 75.7873),
+    "bangalore": (12.9716, 77.5946),
+    "bengaluru": (12.9716, 77.5946),
+    "kerala": (10.8505, 76.2711),
+    "chennai": (13.0827, 80.2707),
+    "kolkata": (22.5726, 88.3639),
+    "hyderabad": (17.3850, 78.4867),
+    "agra": (27.1767, 78.0081),
+    "varanasi": (25.3176, 82.9739),
+    "manali": (32.2396, 77.1887),
+    "shimla": (31.1048, 77.1734),
+    "ooty": (11.4102, 76.6950),
+    "mysore": (12.2958, 76.6394),
+    "pondicherry": (11.9416, 79.8083),
+    "coorg": (12.3375, 75.8069),
+}
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_HEADERS = {'User-Agent': 'GojoTripPlanner/2.0 (contact@gojotrips.com)'}
+
+# query (normalized) -> coords; places don't move, so no expiry.
+_geocode_cache: Dict[str, Coords] = {}
+_GEOCODE_CACHE_MAX = 10000
+
+# query (normalized) -> when Nominatim answered "no results"; retried after a day.
+_geocode_misses: Dict[str, float] = {}
+_MISS_TTL = 86400
+
+
+def _cache_key(query: str) -> str:
+    return " ".join((query or "").lower().split())
+
+
+def _city_fallback(query: str) -> Optional[Coords]:
+    query_lower = _cache_key(query)
+    for city, coords in CITY_COORDS.items():
+        if city in query_lower:
+            return coords
+    return None
+
+
+def get_cached_coordinates(query: str) -> Optional[Coords]:
+    """Resolve a place without touching the network (memo, gazetteer, CITY_COORDS)."""
+    if not query:
+        return None
+    return (
+        _geocode_cache.get(_cache_key(query))
+        or gazetteer.lookup(query)
+        or _city_fallback(query)
+    )
+
+
+def _remember(query: str, coords: Coords):
+    if len(_geocode_cache) >= _GEOCODE_CACHE_MAX:
+        _geocode_cache.pop(next(iter(_geocode_cache)))
+    _geocode_cache[_cache_key(query)] = coords
+
+
+class _RateLimiter:
+    """Spaces calls process-wide to at most one per `interval` seconds."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock: Optional[asyncio.Lock] = None
+        self._next_at = 0.0
+
+    async def wait(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            now = asyncio.get_event_loop().time()
+            if self._next_at > now:
+                await asyncio.sleep(self._next_at - now)
+                now = self._next_at
+            self._next_at = now + self.interval
+
+
+_nominatim_limiter = _RateLimiter(settings.nominatim_min_interval)
+
+# Set when Nominatim answers 429; no requests are sent until then.
+_nominatim_backoff_until = 0.0
+_DEFAULT_BACKOFF = 60.0
+
+
+def nominatim_backoff_remaining() -> float:
+    """Seconds until Nominatim may be called again after a 429 (0 if not rate-limited)."""
+    return max(0.0, _nominatim_backoff_until - time.time())
+
+
+def _start_backoff(retry_after: Optional[str]):
+    global _nominatim_backoff_until
+    try:
+        delay = float(retry_after) if retry_after else _DEFAULT_BACKOFF
+    except ValueError:
+        delay = _DEFAULT_BACKOFF
+    _nominatim_backoff_until = time.time() + delay
+    logger.warning(f"Nominatim rate-limited us; backing off for {delay:.0f}s")
+
+
+async def get_coordinates_async(query: str, precise: bool = False) -> Optional[Coords]:
+    """
+    Get coordinates using OpenStreetMap Nominatim API (async).
+
+    With `precise=True` (used for itinerary stops like "Baga Beach, Goa") the
+    coarse offline fallbacks that would answer with the containing city are
+    skipped, so an unresolved stop stays unresolved instead of misplaced.
+    """
+    if not query:
+        return None
+    key = _cache_key(query)
+    if key in _geocode_cache:
+        return _geocode_cache[key]
+
+    coords = gazetteer.lookup(query, partial=not precise)
+    if coords:
+        return coords
+
+    missed_at = _geocode_misses.get(key)
+    if missed_at and time.time() - missed_at < _MISS_TTL:
+        return None if precise else _city_fallback(query)
+
+    if nominatim_backoff_remaining() > 0:
+        return None if precise else _city_fallback(query)
+
+    try:
+        await _nominatim_limiter.wait()
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            params = {"q": query, "format": "json", "limit": 1}
+            response = await client.get(NOMINATIM_URL, params=params, headers=NOMINATIM_HEADERS)
+            if response.status_code == 429:
+                _start_backoff(response.headers.get("retry-after"))
+                return None if precise else _city_fallback(query)
+            data = response.json()
+            if data:
+                coords = (float(data[0]['lat']), float(data[0]['lon']))
+                _remember(query, coords)
+                return coords
+            if len(_geocode_misses) >= _GEOCODE_CACHE_MAX:
+                _geocode_misses.pop(next(iter(_geocode_misses)))
+            _geocode_misses[key] = time.time()
+    except Exception as e:
+        logger.error(f"Geocoding error for {query}: {e}")
+
+    return None if precise else _city_fallback(query)
+
+
+async def geocode_many(queries: Sequence[Optional[str]], timeout: float) -> List[Optional[Coords]]:
+    """
+    Geocode several independent places concurrently within one deadline.
+
+    Places that don't resolve before `timeout` fall back to whatever is
+    cached offline (or None), so the caller always gets an answer in time.
+    """
+    tasks = [asyncio.create_task(get_coordinates_async(q)) if q else None for q in queries]
+    pending = [t for t in tasks if t is not None]
+    if pending:
+        await asyncio.wait(pending, timeout=timeout)
+
+    results: List[Optional[Coords]] = []
+    for query, task in zip(queries, tasks):
+        if task is None:
+            results.append(None)
+        elif task.done() and not task.cancelled() and task.exception() is None:
+            results.append(task.result())
+        else:
+            task.cancel()
+            results.append(get_cached_coordinates(query))
+    return results
+
+
+# trip_id -> True while a batch runs; set back to a rerun flag if edits arrive mid-batch
+_batch_running: Dict[int, bool] = {}
+# trip_id -> monotonic time a map view last queued a batch for the trip
+_retry_queued_at: Dict[int, float] = {}
+
+
+def claim_geocode_retry(trip_id: int) -> bool:
+    """
+    Whether a read path (map markers, nearby search) should queue a batch for
+    a trip with unresolved stops now. Stops that can't be resolved stay
+    pending, so without this every map view would queue another batch.
+    Edits schedule their batch directly and are not throttled.
+    """
+    now = time.monotonic()
+    last = _retry_queued_at.get(trip_id)
+    if last is not None and now - last < settings.geocode_retry_interval:
+        return False
+    if len(_retry_queued_at) > 10000:
+        cutoff = now - settings.geocode_retry_interval
+        for stale in [t for t, at in _retry_queued_at.items() if at < cutoff]:
+            del _retry_queued_at[stale]
+    _retry_queued_at[trip_id] = now
+    return True
+
+
+async def geocode_trip_itinerary(trip_id: int):
+    """
+    Background job: geocode every itinerary stop of a trip whose `location`
+    changed since it was last geocoded, plus new document locations, and
+    refresh the trip's entries in the spatial index.
+
+    Stops are resolved in the context of the trip destination, identical
+    locations are looked up once, and network lookups go through the shared
+    Nominatim rate limiter. If the trip is edited while a batch is running,
+    the batch runs once more afterwards instead of overlapping.
+    """
+    if trip_id in _batch_running:
+        _batch_running[trip_id] = True
+        return
+    _batch_running[trip_id] = False
+    try:
+        while True:
+            await _geocode_pending_items(trip_id)
+            if not _batch_running[trip_id]:
+                break
+            _batch_running[trip_id] = False
+    except Exception as e:
+        logger.error(f"Itinerary geocoding failed for trip {trip_id}: {e}")
+    finally:
+        _batch_running.pop(trip_id, None)
+
+
+# A stop resolved without the destination in the query must be this close to
+# it, or a generic name ("Airport", "Old Town") lands in another country.
+STOP_MAX_DISTANCE_KM = 100
+
+
+def _near(coords: Optional[Coords], anchor: Optional[Coords]) -> Optional[Coords]:
+    """`coords` if within range of `anchor`; with no anchor to check against, taken as is."""
+    if coords is None or anchor is None:
+        return coords
+    return coords if haversine_km(*anchor, [coords[0]], [coords[1]])[0] <= STOP_MAX_DISTANCE_KM else None
+
+
+async def _resolve_stop(location: str, destination: str, anchor: Optional[Coords]) -> Optional[Coords]:
+    """
+    Coordinates of a stop in the trip's destination (`anchor` being the
+    destination's own): an offline hit near the destination, else the
+    destination-qualified query, else the bare name if it lands nearby.
+    """
+    if destination and destination.lower() in location.lower():
+        return await get_coordinates_async(location, precise=True)
+    return (
+        _near(gazetteer.lookup(location, partial=False), anchor)
+        or await get_coordinates_async(f"{location}, {destination}", precise=True)
+        or _near(await get_coordinates_async(location, precise=True), anchor)
+    )
+
+
+async def _geocode_pending_items(trip_id: int):
+    # Three steps so no DB connection is held while Nominatim is rate-limited:
+    # read what needs resolving, resolve it without a session, write it back.
+    async with _session_factory() as session:
+        trip = await session.get(Trip, trip_id)
+        if not trip:
+            return
+        destination = trip.destination or ""
+        item_rows = (await session.execute(
+            select(ItineraryItem.location, ItineraryItem.geocoded_location).where(ItineraryItem.trip_id == trip_id)
+        )).all()
+        doc_rows = (await session.execute(
+            select(Document.id, Document.to_location, Document.from_location).where(Document.trip_id == trip_id)
+        )).all()
+        indexed_rows = (await session.execute(
+            select(GeoPlace.source_id, GeoPlace.location)
+            .where(GeoPlace.trip_id == trip_id, GeoPlace.source == "document")
+        )).all()
+
+    indexed_locations = dict(indexed_rows)
+    locations = []
+    for location, geocoded_location in item_rows:
+        if location and location.strip() and location != geocoded_location:
+            locations.append(location.strip())
+    for doc_id, to_location, from_location in doc_rows:
+        location = (to_location or from_location or "").strip()
+        if location and indexed_locations.get(doc_id) != location:
+            locations.append(location)
+
+    resolved: Dict[str, Optional[Coords]] = {}
+    if locations:
+        anchor = await get_coordinates_async(destination) if destination else None
+        for location in dict.fromkeys(locations):
+            resolved[location] = await _resolve_stop(location, destination, anchor)
+
+    async with _session_factory() as session:
+        items = (await session.execute(
+            select(ItineraryItem).where(ItineraryItem.trip_id == trip_id)
+        )).scalars().all()
+        for item in items:
+            location = (item.location or "").strip()
+            if not location:
+                if item.latitude is not None:
+                    item.latitude = item.longitude = item.geocoded_location = None
+                    session.add(item)
+            elif item.location != item.geocoded_location and location in resolved:
+                coords = resolved[location]
+                if coords:
+                    item.latitude, item.longitude = coords
+                    item.geocoded_location = item.location
+                else:
+                    # Clear geocoded_location so a later batch retries it, even if
+                    # the stop is edited back to the text it last resolved from.
+                    item.latitude = item.longitude = item.geocoded_location = None
+                session.add(item)
+            # Locations edited since the read are picked up by the rerun the edit scheduled.
+
+        # Documents have no coordinate columns; their existing index entry
+        # records which location text it was geocoded from.
+        docs = (await session.execute(select(Document).where(Document.trip_id == trip_id))).scalars().all()
+        indexed_result = await session.execute(
+            select(GeoPlace).where(GeoPlace.trip_id == trip_id, GeoPlace.source == "document")
+        )
+        indexed = {p.source_id: p for p in indexed_result.scalars().all()}
+        document_places = []
+        for doc in docs:
+            location = (doc.to_location or doc.from_location or "").strip()
+            if not location:
+                continue
+            previous = indexed.get(doc.id)
+            if previous and previous.location == location:
+                coords = (previous.latitude, previous.longitude)
+            else:
+                coords = resolved.get(location)
+            if coords:
+                document_places.append((doc.id, doc.title, location, *coords))
+
+        await replace_places(session, trip_id, "itinerary", [
+            (item.id, item.activity, item.location, item.latitude, item.longitude)
+            for item in items if item.latitude is not None
+        ])
+        await replace_places(session, trip_id, "document", document_places)
+        await session.commit()
+    if resolved:
+        logger.info(f"Geocoded {sum(1 for c in resolved.values() if c)}/{len(resolved)} new locations for trip {trip_id}")
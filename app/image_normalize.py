@@ -0,0 +1,117 @@
+"""
+Upload-time normalization of photos (optional; `image_normalize_enabled`).
+
+Phone photos arrive as 5-12MB JPEGs with a rotation flag, a maker-note and
+an embedded preview. `normalize_image` runs in the media process pool and
+writes a copy that is:
+
+  - rotated upright (EXIF orientation applied, so the flag is dropped),
+  - at most `image_max_dimension` pixels on the long side,
+  - re-encoded as JPEG or WebP at `image_quality`,
+  - stripped of all metadata except capture time, camera make/model, GPS
+    and the colour profile (which the timeline, map and colours rely on).
+    CMYK and greyscale sources are converted to RGB through their embedded
+    profile and tagged sRGB; a profile that can't be applied is dropped
+    rather than attached to pixels it doesn't describe.
+
+The copy is what gets stored and served. If it would change nothing (the
+image is already upright and small enough and re-encoding doesn't shrink
+it) the upload is kept as is. The untouched upload is stored as well only
+when the trip's organizer turns on `Trip.keep_originals`.
+"""
+from pathlib import Path
+from typing import Optional, Tuple
+import hashlib
+import io
+import os
+import uuid
+
+NORMALIZE_EXT = {".jpg", ".jpeg", ".webp"}  # PNG/GIF are often screenshots or animations; left alone
+OUTPUT_EXT = {"jpeg": ".jpg", "webp": ".webp"}
+
+_KEEP_TAGS = (0x010F, 0x0110, 0x0132)  # Make, Model, DateTime
+_KEEP_EXIF_TAGS = (0x9003, 0x9004, 0x9010, 0x9011, 0x9012)  # DateTimeOriginal/Digitized, OffsetTime*
+_EXIF_IFD = 0x8769
+_GPS_IFD = 0x8825
+
+
+def _slim_exif(exif):
+    from PIL import Image
+
+    slim = Image.Exif()
+    for tag in _KEEP_TAGS:
+        if tag in exif:
+            slim[tag] = exif[tag]
+    sub = exif.get_ifd(_EXIF_IFD)
+    kept = {tag: sub[tag] for tag in _KEEP_EXIF_TAGS if tag in sub}
+    if kept:
+        slim.get_ifd(_EXIF_IFD).update(kept)
+    gps = exif.get_ifd(_GPS_IFD)
+    if gps:
+        slim.get_ifd(_GPS_IFD).update(gps)
+    return slim
+
+
+def _to_rgb(image, icc_profile: Optional[bytes]):
+    """Convert to RGB through the image's own profile if possible; returns (image, profile to embed)."""
+    from PIL import ImageCms
+
+    if not icc_profile:
+        return image.convert("RGB"), None
+    try:
+        source = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
+        if source.profile.xcolor_space.strip() == "RGB":
+            # Palette or alpha modes: the pixels stay in the profile's colour space.
+            return image.convert("RGB"), icc_profile
+        srgb = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB"))
+        return ImageCms.profileToProfile(image, source, srgb, outputMode="RGB"), srgb.tobytes()
+    except (ImageCms.PyCMSError, OSError, ValueError):
+        return image.convert("RGB"), None
+
+
+def normalize_image(
+    src: str, dest_dir: str, max_dimension: int, quality: int, fmt: str = "jpeg"
+) -> Optional[Tuple[str, str, int, str]]:
+    """
+    Write the normalized copy of `src` into `dest_dir`. Returns (path, sha256,
+    size, ext), or None when the upload should be kept as is. Runs in a
+    worker process.
+    """
+    from PIL import Image, ImageOps
+
+    src_size = os.path.getsize(src)
+    with Image.open(src) as original:
+        if original.format not in ("JPEG", "WEBP") or getattr(original, "is_animated", False):
+            return None
+        exif = original.getexif()
+        rotated = exif.get(0x0112, 1) not in (None, 1)
+        resized = max(original.size) > max_dimension
+        icc_profile = original.info.get("icc_profile")
+        # JPEG draft decodes at the smallest DCT scale still covering the target size.
+        original.draft("RGB", (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(original)
+        if image.mode != "RGB":
+            image, icc_profile = _to_rgb(image, icc_profile)
+        if max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        ext = OUTPUT_EXT[fmt]
+        dest = Path(dest_dir) / f"{uuid.uuid4()}{ext}"
+        options = {"quality": quality, "exif": _slim_exif(exif).tobytes()}
+        if icc_profile:
+            options["icc_profile"] = icc_profile
+        if fmt == "webp":
+            image.save(dest, "WEBP", method=4, **options)
+        else:
+            image.save(dest, "JPEG", optimize=True, progressive=True, **options)
+
+    size = dest.stat().st_size
+    if not rotated and not resized and size >= src_size:
+        dest.unlink()
+        return None
+
+    digest = hashlib.sha256()
+    with open(dest, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return str(dest), digest.hexdigest(), size, ext
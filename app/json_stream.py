@@ -0,0 +1,76 @@
+"""
+Incremental parser for a streamed top-level JSON array.
+
+Gemini streams its reply as arbitrary text chunks. For a reply shaped like
+`[{...}, {...}]` we want each element as soon as its closing brace arrives,
+not after the whole array has been generated. Anything before the opening
+`[` (e.g. a markdown code fence) is ignored.
+"""
+import json
+import logging
+from typing import Any, List
+
+logger = logging.getLogger(__name__)
+
+
+class JSONArrayStreamParser:
+    """Feed text chunks in; get back each array element once it is complete."""
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0            # next unscanned index into _buffer
+        self._started = False    # seen the outer '['
+        self._finished = False   # seen the outer ']'
+        self._depth = 0          # nesting depth inside the current element
+        self._in_string = False
+        self._escape = False
+        self._element_start = -1
+
+    def feed(self, chunk: str) -> List[Any]:
+        if self._finished or not chunk:
+            return []
+        self._buffer += chunk
+        elements = []
+
+        buf = self._buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if not self._started:
+                if ch == "[":
+                    self._started = True
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._element_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # Closing bracket of the outer array.
+                    self._finished = True
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = buf[self._element_start:i + 1]
+                    try:
+                        elements.append(json.loads(raw))
+                    except ValueError as e:
+                        logger.warning(f"Skipping malformed streamed element: {e}")
+                    self._element_start = -1
+            i += 1
+
+        # Drop everything already consumed so memory stays bounded by one element.
+        keep_from = self._element_start if self._element_start >= 0 else i
+        self._buffer = buf[keep_from:]
+        self._pos = i - keep_from
+        if self._element_start >= 0:
+            self._element_start = 0
+        return elements
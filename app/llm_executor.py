@@ -0,0 +1,245 @@
+"""
+Dedicated, bounded executor for blocking Gemini calls.
+
+The google-generativeai client is synchronous, so calls have to run in a
+thread. They get their own small pool (instead of the event loop's default
+executor) so a slow upstream can't starve file I/O or anything else that
+uses `run_in_executor(None, ...)`. Every call is bounded by a concurrency
+limit and a deadline, and a circuit breaker fails fast while Gemini is
+degraded so callers can fall back to cached or empty results immediately.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterable, Optional
+import asyncio
+import logging
+import threading
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the breaker is open."""
+
+
+class CircuitBreaker:
+    """Classic closed → open → half-open breaker counting consecutive failures."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.total_failures = 0
+        self.total_rejections = 0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may go through now (half-open admits a single probe)."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.total_rejections += 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.total_failures += 1
+        if self._probe_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"LLM circuit breaker opened after {self.failures} consecutive failures")
+            self.opened_at = self.clock()
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """Forget a half-open probe that ended without an outcome (e.g. cancelled)."""
+        self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "total_failures": self.total_failures,
+            "total_rejections": self.total_rejections,
+        }
+
+
+class LLMExecutor:
+    """Runs blocking LLM calls on a private thread pool with limits and a breaker."""
+
+    def __init__(
+        self,
+        max_workers: int = settings.llm_max_workers,
+        max_concurrency: int = settings.llm_max_concurrency,
+        timeout: float = settings.llm_timeout_seconds,
+        stream_timeout: float = settings.llm_stream_timeout_seconds,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.stream_timeout = stream_timeout
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=settings.llm_breaker_failure_threshold,
+            reset_timeout=settings.llm_breaker_reset_seconds,
+        )
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.timeouts = 0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running loop, not import time.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _acquire(self, loop, deadline: float) -> bool:
+        """
+        Admit a call through the breaker and wait for a free slot until
+        `deadline`. Returns whether the call is the half-open probe, which is
+        the only call allowed to release the probe without an outcome.
+        """
+        probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM upstream is degraded; failing fast")
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled while queued (e.g. the SSE client went away): no outcome to record.
+            if probe:
+                self.breaker.release_probe()
+            raise
+        return probe
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """
+        Call `fn(*args)` in the LLM pool.
+
+        Raises CircuitOpenError when failing fast, asyncio.TimeoutError when the
+        deadline (which includes waiting for a free slot) passes, or whatever
+        `fn` raised. Callers decide what to fall back to.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        probe = await self._acquire(loop, deadline)
+
+        self.in_flight += 1
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(self._pool, fn, *args),
+                timeout=max(deadline - loop.time(), 0),
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+            if probe:
+                self.breaker.release_probe()
+
+        self.breaker.record_success()
+        return result
+
+    async def stream(self, fn: Callable[..., Iterable], *args, timeout: Optional[float] = None) -> AsyncIterator:
+        """
+        Iterate the blocking generator `fn(*args)` in the LLM pool, yielding
+        each item on the event loop as soon as the worker thread produces it.
+
+        Same limits and breaker as `run`; `timeout` bounds the whole stream.
+        If the consumer stops early, the worker stops at its next item.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + (timeout or self.stream_timeout)
+        probe = await self._acquire(loop, deadline)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        stopped = threading.Event()
+
+        def pump():
+            def put(item, error=None):
+                if not stopped.is_set():
+                    loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            try:
+                for item in fn(*args):
+                    if stopped.is_set():
+                        return
+                    put(item)
+                put(done)
+            except Exception as e:
+                put(done, e)
+
+        self.in_flight += 1
+        loop.run_in_executor(self._pool, pump)
+        try:
+            while True:
+                item, error = await asyncio.wait_for(queue.get(), timeout=max(deadline - loop.time(), 0))
+                if item is done:
+                    if error is not None:
+                        raise error
+                    break
+                yield item
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            stopped.set()
+            self.in_flight -= 1
+            self.semaphore.release()
+            if probe:
+                self.breaker.release_probe()
+
+    def metrics(self) -> dict:
+        return {
+            "circuit": self.breaker.snapshot(),
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "max_workers": self.max_workers,
+            "timeouts": self.timeouts,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+llm_executor = LLMExecutor()
@@ -25,8 +25,40 @@ async def lifespan(app: FastAPI):
         logger.critical(f"FATAL: Database initialization failed at startup: {e}")
         raise
 
+    # Build/open the offline gazetteer off the event loop; geocoding simply
+    # skips it until it's ready.
+    import asyncio
+    from app.gazetteer import gazetteer
+    asyncio.get_event_loop().run_in_executor(None, gazetteer.ensure_built)
+
+    from app.cache_warmer import cache_warmer
+    if settings.cache_warmer_enabled:
+        cache_warmer.start()
+
+    from app.drive_sync import drive_sync
+    if settings.drive_sync_enabled:
+        drive_sync.start()
+
+    from app.photo_metadata import metadata_backfill
+    if settings.metadata_backfill_enabled:
+        metadata_backfill.start()
+
+    from app.storage_quota import storage_reconciler
+    if settings.storage_reconcile_interval:
+        storage_reconciler.start()
+
     yield
-    # Shutdown cleanup (if needed in future)
+
+    await cache_warmer.stop()
+    await drive_sync.stop()
+    await metadata_backfill.stop()
+    await storage_reconciler.stop()
+
+    from app.llm_executor import llm_executor
+    llm_executor.shutdown()
+
+    from app.media_pool import shutdown_media_pool
+    shutdown_media_pool()
 
 
 app = FastAPI(title="Gojo Trip Planner", lifespan=lifespan)
@@ -34,6 +66,10 @@ app = FastAPI(title="Gojo Trip Planner", lifespan=lifespan)
 # Add Session Middleware for OAuth2
 app.add_middleware(SessionMiddleware, secret_key=settings.secret_key)
 
+# Refuse oversized uploads before the multipart body is parsed
+from app.uploads import UploadLimitMiddleware
+app.add_middleware(UploadLimitMiddleware)
+
 # Mount static files
 static_path = Path(__file__).parent / "static"
 static_path.mkdir(parents=True, exist_ok=True)
@@ -44,10 +80,10 @@ templates_path = Path(__file__).parent / "templates"
 templates_path.mkdir(parents=True, exist_ok=True)
 templates = Jinja2Templates(directory=templates_path)
 
-# Mount uploads directory
+# Uploads are served by gallery.get_photo (caching headers, Range, optional
+# X-Accel-Redirect); a StaticFiles mount here would shadow that route.
 uploads_path = Path(__file__).parent.parent / "uploads"
 uploads_path.mkdir(parents=True, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=uploads_path), name="uploads")
 
 from app.routers import auth, dashboard, maps, gallery, chat, export as export_router, documents, push
 
@@ -67,6 +103,25 @@ async def health_check():
     return {"status": "ok", "service": "gojo-trip-planner"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics for upstream dependencies and background jobs."""
+    from app.llm_executor import llm_executor
+    from app.tile_cache import tile_cache
+    from app.cache_warmer import cache_warmer
+    from app.drive_sync import drive_sync
+    from app.photo_metadata import metadata_backfill
+    from app.storage_quota import storage_reconciler
+    return {
+        "llm": llm_executor.metrics(),
+        "tiles": tile_cache.stats(),
+        "cache_warmer": cache_warmer.stats(),
+        "drive_sync": {**drive_sync.stats(), "jobs": await drive_sync.status_counts()},
+        "exif_backfill": metadata_backfill.stats(),
+        "storage": storage_reconciler.stats(),
+    }
+
+
 @app.get("/")
 async def index(request: Request):
     from fastapi.responses import RedirectResponse
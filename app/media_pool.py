@@ -0,0 +1,52 @@
+"""
+Process pool for CPU-bound media work (thumbnails, image decoding).
+
+Image decoding and resizing hold the GIL, so they run in worker processes
+rather than threads to keep the event loop and request threads responsive.
+Workers are spawned (not forked) so they don't inherit the event loop, DB
+connections or thread locks. The pool is created on first use; if a worker
+dies (e.g. out of memory on a huge image) the pool is replaced.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+import asyncio
+import logging
+import multiprocessing
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_media_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """The shared pool; `max_workers` (default `media_workers`) only applies when it is created."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=max_workers or settings.media_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+async def run_in_media_pool(fn, *args):
+    """Run a picklable top-level function in the media pool."""
+    global _pool
+    pool = get_media_pool()
+    try:
+        return await asyncio.get_event_loop().run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        logger.error("Media worker pool broke; starting a new one")
+        if _pool is pool:
+            _pool = None
+        raise
+
+
+def shutdown_media_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
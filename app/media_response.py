@@ -0,0 +1,164 @@
+"""
+HTTP responses for uploaded media: caching, conditional GET and byte ranges.
+
+Upload filenames are content hashes (or, for older uploads, random UUIDs)
+and are never rewritten, so a file's size and mtime identify its bytes. That lets us hand out a strong
+ETag, mark responses `immutable`, answer `If-None-Match` /
+`If-Modified-Since` with 304, and serve `Range` requests as 206 (what video
+seeking needs). Multi-range requests get the whole file, which RFC 9110
+allows.
+
+With `media_offload` set to "x-accel" (nginx) or "x-sendfile" (Apache,
+Caddy, lighttpd), the conditional checks still happen here, but the body is
+left to the fronting proxy via `X-Accel-Redirect` (mapped under
+`media_accel_prefix`) / `X-Sendfile`. The proxy then also handles ranges.
+"""
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import quote
+import mimetypes
+import os
+
+import aiofiles
+from fastapi import Request
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+from app.config import settings
+
+UPLOADS_ROOT = Path(__file__).parent.parent / "uploads"
+IMMUTABLE = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 256 * 1024
+
+
+def _etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: W/"x" matches "x".
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Return an inclusive (start, end) for a single `bytes=` range, or None to serve it all.
+
+    Raises ValueError for a syntactically valid but unsatisfiable range.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        if not last.isdigit() or int(last) == 0:
+            raise ValueError(header)
+        return max(0, size - int(last)), size - 1
+    if not first.isdigit() or (last and not last.isdigit()):
+        return None
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _if_range_matches(request: Request, etag: str, mtime: float) -> bool:
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    try:
+        return int(mtime) == int(parsedate_to_datetime(if_range).timestamp())
+    except (TypeError, ValueError):
+        return False
+
+
+async def _file_range(path: Path, start: int, end: int):
+    remaining = end - start + 1
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _offload_headers(path: Path) -> dict:
+    if settings.media_offload == "x-accel":
+        relative = path.resolve().relative_to(UPLOADS_ROOT.resolve())
+        return {"X-Accel-Redirect": f"{settings.media_accel_prefix.rstrip('/')}/{relative.as_posix()}"}
+    if settings.media_offload == "x-sendfile":
+        return {"X-Sendfile": str(path.resolve())}
+    return {}
+
+
+def media_response(
+    request: Request,
+    path: Path,
+    media_type: Optional[str] = None,
+    cache_control: str = IMMUTABLE,
+    filename: Optional[str] = None,
+) -> Response:
+    """Serve `path` with validators, 304s and single-range 206s. Caller checks access and existence."""
+    stat = path.stat()
+    size = stat.st_size
+    etag = _etag(stat)
+    media_type = media_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if filename:
+        quoted = quote(filename)
+        headers["Content-Disposition"] = (
+            f"attachment; filename*=utf-8''{quoted}" if quoted != filename else f'attachment; filename="{filename}"'
+        )
+
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    offload = _offload_headers(path)
+    if offload:
+        # Empty body; the proxy replaces it with the file (and handles Range itself).
+        return Response(status_code=200, headers={**headers, **offload}, media_type=media_type)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and _if_range_matches(request, etag, stat.st_mtime):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    head_only = request.method == "HEAD"
+    if byte_range is None:
+        if head_only:
+            return Response(status_code=200, headers={**headers, "Content-Length": str(size)}, media_type=media_type)
+        return FileResponse(path, headers=headers, media_type=media_type, stat_result=stat)
+
+    start, end = byte_range
+    headers.update({
+        "Content-Range": f"bytes {start}-{end}/{size}",
+        "Content-Length": str(end - start + 1),
+    })
+    if head_only:
+        return Response(status_code=206, headers=headers, media_type=media_type)
+    return StreamingResponse(_file_range(path, start, end), status_code=206, headers=headers, media_type=media_type)
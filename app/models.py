@@ -1,5 +1,6 @@
 from typing import Optional, List
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import BigInteger, Index
 from datetime import date, datetime
 
 class TripUserLink(SQLModel, table=True):
@@ -13,6 +14,13 @@ class User(SQLModel, table=True):
     password_hash: Optional[str] = None
     full_name: Optional[str] = None
     drive_connected: bool = Field(default=False)
+    # Google tokens for the background Drive sync, encrypted (auth_utils.encrypt_secret)
+    drive_access_token: Optional[str] = None
+    drive_refresh_token: Optional[str] = None
+    drive_token_expires_at: Optional[datetime] = None
+    # Drive id of the user's "Gojo Trips" folder, so new trips don't search for it
+    drive_parent_folder_id: Optional[str] = None
+    storage_bytes: int = Field(default=0, sa_type=BigInteger)  # uploads by this user (app/storage_quota.py)
 
     trips: List["Trip"] = Relationship(back_populates="users", link_model=TripUserLink)
     expenses: List["Expense"] = Relationship(back_populates="user")
@@ -32,6 +40,11 @@ class Trip(SQLModel, table=True):
     join_code: str = Field(index=True, unique=True)
     drive_folder_id: Optional[str] = None
     notes: Optional[str] = None
+    # Store photos exactly as uploaded alongside the normalized copy (app/image_normalize.py)
+    keep_originals: bool = Field(default=False)
+    storage_bytes: int = Field(default=0, sa_type=BigInteger)  # photos, videos and documents (app/storage_quota.py)
+    created_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
 
     users: List[User] = Relationship(back_populates="trips", link_model=TripUserLink)
     expenses: List["Expense"] = Relationship(back_populates="trip")
@@ -60,6 +73,25 @@ class Photo(SQLModel, table=True):
     media_type: str = Field(default="image")  # "image" or "video"
     caption: Optional[str] = None
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
+    sha256: Optional[str] = Field(default=None, index=True)  # content hash; also names the blob
+    thumbnail_widths: Optional[str] = None  # "320,640,1280"; "" = none possible, None = not yet made
+    original_filename: Optional[str] = None  # upload as received, when normalized and the trip keeps originals
+    size_bytes: Optional[int] = None  # stored bytes, original included; None = from before accounting
+    # From EXIF (app/photo_metadata.py)
+    taken_at: Optional[datetime] = None  # camera's local wall-clock time
+    width: Optional[int] = None  # as displayed, i.e. after applying orientation
+    height: Optional[int] = None
+    orientation: Optional[int] = None  # EXIF 1-8; 0 = nothing readable, None = not yet extracted
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    phash: Optional[str] = None  # 64-bit dHash as hex (app/near_duplicates.py)
+
+    # Gallery pages are keyset-paginated newest first within a trip; the
+    # timeline walks capture times the same way.
+    __table_args__ = (
+        Index("ix_photo_trip_uploaded", "trip_id", "uploaded_at", "id"),
+        Index("ix_photo_trip_taken", "trip_id", "taken_at", "id"),
+    )
 
     trip: "Trip" = Relationship(back_populates="photos")
     user: User = Relationship(back_populates="photos")
@@ -83,6 +115,11 @@ class ItineraryItem(SQLModel, table=True):
     location: Optional[str] = None
     description: Optional[str] = None
     category: str = Field(default="Activity")  # Activity, Food, Hotel, Transport, Sightseeing
+    # Filled in by the background batch geocoder; geocoded_location records
+    # which `location` text the coordinates belong to so edits get re-geocoded.
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    geocoded_location: Optional[str] = None
 
     trip: Trip = Relationship(back_populates="itinerary")
 
@@ -103,6 +140,8 @@ class Document(SQLModel, table=True):
     to_location: Optional[str] = None
     notes: Optional[str] = None
     file_path: Optional[str] = None   # Uploaded attachment filename
+    sha256: Optional[str] = None      # hex digest of the attachment
+    size_bytes: Optional[int] = None  # attachment bytes; None = from before accounting
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     trip: Trip = Relationship(back_populates="documents")
@@ -118,3 +157,49 @@ class PushSubscription(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     user: User = Relationship(back_populates="push_subscriptions")
+
+class RecommendationCacheEntry(SQLModel, table=True):
+    """Shared Gemini recommendations, keyed by normalized destination."""
+    destination_key: str = Field(primary_key=True)
+    destination: str
+    payload: str                      # JSON-encoded recommendations
+    fetched_at: datetime = Field(default_factory=datetime.utcnow)
+
+class GeoPlace(SQLModel, table=True):
+    """Spatial index entry for a geocoded itinerary stop or document location."""
+    __table_args__ = (Index("ix_geoplace_trip_geohash", "trip_id", "geohash"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    trip_id: int = Field(foreign_key="trip.id", index=True)
+    source: str                       # "itinerary" or "document"
+    source_id: int                    # ItineraryItem.id / Document.id
+    name: str
+    location: Optional[str] = None
+    latitude: float
+    longitude: float
+    geohash: str                      # full-precision geohash; queried by prefix range
+
+class Blob(SQLModel, table=True):
+    """A stored file in the content-addressed upload store (app/blob_store.py)."""
+    sha256: str = Field(primary_key=True)
+    size: int
+    ext: str                          # extension of the first upload, e.g. ".jpg"
+    refcount: int = Field(default=0)  # Photo + Document rows pointing at this blob
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class DriveSyncJob(SQLModel, table=True):
+    """One photo waiting for, or done with, upload to its trip's Drive folder (app/drive_sync.py)."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    photo_id: int = Field(foreign_key="photo.id", unique=True)
+    user_id: int = Field(foreign_key="user.id", index=True)  # whose Drive token uploads it
+    folder_id: str
+    status: str = Field(default="pending", index=True)  # pending, uploading, done, failed, needs_auth
+    attempts: int = Field(default=0)
+    # None while needs_auth: waiting for the user to sign in to Google again
+    next_attempt_at: Optional[datetime] = Field(default_factory=datetime.utcnow, index=True)
+    resumable_uri: Optional[str] = None  # Drive upload session, so retries continue where they stopped
+    bytes_sent: int = Field(default=0)
+    drive_file_id: Optional[str] = None
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
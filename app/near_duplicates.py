@@ -0,0 +1,73 @@
+"""
+Near-duplicate photos in a trip gallery.
+
+Every image gets a 64-bit difference hash (dHash) when its EXIF is read
+(app/photo_metadata.py), stored as 16 hex digits on `Photo.phash`. The image
+is shown upright, shrunk to 9x8 grey pixels, and each bit records whether a
+pixel is brighter than its right-hand neighbour. So re-encodes, resizes and
+small exposure changes land a few bits apart; different scenes land around
+32 apart.
+
+`find_groups` compares every pair of a trip's hashes with NumPy: XOR a block
+of rows against all hashes, count the set bits through a byte lookup table,
+and union photos within `max_distance` bits. That is one pass over an n x n
+distance matrix, computed a block at a time so memory stays bounded for
+large galleries.
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+HASH_SIZE = 8
+_BLOCK_ROWS = 512  # rows of the distance matrix computed at once (~8MB per 1000 photos)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(image) -> str:
+    """dHash of an upright PIL image, as 16 hex digits. Runs in a worker process."""
+    from PIL import Image
+
+    grey = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    pixels = np.asarray(grey, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return f"{int.from_bytes(np.packbits(bits).tobytes(), 'big'):016x}"
+
+
+def hamming_matrix(rows: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+    """Bit distances between each of `rows` and each of `hashes` (uint64 arrays)."""
+    xor = np.bitwise_xor(rows[:, None], hashes[None, :])
+    return _POPCOUNT[xor.view(np.uint8)].reshape(len(rows), len(hashes), 8).sum(axis=2, dtype=np.uint8)
+
+
+def find_groups(photo_ids: Sequence[int], phashes: Sequence[str], max_distance: int) -> List[List[int]]:
+    """
+    Groups (two or more photos) whose hashes chain together within
+    `max_distance` bits, in input order.
+    """
+    n = len(photo_ids)
+    if n < 2:
+        return []
+    hashes = np.array([int(h, 16) for h in phashes], dtype=np.uint64)
+
+    parent = list(range(n))
+
+    def root(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for start in range(0, n, _BLOCK_ROWS):
+        block = hamming_matrix(hashes[start:start + _BLOCK_ROWS], hashes)
+        # Upper triangle only: each pair once, never a photo with itself.
+        rows, cols = np.nonzero(block <= max_distance)
+        for i, j in zip((rows + start).tolist(), cols.tolist()):
+            if j > i:
+                a, b = root(i), root(j)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(root(i), []).append(photo_ids[i])
+    return [group for group in groups.values() if len(group) > 1]
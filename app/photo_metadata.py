@@ -0,0 +1,250 @@
+"""
+EXIF metadata for gallery photos.
+
+After upload each image's EXIF is read in the media process pool and stored
+on the Photo row: capture time, orientation, displayed dimensions and GPS
+position, plus a perceptual hash for near-duplicate grouping
+(app/near_duplicates.py; decoded at reduced scale, so it stays cheap). Capture
+time is indexed with the trip (`ix_photo_trip_taken`), so the gallery can
+list a trip day by day and plot photos on the map without reading files.
+
+`Photo.orientation` doubles as the processed marker, like
+`thumbnail_widths`: None means not yet extracted and 0 means the file
+couldn't be read (videos, GIFs, damaged files); images without EXIF get 1
+and their dimensions. Photos of the same content copy the first row's values.
+`MetadataBackfill` works through photos uploaded before extraction (or the
+hash) existed, a batch at a time, once after startup.
+"""
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set
+import asyncio
+import logging
+import math
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+METADATA_EXT = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff"}
+METADATA_FIELDS = ("taken_at", "width", "height", "orientation", "latitude", "longitude", "phash")
+
+_EXIF_IFD = 0x8769
+_GPS_IFD = 0x8825
+_ORIENTATION = 0x0112
+_DATETIME = 0x0132
+_DATETIME_ORIGINAL = 0x9003
+_DATETIME_DIGITIZED = 0x9004
+
+# photo ids queued or being processed
+_in_progress: Set[int] = set()
+
+
+def _parse_exif_time(value) -> Optional[datetime]:
+    """EXIF "YYYY:MM:DD HH:MM:SS"; cameras without a clock write zeros or blanks."""
+    if not isinstance(value, str):
+        return None
+    try:
+        taken_at = datetime.strptime(value.strip("\x00 ")[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    return taken_at if taken_at.year >= 1900 else None
+
+
+def _gps_coord(value, ref, limit: float) -> Optional[float]:
+    """Degrees/minutes/seconds rationals and an N/S/E/W ref to signed decimal degrees."""
+    try:
+        degrees, minutes, seconds = (float(part) for part in value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    coord = degrees + minutes / 60 + seconds / 3600
+    if not math.isfinite(coord) or coord > limit:
+        return None
+    if isinstance(ref, bytes):
+        ref = ref.decode("ascii", "ignore")
+    return -coord if str(ref or "").strip("\x00 ").upper() in ("S", "W") else coord
+
+
+def read_metadata(src: str) -> Dict:
+    """Capture time, orientation, displayed size, GPS and dHash of an image. Runs in a worker process."""
+    from PIL import Image, ImageOps
+
+    from app.near_duplicates import dhash
+
+    with Image.open(src) as image:
+        width, height = image.size
+        exif = image.getexif()
+        sub = exif.get_ifd(_EXIF_IFD)
+        gps = exif.get_ifd(_GPS_IFD)
+        # The hash needs pixels, but only a few: JPEGs decode at 1/8 scale.
+        image.draft("L", (64, 64))
+        phash = dhash(ImageOps.exif_transpose(image))
+
+    orientation = exif.get(_ORIENTATION)
+    if orientation not in range(1, 9):
+        orientation = 1
+    if orientation >= 5:
+        # 5-8 are rotated a quarter turn
+        width, height = height, width
+
+    latitude = _gps_coord(gps.get(2), gps.get(1), 90)
+    longitude = _gps_coord(gps.get(4), gps.get(3), 180)
+    if latitude is None or longitude is None or (latitude == 0 and longitude == 0):
+        # 0,0 is what some phones write without a fix
+        latitude = longitude = None
+
+    return {
+        "taken_at": _parse_exif_time(
+            sub.get(_DATETIME_ORIGINAL) or sub.get(_DATETIME_DIGITIZED) or exif.get(_DATETIME)
+        ),
+        "width": width,
+        "height": height,
+        "orientation": orientation,
+        "latitude": latitude,
+        "longitude": longitude,
+        "phash": phash,
+    }
+
+
+@asynccontextmanager
+async def _photo_source(photo):
+    """Local path of a photo's bytes: the blob store (a temp copy for remote storage) or the trip dir."""
+    from app.blob_store import blob_sha, local_copy
+    from app.storage import UPLOADS_ROOT
+
+    if blob_sha(photo.filename):
+        async with local_copy(photo.filename) as path:
+            yield path
+    else:
+        yield UPLOADS_ROOT / str(photo.trip_id) / photo.filename
+
+
+def needs_extraction(photo) -> bool:
+    """Not read yet, or read before dHashes were added."""
+    return photo.orientation is None or (photo.orientation > 0 and photo.phash is None)
+
+
+def _needs_extraction_clause(Photo):
+    from sqlalchemy import and_, or_
+    return or_(Photo.orientation.is_(None), and_(Photo.orientation > 0, Photo.phash.is_(None)))
+
+
+async def extract_metadata(photo_id: int):
+    """Background job: read one photo's EXIF and store it on the row."""
+    from sqlmodel import select
+
+    from app.database import _session_factory
+    from app.media_pool import run_in_media_pool
+    from app.models import Photo
+
+    if photo_id in _in_progress:
+        return
+    _in_progress.add(photo_id)
+    try:
+        # Read, extract with no session open, then write in a new session, so
+        # the shared SQLite connection isn't held while the media pool works.
+        async with _session_factory() as session:
+            photo = await session.get(Photo, photo_id)
+            if not photo or not needs_extraction(photo):
+                return
+
+            if photo.sha256:
+                done = await session.execute(
+                    select(Photo)
+                    .where(Photo.sha256 == photo.sha256, Photo.id != photo.id)
+                    .where(~_needs_extraction_clause(Photo))
+                    .limit(1)
+                )
+                same = done.scalars().first()
+                if same is not None:
+                    for field in METADATA_FIELDS:
+                        setattr(photo, field, getattr(same, field))
+                    session.add(photo)
+                    await session.commit()
+                    return
+
+        metadata = {"orientation": 0}
+        if photo.media_type == "image" and photo.filename.lower().endswith(tuple(METADATA_EXT)):
+            try:
+                async with _photo_source(photo) as src:
+                    metadata = await run_in_media_pool(read_metadata, str(src))
+            except Exception as e:
+                logger.warning(f"Reading EXIF of photo {photo_id} failed: {e}")
+
+        async with _session_factory() as session:
+            photo = await session.get(Photo, photo_id)
+            if photo and needs_extraction(photo):
+                for field, value in metadata.items():
+                    setattr(photo, field, value)
+                session.add(photo)
+                await session.commit()
+    finally:
+        _in_progress.discard(photo_id)
+
+
+async def extract_metadata_batch(photo_ids: Iterable[int]):
+    """Extract a batch of photos, keeping every media worker busy."""
+    semaphore = asyncio.Semaphore(max(1, settings.media_workers))
+
+    async def one(photo_id: int):
+        async with semaphore:
+            await extract_metadata(photo_id)
+
+    await asyncio.gather(*(one(photo_id) for photo_id in photo_ids))
+
+
+class MetadataBackfill:
+    """Extracts EXIF for photos uploaded before extraction existed, then exits."""
+
+    def __init__(self, batch_size: int = 100):
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self.processed = 0
+        self.finished = False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        from sqlmodel import select
+
+        from app.database import _session_factory
+        from app.models import Photo
+
+        last_id = 0
+        try:
+            while True:
+                async with _session_factory() as session:
+                    result = await session.execute(
+                        select(Photo.id)
+                        .where(_needs_extraction_clause(Photo), Photo.id > last_id)
+                        .order_by(Photo.id)
+                        .limit(self.batch_size)
+                    )
+                    photo_ids = result.scalars().all()
+                if not photo_ids:
+                    break
+                await extract_metadata_batch(photo_ids)
+                self.processed += len(photo_ids)
+                last_id = photo_ids[-1]
+            self.finished = True
+            if self.processed:
+                logger.info(f"EXIF backfill done: {self.processed} photos")
+        except Exception as e:
+            logger.error(f"EXIF backfill stopped: {e}")
+
+    def stats(self) -> Dict:
+        return {"processed": self.processed, "finished": self.finished}
+
+
+metadata_backfill = MetadataBackfill()
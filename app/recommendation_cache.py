@@ -0,0 +1,137 @@
+"""
+Shared, persistent cache for Gemini travel recommendations.
+
+Recommendations depend only on the destination, so they are stored once per
+normalized destination (e.g. "Goa", " goa ", "GOA!" all share one row) and
+reused across users and trips. Entries are served fresh for
+`recommendation_cache_ttl` seconds, then served stale while a background
+refresh runs, until `recommendation_cache_stale_ttl` when they must be
+reloaded. Concurrent misses for the same destination share one in-flight call.
+"""
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import json
+import logging
+import re
+
+from app.config import settings
+from app.database import _session_factory
+from app.models import RecommendationCacheEntry
+
+logger = logging.getLogger(__name__)
+
+EMPTY_RECOMMENDATIONS = {"hotels": [], "restaurants": [], "attractions": [], "travel_tips": []}
+
+_NON_WORD = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_destination(destination: str) -> str:
+    """Normalize a free-text destination into a cache key."""
+    key = _NON_WORD.sub(" ", (destination or "").lower())
+    return _SPACES.sub(" ", key).strip()
+
+
+def _is_empty(recommendations: dict) -> bool:
+    return not any(recommendations.get(k) for k in EMPTY_RECOMMENDATIONS)
+
+
+class RecommendationCache:
+    """Two-level (memory + database) cache with single-flight loading."""
+
+    def __init__(
+        self,
+        loader: Callable[[str], Awaitable[dict]],
+        ttl: int = settings.recommendation_cache_ttl,
+        stale_ttl: int = settings.recommendation_cache_stale_ttl,
+    ):
+        self.loader = loader
+        self.ttl = timedelta(seconds=ttl)
+        self.stale_ttl = timedelta(seconds=max(stale_ttl, ttl))
+        # key -> (fetched_at, recommendations)
+        self._memory: Dict[str, Tuple[datetime, dict]] = {}
+        # key -> in-flight load shared by all concurrent callers
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def get(self, destination: str) -> dict:
+        """Return recommendations, loading or refreshing them as needed."""
+        key = normalize_destination(destination)
+        if not key:
+            return dict(EMPTY_RECOMMENDATIONS)
+
+        cached = self._memory.get(key) or await self._read(key)
+        if cached:
+            fetched_at, recommendations = cached
+            age = datetime.utcnow() - fetched_at
+            if age < self.ttl:
+                return recommendations
+            if age < self.stale_ttl:
+                # Stale-while-revalidate: answer now, refresh in the background.
+                self._load(key, destination)
+                return recommendations
+
+        try:
+            return await asyncio.shield(self._load(key, destination))
+        except Exception as e:
+            logger.warning(f"Recommendation load failed for {destination!r}: {e!r}")
+            return cached[1] if cached else dict(EMPTY_RECOMMENDATIONS)
+
+    async def peek(self, destination: str) -> Optional[dict]:
+        """Return whatever is cached (fresh or stale) without calling Gemini."""
+        key = normalize_destination(destination)
+        if not key:
+            return None
+        cached = self._memory.get(key) or await self._read(key)
+        if not cached or datetime.utcnow() - cached[0] >= self.stale_ttl:
+            return None
+        return cached[1]
+
+    def _load(self, key: str, destination: str) -> asyncio.Task:
+        """Start (or join) the single in-flight load for `key`."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_store(key, destination))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return task
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Background recommendation refresh for {key!r} failed: {task.exception()}")
+
+    async def _fetch_and_store(self, key: str, destination: str) -> dict:
+        recommendations = await self.loader(destination)
+        if _is_empty(recommendations):
+            # Don't pin an upstream failure for a whole TTL.
+            raise RuntimeError("empty recommendations")
+
+        fetched_at = datetime.utcnow()
+        self._memory[key] = (fetched_at, recommendations)
+        try:
+            async with _session_factory() as session:
+                entry = await session.get(RecommendationCacheEntry, key)
+                if entry is None:
+                    entry = RecommendationCacheEntry(destination_key=key, destination=destination, payload="")
+                entry.destination = destination
+                entry.payload = json.dumps(recommendations)
+                entry.fetched_at = fetched_at
+                session.add(entry)
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"Could not persist recommendations for {key!r}: {e}")
+        return recommendations
+
+    async def _read(self, key: str) -> Optional[Tuple[datetime, dict]]:
+        try:
+            async with _session_factory() as session:
+                entry = await session.get(RecommendationCacheEntry, key)
+        except Exception as e:
+            logger.warning(f"Recommendation cache read failed for {key!r}: {e}")
+            return None
+        if entry is None:
+            return None
+        cached = (entry.fetched_at, json.loads(entry.payload))
+        self._memory[key] = cached
+        return cached
@@ -0,0 +1,217 @@
+"""
+Resumable uploads (tus-style) for large gallery videos.
+
+  POST  /trip/{id}/uploads/resumable        Upload-Length, Upload-Metadata -> 201 + Location
+  PATCH /trip/{id}/uploads/resumable/{uid}  Upload-Offset + raw bytes      -> 204 + Upload-Offset
+  HEAD  /trip/{id}/uploads/resumable/{uid}                                 -> Upload-Offset, Upload-Ranges
+  DELETE same URL                                                          -> 204
+
+Unlike strict tus, a PATCH may target any offset, not just the current end:
+the file is pre-sized and written sparsely, and the received byte ranges are
+tracked, so a client can send several chunks in parallel and fill gaps after
+a reconnect. `Upload-Offset` in responses is the contiguous prefix received;
+`Upload-Ranges` lists every received range ("0-1048575,2097152-3145727").
+
+State lives in `uploads/.resumable/` as `<uid>.part` plus a `<uid>.json`
+sidecar, so sessions survive restarts. Sessions untouched for
+`resumable_upload_ttl` seconds are swept. Updates to a sidecar are serialized
+per upload within this process.
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+
+import aiofiles
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = "1.0.0"
+_SWEEP_INTERVAL = 600
+
+Range = Tuple[int, int]  # [start, end)
+
+
+class UploadSessionError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def merge_ranges(ranges: List[Range]) -> List[Range]:
+    merged: List[Range] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def format_ranges(ranges: List[Range]) -> str:
+    return ",".join(f"{start}-{end - 1}" for start, end in ranges)
+
+
+class ResumableUploadStore:
+    def __init__(self, root: Path, ttl: int = settings.resumable_upload_ttl):
+        self.root = Path(root)
+        self.ttl = ttl
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last_sweep = 0.0
+
+    def _paths(self, upload_id: str) -> Tuple[Path, Path]:
+        if not upload_id.isalnum():
+            raise UploadSessionError("Unknown upload", 404)
+        return self.root / f"{upload_id}.part", self.root / f"{upload_id}.json"
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(upload_id, asyncio.Lock())
+
+    def _read_state(self, upload_id: str) -> dict:
+        _, meta_path = self._paths(upload_id)
+        try:
+            state = json.loads(meta_path.read_text())
+        except (FileNotFoundError, ValueError):
+            raise UploadSessionError("Unknown upload", 404)
+        if state["expires_at"] < time.time():
+            self._remove(upload_id)
+            raise UploadSessionError("Upload expired", 410)
+        return state
+
+    def _write_state(self, upload_id: str, state: dict):
+        _, meta_path = self._paths(upload_id)
+        state["expires_at"] = time.time() + self.ttl
+        tmp_path = meta_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(state))
+        os.replace(tmp_path, meta_path)
+
+    def _remove(self, upload_id: str):
+        for path in self._paths(upload_id):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        self._locks.pop(upload_id, None)
+
+    def create(self, trip_id: int, user_id: int, length: int, filename: str, ext: str,
+               caption: Optional[str] = None) -> dict:
+        self.maybe_sweep()
+        self.root.mkdir(parents=True, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        part_path, _ = self._paths(upload_id)
+        with open(part_path, "wb") as f:
+            f.truncate(length)  # sparse on filesystems that support it
+        state = {
+            "id": upload_id,
+            "trip_id": trip_id,
+            "user_id": user_id,
+            "length": length,
+            "filename": filename,
+            "ext": ext,
+            "caption": caption,
+            "ranges": [],
+            "created_at": time.time(),
+        }
+        self._write_state(upload_id, state)
+        return state
+
+    def status(self, upload_id: str) -> dict:
+        return self._read_state(upload_id)
+
+    async def write_chunk(self, upload_id: str, offset: int, stream) -> dict:
+        """Write request body bytes at `offset`; returns the updated state."""
+        state = self._read_state(upload_id)
+        length = state["length"]
+        if offset < 0 or offset > length:
+            raise UploadSessionError("Upload-Offset out of range", 409)
+
+        part_path, _ = self._paths(upload_id)
+        position = offset
+        try:
+            async with aiofiles.open(part_path, "r+b") as f:
+                await f.seek(offset)
+                async for chunk in stream:
+                    if position + len(chunk) > length:
+                        raise UploadSessionError("Chunk exceeds Upload-Length", 413)
+                    await f.write(chunk)
+                    position += len(chunk)
+        finally:
+            # Keep whatever arrived, even if the client dropped mid-chunk.
+            if position > offset:
+                async with self._lock(upload_id):
+                    state = self._read_state(upload_id)
+                    merged = merge_ranges([tuple(r) for r in state["ranges"]] + [(offset, position)])
+                    state["ranges"] = [list(r) for r in merged]
+                    self._write_state(upload_id, state)
+        return state
+
+    @staticmethod
+    def contiguous_offset(state: dict) -> int:
+        ranges = state["ranges"]
+        return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+    @staticmethod
+    def is_complete(state: dict) -> bool:
+        return state["ranges"] == [[0, state["length"]]]
+
+    async def finalize(self, upload_id: str, dest_dir: Path) -> Tuple[Path, str, str]:
+        """
+        Move a complete upload into `dest_dir`; returns (path, filename, sha256).
+        When parallel chunks finish together only the first caller finalizes;
+        the others get a 404 UploadSessionError.
+        """
+        async with self._lock(upload_id):
+            state = self._read_state(upload_id)
+            if not self.is_complete(state):
+                raise UploadSessionError("Upload incomplete", 409)
+            part_path, _ = self._paths(upload_id)
+            # Chunks may arrive out of order, so hash once the file is whole.
+            sha256 = await asyncio.get_event_loop().run_in_executor(None, _file_sha256, part_path)
+            dest_dir.mkdir(parents=True, exist_ok=True)
+            filename = f"{uuid.uuid4()}{state['ext']}"
+            final_path = dest_dir / filename
+            os.replace(part_path, final_path)
+            self._remove(upload_id)
+        return final_path, filename, sha256
+
+    def terminate(self, upload_id: str):
+        self._read_state(upload_id)
+        self._remove(upload_id)
+
+    def maybe_sweep(self):
+        if time.time() - self._last_sweep >= _SWEEP_INTERVAL:
+            self.sweep_expired()
+
+    def sweep_expired(self) -> int:
+        """Delete sessions whose TTL has lapsed; returns how many were removed."""
+        self._last_sweep = time.time()
+        removed = 0
+        if not self.root.exists():
+            return 0
+        for meta_path in self.root.glob("*.json"):
+            try:
+                expired = json.loads(meta_path.read_text())["expires_at"] < time.time()
+            except (OSError, ValueError, KeyError):
+                expired = True
+            if expired:
+                self._remove(meta_path.stem)
+                removed += 1
+        if removed:
+            logger.info(f"Swept {removed} abandoned resumable upload(s)")
+        return removed
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
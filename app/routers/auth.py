@@ -5,8 +5,9 @@ from sqlmodel import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_session
 from app.models import User
-from app.auth_utils import get_password_hash, verify_password, create_access_token, oauth
+from app.auth_utils import get_password_hash, verify_password, create_access_token, encrypt_secret, oauth
 from app.config import settings
+from datetime import datetime
 from pathlib import Path
 import logging
 
@@ -30,9 +31,16 @@ def _make_cookie_params(access_token: str, remember: bool = False) -> dict:
 
 @router.get("/login/google")
 async def login_google(request: Request):
-    """Initiate Google OAuth login."""
+    """
+    Initiate Google OAuth login. Offline access gets a refresh token for the
+    background Drive sync; Google only sends one on consent, so `?reconnect=1`
+    asks for consent again (for users whose Drive uploads need a new sign-in).
+    """
     redirect_uri = request.url_for('auth_google')
-    return await oauth.google.authorize_redirect(request, str(redirect_uri))
+    params = {"access_type": "offline", "include_granted_scopes": "true"}
+    if request.query_params.get("reconnect"):
+        params["prompt"] = "consent"
+    return await oauth.google.authorize_redirect(request, str(redirect_uri), **params)
 
 
 @router.get("/auth/google")
@@ -70,6 +78,19 @@ async def auth_google(request: Request, session: AsyncSession = Depends(get_sess
             await session.commit()
 
         request.session['google_access_token'] = token.get('access_token')
+
+        # Hand the Drive sync worker the fresh tokens and restart uploads waiting on a sign-in.
+        from app.drive_sync import drive_sync
+        user.drive_access_token = encrypt_secret(token.get('access_token'))
+        user.drive_token_expires_at = (
+            datetime.utcfromtimestamp(token['expires_at']) if token.get('expires_at') else None
+        )
+        if token.get('refresh_token'):
+            user.drive_refresh_token = encrypt_secret(token['refresh_token'])
+        session.add(user)
+        await drive_sync.resume_user(session, user.id)
+        await session.commit()
+        drive_sync.wake()
         access_token = create_access_token(data={"sub": user.email, "user_id": user.id})
 
         resp = RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
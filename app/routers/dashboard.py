@@ -2,13 +2,22 @@ from fastapi import APIRouter, Request, Depends, Form, status, BackgroundTasks
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select as sa_select
+from sqlalchemy import delete, select as sa_select
 from sqlmodel import select
 from app.database import get_session
-from app.models import User, Trip, TripUserLink, ItineraryItem, Expense
+from app.models import (
+    User, Trip, TripUserLink, ItineraryItem, Expense, Photo, Document, Message, GeoPlace, DriveSyncJob,
+)
 from app.auth_utils import get_current_user
+from app.geocoding import geocode_trip_itinerary
+from app.spatial import remove_place
+from app.blob_store import blob_sha, remove_files
+from app.storage import UPLOADS_ROOT
+from app.storage_quota import release_trip
 from pathlib import Path
+import asyncio
 import secrets
+import shutil
 import string
 
 router = APIRouter()
@@ -90,11 +99,9 @@ async def create_trip(
         google_access_token = request.session.get('google_access_token')
         if google_access_token:
             try:
-                from app.drive_service import get_drive_service, find_or_create_parent_folder, create_trip_folder
-                service = get_drive_service(google_access_token)
-                parent_id = await find_or_create_parent_folder(service)
-                folder_id = await create_trip_folder(service, trip_name, parent_id)
-                new_trip.drive_folder_id = folder_id
+                from app.drive_service import create_trip_folder_for_user
+                new_trip.drive_folder_id = await create_trip_folder_for_user(google_access_token, user, trip_name)
+                session.add(user)
             except Exception as e:
                 print(f"Drive folder creation failed: {e}")
 
@@ -162,12 +169,34 @@ async def delete_trip(
 
     trip = await session.get(Trip, trip_id)
     if trip:
-        await session.delete(trip)
+        # Storage accounting, blob references and the trip's rows go in one transaction.
+        orphaned = await release_trip(session, trip_id)
+        legacy_docs = (await session.execute(
+            select(Document.file_path).where(Document.trip_id == trip_id, Document.file_path.is_not(None))
+        )).scalars().all()
+        await session.execute(delete(DriveSyncJob).where(
+            DriveSyncJob.photo_id.in_(sa_select(Photo.id).where(Photo.trip_id == trip_id))
+        ))
+        for model in (Photo, Document, ItineraryItem, Expense, Message, GeoPlace, TripUserLink):
+            await session.execute(delete(model).where(model.trip_id == trip_id))
+        await session.execute(delete(Trip).where(Trip.id == trip_id))
         await session.commit()
 
+        for filename in orphaned:
+            await remove_files(filename)
+        # Files from before the blob store: uploads/<trip_id>/ and uploads/docs/<name>
+        legacy = [UPLOADS_ROOT / "docs" / name for name in legacy_docs if not blob_sha(name)]
+        await asyncio.get_event_loop().run_in_executor(None, _remove_legacy_files, UPLOADS_ROOT / str(trip_id), legacy)
+
     return RedirectResponse("/dashboard", status_code=status.HTTP_302_FOUND)
 
 
+def _remove_legacy_files(trip_dir: Path, paths: list):
+    shutil.rmtree(trip_dir, ignore_errors=True)
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
 @router.post("/trip/{trip_id}/edit")
 async def edit_trip(
     trip_id: int,
@@ -180,6 +209,7 @@ async def edit_trip(
     start_location: str = Form(None),
     estimated_budget: float = Form(None),
     notes: str = Form(None),
+    keep_originals: bool = Form(False),
     session: AsyncSession = Depends(get_session)
 ):
     if not user:
@@ -205,7 +235,9 @@ async def edit_trip(
         trip.start_location = start_location
         trip.estimated_budget = estimated_budget
         trip.notes = notes
-        
+        trip.keep_originals = keep_originals
+        trip.updated_at = datetime.utcnow()
+
         session.add(trip)
         await session.commit()
 
@@ -310,6 +342,7 @@ async def trip_detail(
 async def add_itinerary_item(
     request: Request,
     trip_id: int,
+    background_tasks: BackgroundTasks,
     day_number: int = Form(...),
     time: str = Form(...),
     activity: str = Form(...),
@@ -344,6 +377,9 @@ async def add_itinerary_item(
     session.add(new_item)
     await session.commit()
 
+    if location:
+        background_tasks.add_task(geocode_trip_itinerary, trip_id)
+
     return RedirectResponse(f"/trip/{trip_id}", status_code=status.HTTP_302_FOUND)
 
 
@@ -352,6 +388,7 @@ async def edit_itinerary_item(
     trip_id: int,
     item_id: int,
     request: Request,
+    background_tasks: BackgroundTasks,
     day_number: int = Form(...),
     time: str = Form(...),
     activity: str = Form(...),
@@ -376,15 +413,22 @@ async def edit_itinerary_item(
 
     item = await session.get(ItineraryItem, item_id)
     if item and item.trip_id == trip_id:
+        location_changed = item.location != location
         item.day_number = day_number
         item.time = time
         item.activity = activity
         item.location = location
         item.description = description
         item.category = category
+        if location_changed:
+            # Don't show the old marker while the new location is geocoded.
+            item.latitude = item.longitude = None
         session.add(item)
         await session.commit()
 
+        if location_changed:
+            background_tasks.add_task(geocode_trip_itinerary, trip_id)
+
     return RedirectResponse(f"/trip/{trip_id}#itinerary", status_code=status.HTTP_302_FOUND)
 
 
@@ -410,6 +454,7 @@ async def delete_itinerary_item(
 
     item = await session.get(ItineraryItem, item_id)
     if item and item.trip_id == trip_id:
+        await remove_place(session, "itinerary", item.id)
         await session.delete(item)
         await session.commit()
 
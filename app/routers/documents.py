@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Request, Depends, Form, UploadFile, File, status
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, JSONResponse
+from fastapi import APIRouter, BackgroundTasks, Request, Depends, Form, UploadFile, File, status
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
@@ -7,9 +7,14 @@ from app.database import get_session
 from app.models import User, Trip, TripUserLink, Document
 from app.auth_utils import get_current_user
 from app.config import settings
+from app.geocoding import geocode_trip_itinerary
+from app.spatial import remove_place
+from app.uploads import save_upload, UploadTooLarge
+from app.blob_store import TMP_DIR as BLOB_TMP_DIR, add_ref, blob_key, blob_path, blob_sha, release, remove_files
+from app.storage import storage
+from app.storage_quota import release_bytes, reserve
+from app.media_response import media_response
 from pathlib import Path
-import aiofiles
-import uuid
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,6 +24,11 @@ templates = Jinja2Templates(directory=Path(__file__).parent.parent / "templates"
 DOCS_DIR = Path(__file__).parent.parent.parent / "uploads" / "docs"
 DOCS_DIR.mkdir(parents=True, exist_ok=True)
 
+
+def document_path(file_path: str) -> Path:
+    """Blob-store attachments are named by hash; older ones live in DOCS_DIR."""
+    return blob_path(file_path) if blob_sha(file_path) else DOCS_DIR / file_path
+
 DOC_TYPE_ICONS = {
     "hotel": "🏨",
     "flight": "✈️",
@@ -98,6 +108,7 @@ async def trip_documents(
 async def add_document(
     request: Request,
     trip_id: int,
+    background_tasks: BackgroundTasks,
     doc_type: str = Form(...),
     title: str = Form(...),
     vendor: str = Form(None),
@@ -123,16 +134,22 @@ async def add_document(
         return RedirectResponse("/dashboard", status_code=status.HTTP_302_FOUND)
 
     file_path = None
+    file_sha256 = None
+    file_size = None
     if attachment and attachment.filename:
         file_ext = Path(attachment.filename).suffix.lower()
         if file_ext in ALLOWED_DOC_EXTENSIONS:
-            content = await attachment.read()
-            if len(content) <= settings.max_upload_size:
-                unique_filename = f"{uuid.uuid4()}{file_ext}"
-                dest_path = DOCS_DIR / unique_filename
-                async with aiofiles.open(dest_path, 'wb') as f:
-                    await f.write(content)
-                file_path = unique_filename
+            try:
+                stored = await save_upload(attachment, BLOB_TMP_DIR, file_ext, settings.max_upload_size)
+                if await reserve(session, trip_id, user.id, stored.size):
+                    file_path = await add_ref(session, stored.path, stored.sha256, stored.size, file_ext)
+                    file_sha256 = stored.sha256
+                    file_size = stored.size
+                else:
+                    stored.path.unlink(missing_ok=True)
+                    logger.info(f"Dropped attachment over the storage quota for trip {trip_id}")
+            except UploadTooLarge:
+                logger.info(f"Dropped oversized attachment for trip {trip_id}")
 
     new_doc = Document(
         trip_id=trip_id,
@@ -147,10 +164,15 @@ async def add_document(
         to_location=to_location,
         notes=notes,
         file_path=file_path,
+        sha256=file_sha256,
+        size_bytes=file_size,
     )
     session.add(new_doc)
     await session.commit()
 
+    if (to_location or from_location or "").strip():
+        background_tasks.add_task(geocode_trip_itinerary, trip_id)
+
     return RedirectResponse(f"/trip/{trip_id}/documents", status_code=status.HTTP_302_FOUND)
 
 
@@ -171,19 +193,28 @@ async def delete_document(
     if not doc or doc.user_id != user.id:
         return RedirectResponse(f"/trip/{trip_id}/documents", status_code=status.HTTP_302_FOUND)
 
+    orphaned = False
+    await release_bytes(session, trip_id, doc.user_id, doc.size_bytes)
     if doc.file_path:
-        file_path = DOCS_DIR / doc.file_path
-        if file_path.exists():
-            file_path.unlink()
-
+        if blob_sha(doc.file_path):
+            orphaned = await release(session, doc.file_path)
+        else:
+            file_path = DOCS_DIR / doc.file_path
+            if file_path.exists():
+                file_path.unlink()
+
+    await remove_place(session, "document", doc.id)
     await session.delete(doc)
     await session.commit()
+    if orphaned:
+        await remove_files(doc.file_path)
 
     return RedirectResponse(f"/trip/{trip_id}/documents", status_code=status.HTTP_302_FOUND)
 
 
 @router.get("/trip/{trip_id}/documents/{doc_id}/download")
 async def download_document(
+    request: Request,
     trip_id: int,
     doc_id: int,
     user: User = Depends(get_current_user),
@@ -199,8 +230,17 @@ async def download_document(
     if not doc or not doc.file_path:
         return JSONResponse({"error": "File not found"}, status_code=404)
 
-    file_path = DOCS_DIR / doc.file_path
+    filename = f"{doc.title}{Path(doc.file_path).suffix}"
+    if blob_sha(doc.file_path) and not storage.is_local:
+        # Straight from object storage via a short-lived presigned link.
+        url = storage.presign_get(blob_key(doc.file_path), filename=filename)
+        return RedirectResponse(url, status_code=status.HTTP_302_FOUND)
+
+    file_path = document_path(doc.file_path)
     if not file_path.exists():
         return JSONResponse({"error": "File not found"}, status_code=404)
 
-    return FileResponse(file_path, filename=f"{doc.title}{Path(doc.file_path).suffix}")
+    return media_response(
+        request, file_path, cache_control="private, no-cache",
+        filename=filename,
+    )
@@ -1,16 +1,43 @@
-from fastapi import APIRouter, Request, Depends, UploadFile, File, status
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
+from fastapi import APIRouter, BackgroundTasks, Request, Depends, UploadFile, File, Form, status
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, tuple_
 from sqlmodel import select
 from app.database import get_session
-from app.models import User, Trip, TripUserLink, Photo
+from app.models import User, Trip, TripUserLink, Photo, Document, Blob, DriveSyncJob
 from app.auth_utils import get_current_user
 from app.config import settings
+from app.uploads import save_upload, UploadTooLarge
+from app.blob_store import (
+    TMP_DIR as BLOB_TMP_DIR, add_ref, add_stored_ref, blob_key, blob_lock, blob_path, blob_sha,
+    release, remove_files,
+)
+from app.storage import StorageError, storage
+from app.storage_quota import QUOTA_EXCEEDED, release_bytes, remaining as quota_remaining, reserve
+from app.media_response import media_response
+from app.zipstream import ZipEntry, archive_size, read_file, stream_zip
+from app.image_normalize import NORMALIZE_EXT, normalize_image
+from app.media_pool import run_in_media_pool
+from app.near_duplicates import find_groups
+from app.photo_metadata import extract_metadata, extract_metadata_batch
+from app.resumable import ResumableUploadStore, UploadSessionError, TUS_VERSION, format_ranges
+from app.thumbnails import (
+    backfill_thumbnails, claim_for_backfill, create_thumbnails, create_thumbnails_batch, remove_thumbnails,
+    srcset, thumbnail_filename, thumbnail_widths,
+)
+from datetime import date, datetime, timedelta
 from pathlib import Path
-import aiofiles
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+import asyncio
+import base64
+import logging
+import re
 import uuid
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 templates = Jinja2Templates(directory=Path(__file__).parent.parent / "templates")
 
@@ -21,11 +48,14 @@ MAX_UPLOAD_BYTES = settings.max_upload_size  # 10MB default
 ALLOWED_IMAGE_EXT = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
 ALLOWED_VIDEO_EXT = {".mp4", ".mov", ".webm"}
 ALLOWED_EXT = ALLOWED_IMAGE_EXT | ALLOWED_VIDEO_EXT
+GALLERY_PAGE_SIZE = 60  # photos rendered with the page; the rest load as you scroll
+BULK_UPLOAD_CONCURRENCY = 4  # files copied to the blob store at once
 
 
 @router.get("/gallery", response_class=HTMLResponse)
 async def gallery_root(
     request: Request,
+    background_tasks: BackgroundTasks,
     user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
@@ -39,7 +69,7 @@ async def gallery_root(
     trip = result.scalar_one_or_none()
 
     if trip:
-        return await trip_gallery(request, trip.id, user, session)
+        return await trip_gallery(request, trip.id, background_tasks, user, session)
 
     return templates.TemplateResponse("gallery.html", {
         "request": request, "user": user, "trip": None, "photos": []
@@ -52,10 +82,84 @@ def get_trip_upload_dir(trip_id: int) -> Path:
     return trip_dir
 
 
+def photo_path(trip_id: int, filename: str) -> Path:
+    """On-disk location of a photo or thumbnail: the blob store, or the trip dir for older uploads."""
+    if blob_sha(filename):
+        return blob_path(filename)
+    return UPLOADS_DIR / str(trip_id) / filename
+
+
+def _encode_cursor(photo: Photo) -> str:
+    return f"{photo.uploaded_at.isoformat()}_{photo.id}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of _encode_cursor; raises ValueError for anything else."""
+    uploaded_at, _, photo_id = cursor.rpartition("_")
+    return datetime.fromisoformat(uploaded_at), int(photo_id)
+
+
+async def _photo_page(
+    session: AsyncSession, trip_id: int, before: Optional[str] = None, limit: int = GALLERY_PAGE_SIZE
+) -> Tuple[List[Tuple[Photo, User]], Optional[str]]:
+    """
+    One page of a trip's photos, newest first, with their uploaders. Keyset
+    pagination on (uploaded_at, id) walks ix_photo_trip_uploaded, so deep
+    pages cost the same as the first. Returns (rows, cursor for the next page).
+    """
+    statement = (
+        select(Photo, User)
+        .join(User, Photo.user_id == User.id)
+        .where(Photo.trip_id == trip_id)
+        .order_by(Photo.uploaded_at.desc(), Photo.id.desc())
+        .limit(limit + 1)
+    )
+    if before:
+        uploaded_at, photo_id = _decode_cursor(before)
+        statement = statement.where(tuple_(Photo.uploaded_at, Photo.id) < (uploaded_at, photo_id))
+    result = await session.execute(statement)
+    rows = result.all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, _encode_cursor(rows[-1][0])
+
+
+def _photo_row(p: Photo, u: User) -> dict:
+    return {
+        "id": p.id,
+        "filename": p.filename,
+        "media_type": p.media_type,
+        "caption": p.caption,
+        "uploaded_at": p.uploaded_at,
+        "user_id": p.user_id,
+        "user_name": u.full_name or u.email,
+    }
+
+
+def _photo_json(p: Photo, u: User) -> dict:
+    """A photo row for the JSON APIs."""
+    row = _photo_row(p, u)
+    row["uploaded_at"] = p.uploaded_at.isoformat()
+    row["thumbnail_widths"] = thumbnail_widths(p)
+    row["taken_at"] = p.taken_at.isoformat() if p.taken_at else None
+    row["width"] = p.width
+    row["height"] = p.height
+    return row
+
+
+def _queue_backfill(background_tasks: BackgroundTasks, trip_id: int, rows):
+    """Photos uploaded before thumbnails existed get them lazily, in the background."""
+    backfill = claim_for_backfill((p for p, _ in rows), lambda p: photo_path(trip_id, p.filename))
+    if backfill:
+        background_tasks.add_task(backfill_thumbnails, backfill)
+
+
 @router.get("/trip/{trip_id}/gallery", response_class=HTMLResponse)
 async def trip_gallery(
     request: Request,
     trip_id: int,
+    background_tasks: BackgroundTasks,
     user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
@@ -77,33 +181,293 @@ async def trip_gallery(
     if not link_result.scalar_one_or_none():
         return RedirectResponse("/dashboard", status_code=status.HTTP_302_FOUND)
 
-    # Get photos with user info via JOIN (fixes N+1)
-    from app.models import User as UserModel
-    photos_statement = select(Photo, UserModel).join(
-        UserModel, Photo.user_id == UserModel.id
-    ).where(Photo.trip_id == trip_id).order_by(Photo.uploaded_at.desc())
-    photos_result = await session.execute(photos_statement)
-    photos_data = photos_result.all()
+    rows, next_cursor = await _photo_page(session, trip_id)
+    count_result = await session.execute(
+        select(func.count()).select_from(Photo).where(Photo.trip_id == trip_id)
+    )
 
-    photos = [
-        {
-            "id": p.id,
-            "filename": p.filename,
-            "media_type": p.media_type,
-            "caption": p.caption,
-            "uploaded_at": p.uploaded_at,
-            "user_id": p.user_id,
-            "user_name": u.full_name or u.email,
-            "trip_id": trip_id,
-        }
-        for p, u in photos_data
-    ]
+    base_url = f"/uploads/{trip_id}"
+    photos = []
+    for p, u in rows:
+        widths = thumbnail_widths(p)
+        photos.append({
+            **_photo_row(p, u),
+            # Grid shows the middle size by default; srcset lets the browser pick.
+            "thumb_src": f"{base_url}/{thumbnail_filename(p.filename, widths[len(widths) // 2])}" if widths else None,
+            "srcset": srcset(base_url, p.filename, widths),
+        })
+
+    _queue_backfill(background_tasks, trip_id, rows)
 
     return templates.TemplateResponse("gallery.html", {
         "request": request,
         "user": user,
         "trip": trip,
         "photos": photos,
+        "photo_count": count_result.scalar_one(),
+        "next_cursor": next_cursor,
+        "max_upload_size": MAX_UPLOAD_BYTES,
+        "max_video_size": settings.max_resumable_upload_size,
+        "max_bulk_files": settings.max_bulk_upload_files,
+        "max_bulk_size": settings.max_bulk_upload_size,
+        "direct_uploads": not storage.is_local,
+    })
+
+
+@router.get("/api/trip/{trip_id}/photos")
+async def list_photos(
+    trip_id: int,
+    background_tasks: BackgroundTasks,
+    before: Optional[str] = None,
+    limit: int = GALLERY_PAGE_SIZE,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """API: A page of photos older than the `before` cursor, newest first."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    if not await _is_trip_member(session, trip_id, user.id):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    try:
+        rows, next_cursor = await _photo_page(session, trip_id, before, max(1, min(limit, 200)))
+    except ValueError:
+        return JSONResponse({"error": "Invalid cursor"}, status_code=400)
+    _queue_backfill(background_tasks, trip_id, rows)
+
+    return JSONResponse({"photos": [_photo_json(p, u) for p, u in rows], "next": next_cursor})
+
+
+@router.get("/api/trip/{trip_id}/timeline")
+async def photo_timeline(
+    trip_id: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """API: How many photos were taken on each day of the trip (camera local time), oldest first."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    if not await _is_trip_member(session, trip_id, user.id):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    day = func.date(Photo.taken_at)
+    result = await session.execute(
+        select(day, func.count())
+        .where(Photo.trip_id == trip_id, Photo.taken_at.is_not(None))
+        .group_by(day)
+        .order_by(day)
+    )
+    days = [{"date": str(d), "count": count} for d, count in result.all()]
+    undated = await session.execute(
+        select(func.count()).select_from(Photo).where(Photo.trip_id == trip_id, Photo.taken_at.is_(None))
+    )
+    return JSONResponse({"days": days, "undated": undated.scalar_one()})
+
+
+@router.get("/api/trip/{trip_id}/timeline/{day}")
+async def photo_timeline_day(
+    trip_id: int,
+    day: str,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """API: Photos taken on one day (YYYY-MM-DD), in the order they were taken."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    if not await _is_trip_member(session, trip_id, user.id):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    try:
+        start = datetime.combine(date.fromisoformat(day), datetime.min.time())
+    except ValueError:
+        return JSONResponse({"error": "Invalid date"}, status_code=400)
+
+    # A range on taken_at (not date(taken_at)) so ix_photo_trip_taken is used.
+    result = await session.execute(
+        select(Photo, User)
+        .join(User, Photo.user_id == User.id)
+        .where(Photo.trip_id == trip_id, Photo.taken_at >= start, Photo.taken_at < start + timedelta(days=1))
+        .order_by(Photo.taken_at, Photo.id)
+    )
+    return JSONResponse({"date": day, "photos": [_photo_json(p, u) for p, u in result.all()]})
+
+
+@router.get("/api/trip/{trip_id}/duplicates")
+async def near_duplicate_photos(
+    trip_id: int,
+    max_distance: int = settings.near_duplicate_max_distance,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    API: Groups of near-identical photos (bursts, the same shot from several
+    phones), each with the photo to show when the group is collapsed: the
+    largest, then the earliest uploaded.
+    """
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    if not await _is_trip_member(session, trip_id, user.id):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    result = await session.execute(
+        select(Photo.id, Photo.phash, Photo.width, Photo.height)
+        .where(Photo.trip_id == trip_id, Photo.phash.is_not(None))
+        .order_by(Photo.id)
+    )
+    rows = result.all()
+    pixels = {photo_id: (width or 0) * (height or 0) for photo_id, _, width, height in rows}
+    groups = await asyncio.get_running_loop().run_in_executor(
+        None, find_groups, [r[0] for r in rows], [r[1] for r in rows], max(0, min(max_distance, 32))
+    )
+    unhashed = await session.execute(
+        select(func.count()).select_from(Photo)
+        .where(Photo.trip_id == trip_id, Photo.media_type == "image", Photo.phash.is_(None))
+    )
+    return JSONResponse({
+        "groups": [
+            {"keep": min(group, key=lambda photo_id: (-pixels[photo_id], photo_id)), "photo_ids": group}
+            for group in groups
+        ],
+        # Images still waiting for (or unable to get) a hash aren't grouped.
+        "unhashed": unhashed.scalar_one(),
+    })
+
+
+@router.get("/api/trip/{trip_id}/photos/geo")
+async def photo_locations(
+    trip_id: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """API: Where the trip's geotagged photos were taken, for plotting on the map."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    if not await _is_trip_member(session, trip_id, user.id):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    result = await session.execute(
+        select(Photo)
+        .where(Photo.trip_id == trip_id, Photo.latitude.is_not(None), Photo.longitude.is_not(None))
+        .order_by(Photo.taken_at, Photo.id)
+    )
+    return JSONResponse({"photos": [
+        {
+            "id": p.id,
+            "filename": p.filename,
+            "media_type": p.media_type,
+            "thumbnail_widths": thumbnail_widths(p),
+            "latitude": p.latitude,
+            "longitude": p.longitude,
+            "taken_at": p.taken_at.isoformat() if p.taken_at else None,
+        }
+        for p in result.scalars()
+    ]})
+
+
+@router.get("/api/trip/{trip_id}/drive-sync")
+async def drive_sync_status(
+    trip_id: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """API: Google Drive upload status of the trip's queued photos."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    if not await _is_trip_member(session, trip_id, user.id):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    result = await session.execute(
+        select(DriveSyncJob).join(Photo, DriveSyncJob.photo_id == Photo.id).where(Photo.trip_id == trip_id)
+    )
+    photos = {}
+    counts = {}
+    for job in result.scalars():
+        # Pending without a next attempt: paused for a sign-in before needs_auth existed.
+        state = "needs_auth" if job.status == "pending" and job.next_attempt_at is None else job.status
+        counts[state] = counts.get(state, 0) + 1
+        photos[job.photo_id] = {
+            "status": state,
+            "bytes_sent": job.bytes_sent,
+            "attempts": job.attempts,
+            "error": job.last_error,
+        }
+    response = {"counts": counts, "photos": photos}
+    if counts.get("needs_auth"):
+        response["reauth_url"] = "/login/google?reconnect=1"
+    return JSONResponse(response)
+
+
+@router.get("/trip/{trip_id}/gallery/download.zip")
+async def download_gallery_zip(
+    trip_id: int,
+    uploader: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Download a trip's photos and videos as one ZIP, streamed as it's built.
+    Optional filters: `uploader` (user id) and an inclusive upload date range
+    (`date_from` / `date_to`, YYYY-MM-DD).
+    """
+    if not user:
+        return RedirectResponse("/login", status_code=status.HTTP_302_FOUND)
+
+    trip = await session.get(Trip, trip_id)
+    if not trip or not await _is_trip_member(session, trip_id, user.id):
+        return RedirectResponse("/dashboard", status_code=status.HTTP_302_FOUND)
+
+    statement = (
+        select(Photo, Blob.size)
+        .outerjoin(Blob, Blob.sha256 == Photo.sha256)
+        .where(Photo.trip_id == trip_id)
+        .order_by(Photo.uploaded_at, Photo.id)
+    )
+    if uploader is not None:
+        statement = statement.where(Photo.user_id == uploader)
+    try:
+        if date_from:
+            statement = statement.where(Photo.uploaded_at >= date.fromisoformat(date_from))
+        if date_to:
+            statement = statement.where(Photo.uploaded_at < date.fromisoformat(date_to) + timedelta(days=1))
+    except ValueError:
+        return JSONResponse({"error": "Dates must be YYYY-MM-DD"}, status_code=400)
+    result = await session.execute(statement)
+
+    entries = []
+    for photo, blob_size in result.all():
+        name = f"{photo.uploaded_at:%Y-%m-%d_%H%M%S}_{photo.id}{Path(photo.filename).suffix.lower()}"
+        if blob_sha(photo.filename):
+            # Read through the storage backend; size from the Blob row saves a HEAD per object.
+            entries.append(ZipEntry(blob_key(photo.filename), name, blob_size, photo.uploaded_at))
+            continue
+        file_path = UPLOADS_DIR / str(trip_id) / photo.filename
+        try:
+            size = file_path.stat().st_size
+        except FileNotFoundError:
+            continue
+        entries.append(ZipEntry(file_path, name, size, photo.uploaded_at))
+    if not entries:
+        return RedirectResponse(
+            f"/trip/{trip_id}/gallery?error=No+photos+to+download", status_code=status.HTTP_302_FOUND
+        )
+
+    safe_name = re.sub(r"[^\w\- ]+", "", trip.name).strip().replace(" ", "_") or "trip"
+    archive_name = f"{safe_name}_photos.zip"
+    def read(source):
+        return storage.iter_bytes(source) if isinstance(source, str) else read_file(source)
+
+    return StreamingResponse(stream_zip(entries, read), media_type="application/zip", headers={
+        "Content-Length": str(archive_size(entries)),
+        "Content-Disposition": f"attachment; filename*=utf-8''{quote(archive_name)}",
+        "Cache-Control": "private, no-store",
     })
 
 
@@ -111,6 +475,7 @@ async def trip_gallery(
 async def upload_photo(
     request: Request,
     trip_id: int,
+    background_tasks: BackgroundTasks,
     user: User = Depends(get_current_user),
     photo: UploadFile = File(...),
     caption: str = None,
@@ -134,55 +499,615 @@ async def upload_photo(
             status_code=status.HTTP_302_FOUND
         )
 
-    # Read content with size check (Fix: validate file size before saving)
-    content = await photo.read()
-    if len(content) > MAX_UPLOAD_BYTES:
+    # Stream to disk in chunks; aborts as soon as the size limit is crossed
+    try:
+        stored = await save_upload(photo, BLOB_TMP_DIR, file_ext, MAX_UPLOAD_BYTES)
+    except UploadTooLarge:
         return RedirectResponse(
             f"/trip/{trip_id}/gallery?error=File+too+large+(max+10MB)",
             status_code=status.HTTP_302_FOUND
         )
 
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    trip_dir = get_trip_upload_dir(trip_id)
-    file_path = trip_dir / unique_filename
-
-    async with aiofiles.open(file_path, 'wb') as f:
-        await f.write(content)
-
     trip_result = await session.execute(select(Trip).where(Trip.id == trip_id))
     trip = trip_result.scalar_one_or_none()
 
+    # Identical bytes already uploaded (e.g. by another member) are stored once.
+    normalized = await _normalize_upload(stored.path, file_ext)
+    added = await _add_upload_ref(
+        session, trip_id, user.id, bool(trip and trip.keep_originals),
+        stored.path, stored.sha256, stored.size, file_ext, normalized,
+    )
+    if added is None:
+        return RedirectResponse(
+            f"/trip/{trip_id}/gallery?error=Storage+quota+exceeded",
+            status_code=status.HTTP_302_FOUND
+        )
+    filename, sha256, original_filename, size_bytes = added
+    file_path = blob_path(filename)
     new_photo = Photo(
         trip_id=trip_id,
         user_id=user.id,
-        filename=unique_filename,
+        filename=filename,
         media_type="video" if file_ext in ALLOWED_VIDEO_EXT else "image",
         caption=caption,
+        sha256=sha256,
+        original_filename=original_filename,
+        size_bytes=size_bytes,
     )
     session.add(new_photo)
     await session.commit()
 
-    # Google Drive Sync
-    if trip and user.drive_connected and trip.drive_folder_id:
-        google_access_token = request.session.get('google_access_token')
-        if google_access_token:
-            try:
-                from app.drive_service import get_drive_service, upload_file_to_drive
-                service = get_drive_service(google_access_token)
-                await upload_file_to_drive(service, file_path, trip.drive_folder_id, new_photo.media_type)
-            except Exception as e:
-                print(f"Drive upload failed: {e}")
+    background_tasks.add_task(create_thumbnails, new_photo.id, file_path)
+    background_tasks.add_task(extract_metadata, new_photo.id)
+    await _queue_drive_sync(session, trip, user, [new_photo.id])
 
     return RedirectResponse(f"/trip/{trip_id}/gallery", status_code=status.HTTP_302_FOUND)
 
 
-@router.get("/uploads/{trip_id}/{filename}")
-async def get_photo(trip_id: int, filename: str):
-    """Serve uploaded photos."""
-    file_path = UPLOADS_DIR / str(trip_id) / filename
-    if not file_path.exists():
-        return RedirectResponse("/static/images/placeholder.jpg", status_code=status.HTTP_302_FOUND)
-    return FileResponse(file_path)
+@router.post("/trip/{trip_id}/upload/bulk")
+async def upload_photos_bulk(
+    request: Request,
+    trip_id: int,
+    background_tasks: BackgroundTasks,
+    user: User = Depends(get_current_user),
+    photos: List[UploadFile] = File(...),
+    caption: Optional[str] = Form(None),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    API: Upload many photos/videos in one request. Files are copied into the
+    blob store concurrently, all Photo rows are inserted in one transaction,
+    and thumbnails run afterwards. Returns a per-file summary;
+    a bad file doesn't fail the rest.
+    """
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    if not await _is_trip_member(session, trip_id, user.id):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    if len(photos) > settings.max_bulk_upload_files:
+        return JSONResponse(
+            {"error": f"Too many files (max {settings.max_bulk_upload_files})"}, status_code=400
+        )
+
+    semaphore = asyncio.Semaphore(BULK_UPLOAD_CONCURRENCY)
+
+    async def store(upload: UploadFile):
+        file_ext = Path(upload.filename or "").suffix.lower()
+        if file_ext not in ALLOWED_EXT:
+            return "Invalid file type"
+        async with semaphore:
+            try:
+                stored = await save_upload(upload, BLOB_TMP_DIR, file_ext, MAX_UPLOAD_BYTES)
+            except UploadTooLarge:
+                return f"File too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)}MB)"
+        # Outside the semaphore: the media pool bounds the re-encoding itself.
+        return stored, await _normalize_upload(stored.path, file_ext)
+
+    stored_files = await asyncio.gather(*(store(upload) for upload in photos))
+    trip = await session.get(Trip, trip_id)
+
+    results = []
+    new_photos = []
+    for upload, stored in zip(photos, stored_files):
+        if isinstance(stored, str):
+            results.append({"filename": upload.filename, "status": "error", "error": stored})
+            continue
+        stored, normalized = stored
+        file_ext = Path(upload.filename).suffix.lower()
+        added = await _add_upload_ref(
+            session, trip_id, user.id, bool(trip and trip.keep_originals),
+            stored.path, stored.sha256, stored.size, file_ext, normalized,
+        )
+        if added is None:
+            results.append({"filename": upload.filename, "status": "error", "error": QUOTA_EXCEEDED})
+            continue
+        filename, sha256, original_filename, size_bytes = added
+        new_photo = Photo(
+            trip_id=trip_id,
+            user_id=user.id,
+            filename=filename,
+            media_type="video" if file_ext in ALLOWED_VIDEO_EXT else "image",
+            caption=caption,
+            sha256=sha256,
+            original_filename=original_filename,
+            size_bytes=size_bytes,
+        )
+        session.add(new_photo)
+        new_photos.append(new_photo)
+        results.append({"filename": upload.filename, "status": "ok", "photo": new_photo})
+    await session.commit()
+
+    for result in results:
+        if "photo" in result:
+            result["photo_id"] = result.pop("photo").id
+
+    if new_photos:
+        background_tasks.add_task(_process_bulk_upload, [(p.id, p.filename) for p in new_photos])
+        await _queue_drive_sync(session, trip, user, [p.id for p in new_photos])
+
+    return JSONResponse({
+        "uploaded": len(new_photos),
+        "failed": len(results) - len(new_photos),
+        "results": results,
+    })
+
+
+async def _process_bulk_upload(items: List[Tuple[int, str]]):
+    """Background: thumbnails and EXIF for the whole batch."""
+    await create_thumbnails_batch([(photo_id, blob_path(filename)) for photo_id, filename in items])
+    await extract_metadata_batch([photo_id for photo_id, _ in items])
+
+
+async def _normalize_upload(tmp_path: Path, ext: str):
+    """Re-encoded copy of an uploaded photo (app/image_normalize.py), or None to store it as uploaded."""
+    if not settings.image_normalize_enabled or ext not in NORMALIZE_EXT:
+        return None
+    try:
+        return await run_in_media_pool(
+            normalize_image, str(tmp_path), str(BLOB_TMP_DIR),
+            settings.image_max_dimension, settings.image_quality, settings.image_normalize_format,
+        )
+    except Exception as e:
+        logger.warning(f"Normalizing {tmp_path.name} failed; storing it as uploaded: {e}")
+        return None
+
+
+async def _add_upload_ref(
+    session: AsyncSession, trip_id: int, user_id: int, keep_originals: bool,
+    tmp_path: Path, sha256: str, size: int, ext: str, normalized
+) -> Optional[Tuple[str, str, Optional[str], int]]:
+    """
+    Charge an upload to the trip's and uploader's storage and store it, or
+    its normalized copy when there is one (keeping the original too if the
+    trip's `keep_originals` is on). Returns (filename, sha256, original
+    filename or None, bytes charged), or None with the temp files discarded
+    when a storage quota doesn't allow it.
+    """
+    keep_original = normalized is None or keep_originals
+    size_bytes = (size if keep_original else 0) + (normalized[2] if normalized else 0)
+    if not await reserve(session, trip_id, user_id, size_bytes):
+        tmp_path.unlink(missing_ok=True)
+        if normalized:
+            Path(normalized[0]).unlink(missing_ok=True)
+        return None
+
+    if normalized is None:
+        return await add_ref(session, tmp_path, sha256, size, ext), sha256, None, size_bytes
+    path, new_sha256, new_size, new_ext = normalized
+    original_filename = None
+    if keep_original:
+        original_filename = await add_ref(session, tmp_path, sha256, size, ext)
+    else:
+        tmp_path.unlink(missing_ok=True)
+    filename = await add_ref(session, Path(path), new_sha256, new_size, new_ext)
+    return filename, new_sha256, original_filename, size_bytes
+
+
+async def _queue_drive_sync(session: AsyncSession, trip: Trip, user: User, photo_ids: List[int]):
+    """Google Drive Sync: queue new photos for the background uploader (app/drive_sync.py)."""
+    if not (settings.drive_sync_enabled and trip and user.drive_connected and trip.drive_folder_id):
+        return
+    from app.drive_sync import drive_sync
+    await drive_sync.enqueue(session, user, trip.drive_folder_id, photo_ids)
+    await session.commit()
+    drive_sync.wake()
+
+
+# ===== Resumable uploads (see app/resumable.py for the protocol) =====
+
+resumable_uploads = ResumableUploadStore(UPLOADS_DIR / ".resumable")
+
+
+def _tus_response(status_code: int, state: Optional[dict] = None, **headers) -> Response:
+    response = Response(status_code=status_code)
+    response.headers["Tus-Resumable"] = TUS_VERSION
+    if state is not None:
+        response.headers["Upload-Offset"] = str(resumable_uploads.contiguous_offset(state))
+        response.headers["Upload-Length"] = str(state["length"])
+        response.headers["Upload-Ranges"] = format_ranges([tuple(r) for r in state["ranges"]])
+    for name, value in headers.items():
+        response.headers[name.replace("_", "-")] = value
+    return response
+
+
+def _parse_upload_metadata(header: str) -> dict:
+    """tus Upload-Metadata: comma-separated "key base64value" pairs."""
+    metadata = {}
+    for pair in filter(None, (p.strip() for p in (header or "").split(","))):
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value).decode("utf-8") if value else ""
+        except (ValueError, UnicodeDecodeError):
+            continue
+    return metadata
+
+
+async def _is_trip_member(session: AsyncSession, trip_id: int, user_id: int) -> bool:
+    link_statement = select(TripUserLink).where(
+        TripUserLink.trip_id == trip_id,
+        TripUserLink.user_id == user_id
+    )
+    link_result = await session.execute(link_statement)
+    return link_result.scalar_one_or_none() is not None
+
+
+@router.post("/trip/{trip_id}/uploads/resumable")
+async def create_resumable_upload(
+    request: Request,
+    trip_id: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """Start a resumable upload; the Location header is the URL to PATCH chunks to."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if not await _is_trip_member(session, trip_id, user.id):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    length = request.headers.get("upload-length", "")
+    if not length.isdigit() or int(length) == 0:
+        return JSONResponse({"error": "Upload-Length required"}, status_code=400)
+    if int(length) > settings.max_resumable_upload_size:
+        return JSONResponse({"error": "File too large"}, status_code=413)
+    space = await quota_remaining(session, trip_id, user.id)
+    if space is not None and int(length) > space:
+        return JSONResponse({"error": QUOTA_EXCEEDED}, status_code=413)
+
+    metadata = _parse_upload_metadata(request.headers.get("upload-metadata"))
+    filename = metadata.get("filename", "")
+    file_ext = Path(filename).suffix.lower()
+    if file_ext not in ALLOWED_EXT:
+        return JSONResponse({"error": "Invalid file type"}, status_code=400)
+
+    state = resumable_uploads.create(
+        trip_id, user.id, int(length), filename, file_ext, caption=metadata.get("caption") or None
+    )
+    return _tus_response(201, state, Location=f"/trip/{trip_id}/uploads/resumable/{state['id']}")
+
+
+async def _owned_upload(trip_id: int, upload_id: str, user: Optional[User]) -> dict:
+    if not user:
+        raise UploadSessionError("Unauthorized", 401)
+    state = resumable_uploads.status(upload_id)
+    if state["trip_id"] != trip_id or state["user_id"] != user.id:
+        raise UploadSessionError("Unknown upload", 404)
+    return state
+
+
+@router.head("/trip/{trip_id}/uploads/resumable/{upload_id}")
+async def resumable_upload_status(trip_id: int, upload_id: str, user: User = Depends(get_current_user)):
+    """How much of the upload the server has (contiguous offset plus all received ranges)."""
+    try:
+        state = await _owned_upload(trip_id, upload_id, user)
+    except UploadSessionError as e:
+        return _tus_response(e.status_code)
+    return _tus_response(200, state, Cache_Control="no-store")
+
+
+@router.patch("/trip/{trip_id}/uploads/resumable/{upload_id}")
+async def resumable_upload_chunk(
+    request: Request,
+    trip_id: int,
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """Write one chunk at Upload-Offset; the chunk that completes the file creates the Photo."""
+    offset = request.headers.get("upload-offset", "")
+    if not offset.isdigit():
+        return _tus_response(400)
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        return _tus_response(415)
+
+    try:
+        await _owned_upload(trip_id, upload_id, user)
+        state = await resumable_uploads.write_chunk(upload_id, int(offset), request.stream())
+    except ClientDisconnect:
+        # Whatever arrived was recorded; the client resumes from HEAD.
+        return _tus_response(400)
+    except UploadSessionError as e:
+        return _tus_response(e.status_code)
+    if not resumable_uploads.is_complete(state):
+        return _tus_response(204, state)
+
+    try:
+        tmp_path, _, sha256 = await resumable_uploads.finalize(upload_id, BLOB_TMP_DIR)
+    except UploadSessionError as e:
+        if e.status_code == 404:
+            # A parallel chunk completed the file and registered the photo.
+            return _tus_response(204, Upload_Offset=str(state["length"]))
+        return _tus_response(e.status_code)
+
+    trip = await session.get(Trip, trip_id)
+    normalized = await _normalize_upload(tmp_path, state["ext"])
+    added = await _add_upload_ref(
+        session, trip_id, user.id, bool(trip and trip.keep_originals),
+        tmp_path, sha256, state["length"], state["ext"], normalized,
+    )
+    if added is None:
+        return _tus_response(413)
+    filename, sha256, original_filename, size_bytes = added
+    file_path = blob_path(filename)
+    new_photo = Photo(
+        trip_id=trip_id,
+        user_id=user.id,
+        filename=filename,
+        media_type="video" if state["ext"] in ALLOWED_VIDEO_EXT else "image",
+        caption=state["caption"],
+        sha256=sha256,
+        original_filename=original_filename,
+        size_bytes=size_bytes,
+    )
+    session.add(new_photo)
+    await session.commit()
+
+    background_tasks.add_task(create_thumbnails, new_photo.id, file_path)
+    background_tasks.add_task(extract_metadata, new_photo.id)
+    await _queue_drive_sync(session, trip, user, [new_photo.id])
+
+    return _tus_response(204, Upload_Offset=str(state["length"]), Upload_Photo_Id=str(new_photo.id))
+
+
+@router.delete("/trip/{trip_id}/uploads/resumable/{upload_id}")
+async def cancel_resumable_upload(trip_id: int, upload_id: str, user: User = Depends(get_current_user)):
+    """Abandon an upload and free its disk space."""
+    try:
+        await _owned_upload(trip_id, upload_id, user)
+        resumable_uploads.terminate(upload_id)
+    except UploadSessionError as e:
+        return _tus_response(e.status_code)
+    return _tus_response(204)
+
+
+# ===== Direct-to-storage uploads (object storage backends only) =====
+
+SHA256_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+
+async def _direct_upload_request(request: Request):
+    """Parse and validate a direct-upload JSON body; returns (body, ext) or an error response."""
+    try:
+        body = await request.json()
+    except ValueError:
+        return None, JSONResponse({"error": "Invalid JSON"}, status_code=400)
+    ext = Path(str(body.get("filename") or "")).suffix.lower()
+    if ext not in ALLOWED_EXT:
+        return None, JSONResponse({"error": "Invalid file type"}, status_code=400)
+    if not SHA256_HEX.match(str(body.get("sha256") or "")):
+        return None, JSONResponse({"error": "sha256 must be a hex digest"}, status_code=400)
+    return body, ext
+
+
+async def _owns_content(session: AsyncSession, user_id: int, sha256: str) -> bool:
+    """Whether the user already uploaded these bytes themselves (a photo or document of theirs)."""
+    for model in (Photo, Document):
+        result = await session.execute(
+            select(model.id).where(model.sha256 == sha256, model.user_id == user_id).limit(1)
+        )
+        if result.first() is not None:
+            return True
+    return False
+
+
+def _direct_upload_token(user_id: int, trip_id: int, sha256: str, key: str) -> str:
+    from jose import jwt
+
+    claims = {
+        "purpose": "direct_upload", "user_id": user_id, "trip_id": trip_id, "sha256": sha256, "key": key,
+        # Outlives the PUT URL, so an upload that starts just before it expires can still be completed.
+        "exp": datetime.utcnow() + timedelta(seconds=2 * settings.s3_presign_expiry),
+    }
+    return jwt.encode(claims, settings.secret_key, algorithm=settings.algorithm)
+
+
+def _direct_upload_key(token, user_id: int, trip_id: int, sha256: str) -> Optional[str]:
+    """The staging key a token from /uploads/direct was issued for, if it's valid for this upload."""
+    from jose import JWTError, jwt
+
+    try:
+        claims = jwt.decode(str(token or ""), settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return None
+    if (claims.get("purpose"), claims.get("user_id"), claims.get("trip_id"), claims.get("sha256")) != (
+        "direct_upload", user_id, trip_id, sha256
+    ):
+        return None
+    return claims.get("key")
+
+
+@router.post("/trip/{trip_id}/uploads/direct")
+async def presign_direct_upload(
+    request: Request,
+    trip_id: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    API: Start a browser-to-storage upload. Body: {filename, size, sha256}.
+    Returns a presigned PUT (which the storage service only accepts for bytes
+    matching `sha256`) to a staging key, with a token for /complete; or
+    `exists: true` when the caller already uploaded this content before and
+    can go straight to /complete. Content uploaded by anyone else is never
+    reported, so the endpoint can't be used to probe what the server stores.
+    """
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if not await _is_trip_member(session, trip_id, user.id):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if storage.is_local:
+        return JSONResponse({"error": "Direct uploads need object storage"}, status_code=409)
+
+    body, ext = await _direct_upload_request(request)
+    if body is None:
+        return ext
+    size = body.get("size")
+    if not isinstance(size, int) or size <= 0:
+        return JSONResponse({"error": "size is required"}, status_code=400)
+    if size > settings.max_resumable_upload_size:
+        return JSONResponse({"error": "File too large"}, status_code=413)
+    space = await quota_remaining(session, trip_id, user.id)
+    if space is not None and size > space:
+        return JSONResponse({"error": QUOTA_EXCEEDED}, status_code=413)
+
+    sha256 = body["sha256"]
+    if await _owns_content(session, user.id, sha256) and await session.get(Blob, sha256) is not None:
+        return JSONResponse({"exists": True, "upload": None, "token": None})
+    key = f"direct/{uuid.uuid4()}{ext}"
+    return JSONResponse({
+        "exists": False,
+        "upload": storage.presign_put(key, sha256),
+        "token": _direct_upload_token(user.id, trip_id, sha256, key),
+    })
+
+
+@router.post("/trip/{trip_id}/uploads/direct/complete")
+async def complete_direct_upload(
+    request: Request,
+    trip_id: int,
+    background_tasks: BackgroundTasks,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    API: Register a photo whose bytes were PUT to storage.
+    Body: {filename, sha256, token, caption?}; `token` may be omitted when
+    /uploads/direct answered `exists: true`.
+    """
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if not await _is_trip_member(session, trip_id, user.id):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if storage.is_local:
+        return JSONResponse({"error": "Direct uploads need object storage"}, status_code=409)
+
+    body, ext = await _direct_upload_request(request)
+    if body is None:
+        return ext
+    sha256 = body["sha256"]
+
+    blob = await session.get(Blob, sha256)
+    staged_key = None
+    if blob is not None and await _owns_content(session, user.id, sha256):
+        size = blob.size
+    else:
+        # Existing content is only attached to someone who proved they have the bytes by uploading them.
+        staged_key = _direct_upload_key(body.get("token"), user.id, trip_id, sha256)
+        if staged_key is None:
+            return JSONResponse({"error": "Invalid or expired upload token"}, status_code=403)
+        try:
+            size = await storage.size(staged_key)
+        except StorageError as e:
+            logger.warning(f"Direct upload check failed: {e}")
+            return JSONResponse({"error": "Storage unavailable"}, status_code=502)
+        if size is None:
+            return JSONResponse({"error": "Nothing uploaded for this file"}, status_code=409)
+        if size > settings.max_resumable_upload_size:
+            await storage.delete(staged_key)
+            return JSONResponse({"error": "File too large"}, status_code=413)
+
+    if not await reserve(session, trip_id, user.id, size):
+        if staged_key:
+            await storage.delete(staged_key)
+        return JSONResponse({"error": QUOTA_EXCEEDED}, status_code=413)
+    async with blob_lock(sha256):
+        if staged_key:
+            # The checksum on the presigned PUT guarantees the staged bytes hash to `sha256`.
+            # Re-read the row under the lock: the last reference may have gone meanwhile.
+            blob = (await session.execute(
+                select(Blob).where(Blob.sha256 == sha256).execution_options(populate_existing=True)
+            )).scalar_one_or_none()
+            try:
+                if blob is not None:
+                    await storage.delete(staged_key)
+                else:
+                    await storage.move(staged_key, blob_key(f"{sha256}{ext}"))
+            except StorageError as e:
+                logger.warning(f"Direct upload move failed: {e}")
+                await session.rollback()
+                return JSONResponse({"error": "Storage unavailable"}, status_code=502)
+        filename = await add_stored_ref(session, sha256, size, ext)
+    new_photo = Photo(
+        trip_id=trip_id,
+        user_id=user.id,
+        filename=filename,
+        media_type="video" if ext in ALLOWED_VIDEO_EXT else "image",
+        caption=body.get("caption") or None,
+        sha256=sha256,
+        size_bytes=size,
+    )
+    session.add(new_photo)
+    await session.commit()
+
+    trip = await session.get(Trip, trip_id)
+    background_tasks.add_task(create_thumbnails, new_photo.id, blob_path(filename))
+    background_tasks.add_task(extract_metadata, new_photo.id)
+    await _queue_drive_sync(session, trip, user, [new_photo.id])
+    return JSONResponse({"photo_id": new_photo.id})
+
+
+def _storage_redirect(url: str) -> RedirectResponse:
+    """Send the browser to a presigned URL; the redirect itself is cached for part of its lifetime."""
+    response = RedirectResponse(url, status_code=status.HTTP_302_FOUND)
+    response.headers["Cache-Control"] = f"private, max-age={settings.s3_presign_expiry // 2}"
+    return response
+
+
+@router.api_route("/uploads/{trip_id}/{filename}", methods=["GET", "HEAD"])
+async def get_photo(
+    request: Request,
+    trip_id: int,
+    filename: str,
+    session: AsyncSession = Depends(get_session)
+):
+    """Serve uploaded photos, videos and thumbnails (cacheable forever, seekable)."""
+    placeholder = RedirectResponse("/static/images/placeholder.jpg", status_code=status.HTTP_302_FOUND)
+    sha = blob_sha(filename)
+    if sha:
+        # Blobs are shared across trips; only serve one through a trip that has it.
+        result = await session.execute(
+            select(Photo.id).where(Photo.trip_id == trip_id, Photo.sha256 == sha).limit(1)
+        )
+        if result.scalar_one_or_none() is None:
+            return placeholder
+        if not storage.is_local:
+            return _storage_redirect(storage.presign_get(blob_key(filename)))
+    file_path = photo_path(trip_id, filename)
+    if filename.startswith(".") or not file_path.is_file():
+        return placeholder
+    return media_response(request, file_path)
+
+
+@router.get("/trip/{trip_id}/photo/{photo_id}/original")
+async def download_original(
+    request: Request,
+    trip_id: int,
+    photo_id: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """Download a photo as it was uploaded (kept when the trip opts in), else as stored."""
+    if not user:
+        return RedirectResponse("/login", status_code=status.HTTP_302_FOUND)
+
+    if not await _is_trip_member(session, trip_id, user.id):
+        return RedirectResponse("/dashboard", status_code=status.HTTP_302_FOUND)
+
+    photo = await session.get(Photo, photo_id)
+    if not photo or photo.trip_id != trip_id:
+        return RedirectResponse(f"/trip/{trip_id}/gallery", status_code=status.HTTP_302_FOUND)
+
+    filename = photo.original_filename or photo.filename
+    download_name = f"{photo.uploaded_at:%Y-%m-%d_%H%M%S}_{photo.id}{Path(filename).suffix.lower()}"
+    if blob_sha(filename) and not storage.is_local:
+        url = storage.presign_get(blob_key(filename), filename=download_name)
+        return RedirectResponse(url, status_code=status.HTTP_302_FOUND)
+    file_path = photo_path(trip_id, filename)
+    if not file_path.is_file():
+        return RedirectResponse(f"/trip/{trip_id}/gallery", status_code=status.HTTP_302_FOUND)
+    return media_response(request, file_path, cache_control="private, no-cache", filename=download_name)
 
 
 @router.post("/trip/{trip_id}/photo/{photo_id}/delete")
@@ -206,9 +1131,23 @@ async def delete_photo(
     if photo.user_id != user.id:
         return RedirectResponse(f"/trip/{trip_id}/gallery", status_code=status.HTTP_302_FOUND)
 
+    await session.execute(delete(DriveSyncJob).where(DriveSyncJob.photo_id == photo.id))
+    await release_bytes(session, trip_id, photo.user_id, photo.size_bytes)
+
+    if blob_sha(photo.filename):
+        # Shared files: only the last reference removes one (and its thumbnails).
+        filenames = [f for f in (photo.filename, photo.original_filename) if f]
+        orphaned = [f for f in filenames if await release(session, f)]
+        await session.delete(photo)
+        await session.commit()
+        for filename in orphaned:
+            await remove_files(filename)
+        return RedirectResponse(f"/trip/{trip_id}/gallery", status_code=status.HTTP_302_FOUND)
+
     file_path = UPLOADS_DIR / str(trip_id) / photo.filename
     if file_path.exists():
         file_path.unlink()
+    remove_thumbnails(file_path, thumbnail_widths(photo))
 
     await session.delete(photo)
     await session.commit()
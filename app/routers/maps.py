@@ -1,14 +1,22 @@
-from fastapi import APIRouter, Request, Depends, status
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import APIRouter, Request, Depends, status, BackgroundTasks
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, FileResponse, Response
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
 from app.database import get_session
-from app.models import User, Trip, TripUserLink
+from app.models import User, Trip, TripUserLink, ItineraryItem
 from app.auth_utils import get_current_user
 from app.config import settings
+from app.recommendation_cache import RecommendationCache, EMPTY_RECOMMENDATIONS
+from app.llm_executor import llm_executor
+from app.json_stream import JSONArrayStreamParser
+from app.gazetteer import gazetteer
+from app.spatial import find_nearby
+from app.routing import routing, GreatCircleProvider, RoutingError
+from app.tile_cache import tile_cache, TileUnavailable
+from app.geocoding import claim_geocode_retry, get_cached_coordinates, geocode_many, geocode_trip_itinerary
 from pathlib import Path
-import httpx
+import asyncio
 import google.generativeai as genai
 import json
 import logging
@@ -19,77 +27,40 @@ logger = logging.getLogger(__name__)
 if settings.gemini_api_key:
     genai.configure(api_key=settings.gemini_api_key)
 
+GEMINI_MODEL = 'gemini-2.5-flash'
+
 router = APIRouter()
 templates = Jinja2Templates(directory=Path(__file__).parent.parent / "templates")
 
-CITY_COORDS = {
-    "goa": (15.2993, 74.1240),
-    "delhi": (28.6139, 77.2090),
-    "mumbai": (19.0760, 72.8777),
-    "jaipur": (26.9124, 75.7873),
-    "bangalore": (12.9716, 77.5946),
-    "bengaluru": (12.9716, 77.5946),
-    "kerala": (10.8505, 76.2711),
-    "chennai": (13.0827, 80.2707),
-    "kolkata": (22.5726, 88.3639),
-    "hyderabad": (17.3850, 78.4867),
-    "agra": (27.1767, 78.0081),
-    "varanasi": (25.3176, 82.9739),
-    "manali": (32.2396, 77.1887),
-    "shimla": (31.1048, 77.1734),
-    "ooty": (11.4102, 76.6950),
-    "mysore": (12.2958, 76.6394),
-    "pondicherry": (11.9416, 79.8083),
-    "coorg": (12.3375, 75.8069),
-}
-
-
-async def get_coordinates_async(query: str):
-    """Get coordinates using OpenStreetMap Nominatim API (async)."""
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            url = "https://nominatim.openstreetmap.org/search"
-            params = {"q": query, "format": "json", "limit": 1}
-            headers = {'User-Agent': 'GojoTripPlanner/2.0 (contact@gojotrips.com)'}
-            response = await client.get(url, params=params, headers=headers)
-            data = response.json()
-            if data:
-                return float(data[0]['lat']), float(data[0]['lon'])
-    except Exception as e:
-        logger.error(f"Geocoding error for {query}: {e}")
+DEFAULT_MAP_CENTER = (20.5937, 78.9629)  # India
+OSM_TILE_URL = "https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
+TILE_PROXY_URL = "/tiles/{z}/{x}/{y}.png"
 
-    query_lower = query.lower().strip()
-    for city, coords in CITY_COORDS.items():
-        if city in query_lower:
-            return coords
-    return None
+def _get_model(model=None):
+    """Return the injected model client (tests) or a real Gemini model."""
+    return model or genai.GenerativeModel(GEMINI_MODEL)
 
 
-async def get_osrm_route_async(start_coords, end_coords):
-    """Get route geometry from OSRM (async)."""
-    try:
-        start_str = f"{start_coords[1]},{start_coords[0]}"
-        end_str = f"{end_coords[1]},{end_coords[0]}"
-        url = f"http://router.project-osrm.org/route/v1/driving/{start_str};{end_str}?overview=full&geometries=geojson"
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.get(url)
-            data = response.json()
-            if data.get("code") == "Ok":
-                route_coords = data["routes"][0]["geometry"]["coordinates"]
-                return [(lat, lon) for lon, lat in route_coords]
-    except Exception as e:
-        logger.error(f"OSRM Routing error: {e}")
-    return [start_coords, end_coords]
+def _parse_json_response(text: str):
+    """Parse a Gemini JSON reply, tolerating a surrounding markdown code fence."""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+        if text.endswith("```"):
+            text = text[:-3]
+    elif text.startswith("```"):
+        text = text[3:]
+        if text.endswith("```"):
+            text = text[:-3]
+    return json.loads(text.strip())
 
 
-def get_gemini_recommendations(destination: str):
-    """Get travel recommendations using Gemini API (sync, called in thread pool)."""
-    if not settings.gemini_api_key:
-        return {"hotels": [], "restaurants": [], "attractions": [], "travel_tips": []}
+def fetch_gemini_recommendations(destination: str, model=None):
+    """Get travel recommendations from Gemini (sync). Raises on upstream errors."""
+    if not settings.gemini_api_key and model is None:
+        return dict(EMPTY_RECOMMENDATIONS)
 
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""
+    prompt = f"""
 Act as an expert travel guide. For the destination "{destination}", provide accurate, real top recommendations.
 
 Return ONLY a raw JSON object with this exact structure (no markdown, no backticks, no comments):
@@ -109,33 +80,22 @@ Return ONLY a raw JSON object with this exact structure (no markdown, no backtic
 }}
 Provide 5 items per category. Use real, well-known places. Be accurate and specific.
 """
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-
-        if text.startswith("```json"):
-            text = text[7:]
-            if text.endswith("```"):
-                text = text[:-3]
-        elif text.startswith("```"):
-            text = text[3:]
-            if text.endswith("```"):
-                text = text[:-3]
-
-        return json.loads(text.strip())
+    response = _get_model(model).generate_content(prompt)
+    return _parse_json_response(response.text)
+
+
+def get_gemini_recommendations(destination: str, model=None):
+    """Get travel recommendations using Gemini API (sync, called in thread pool)."""
+    try:
+        return fetch_gemini_recommendations(destination, model)
     except Exception as e:
         logger.error(f"Gemini API error: {e}")
-        return {"hotels": [], "restaurants": [], "attractions": [], "travel_tips": []}
-
+        return dict(EMPTY_RECOMMENDATIONS)
 
-def get_gemini_itinerary(destination: str, duration: int, start_location: str = None):
-    """Get AI-generated itinerary suggestions using Gemini API."""
-    if not settings.gemini_api_key:
-        return []
 
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        start_info = f" starting from {start_location}" if start_location else ""
-        prompt = f"""
+def _itinerary_prompt(destination: str, duration: int, start_location: str = None) -> str:
+    start_info = f" starting from {start_location}" if start_location else ""
+    return f"""
 Act as an expert travel planner. Create a detailed, accurate {duration}-day itinerary for a trip to "{destination}"{start_info}.
 
 Return ONLY a raw JSON array (no markdown, no backticks):
@@ -158,24 +118,47 @@ Return ONLY a raw JSON array (no markdown, no backticks):
 Categories: Sightseeing, Food, Hotel, Transport, Activity, Shopping, Nature, Culture
 Include 4-5 items per day. Use real, specific place names. Make it practical and accurate.
 """
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-
-        if text.startswith("```json"):
-            text = text[7:]
-            if text.endswith("```"):
-                text = text[:-3]
-        elif text.startswith("```"):
-            text = text[3:]
-            if text.endswith("```"):
-                text = text[:-3]
-
-        return json.loads(text.strip())
+
+
+def fetch_gemini_itinerary(destination: str, duration: int, start_location: str = None, model=None):
+    """Get an AI-generated itinerary from Gemini (sync). Raises on upstream errors."""
+    if not settings.gemini_api_key and model is None:
+        return []
+
+    prompt = _itinerary_prompt(destination, duration, start_location)
+    response = _get_model(model).generate_content(prompt)
+    return _parse_json_response(response.text)
+
+
+def stream_gemini_itinerary(destination: str, duration: int, start_location: str = None, model=None):
+    """Yield itinerary day objects as soon as Gemini finishes each one (sync generator)."""
+    if not settings.gemini_api_key and model is None:
+        return
+
+    prompt = _itinerary_prompt(destination, duration, start_location)
+    parser = JSONArrayStreamParser()
+    for chunk in _get_model(model).generate_content(prompt, stream=True):
+        yield from parser.feed(chunk.text)
+
+
+def get_gemini_itinerary(destination: str, duration: int, start_location: str = None, model=None):
+    """Get AI-generated itinerary suggestions using Gemini API."""
+    try:
+        return fetch_gemini_itinerary(destination, duration, start_location, model)
     except Exception as e:
         logger.error(f"Gemini itinerary error: {e}")
         return []
 
 
+async def _load_recommendations(destination: str) -> dict:
+    if not settings.gemini_api_key:
+        return dict(EMPTY_RECOMMENDATIONS)
+    return await llm_executor.run(fetch_gemini_recommendations, destination)
+
+
+recommendation_cache = RecommendationCache(loader=_load_recommendations)
+
+
 @router.get("/maps", response_class=HTMLResponse)
 async def maps_root(
     request: Request,
@@ -197,7 +180,7 @@ async def maps_root(
     return templates.TemplateResponse("map.html", {
         "request": request, "user": user, "trip": None,
         "start_coords": None, "destination_coords": [20.5937, 78.9629],
-        "route_path": [], "recommendations": {"hotels": [], "restaurants": [], "attractions": [], "travel_tips": []}
+        "route_path": [], "recommendations": EMPTY_RECOMMENDATIONS
     })
 
 
@@ -226,33 +209,254 @@ async def trip_map(
     if not link_result.scalar_one_or_none():
         return RedirectResponse("/dashboard", status_code=302)
 
-    destination_coords = await get_coordinates_async(trip.destination)
-    start_coords = await get_coordinates_async(trip.start_location) if trip.start_location else None
-
-    if not destination_coords:
-        destination_coords = (20.5937, 78.9629)
+    # Render immediately from caches only; route and recommendations that
+    # aren't cached yet are fetched by the page via the APIs below.
+    destination_coords = get_cached_coordinates(trip.destination)
+    start_coords = get_cached_coordinates(trip.start_location) if trip.start_location else None
 
     route_path = []
-    if start_coords:
-        route_path = await get_osrm_route_async(start_coords, destination_coords)
+    if start_coords and destination_coords:
+        cached_route = routing.get_cached([start_coords, destination_coords])
+        route_path = cached_route["path"] if cached_route else []
 
-    import asyncio
-    recommendations = await asyncio.get_event_loop().run_in_executor(
-        None, get_gemini_recommendations, trip.destination
-    )
+    recommendations = await recommendation_cache.peek(trip.destination)
 
     return templates.TemplateResponse("map.html", {
         "request": request,
         "user": user,
         "trip": trip,
         "start_coords": list(start_coords) if start_coords else None,
-        "destination_coords": list(destination_coords),
+        "destination_coords": list(destination_coords or DEFAULT_MAP_CENTER),
+        "destination_resolved": destination_coords is not None,
         "route_path": [[lat, lon] for lat, lon in route_path],
         "recommendations": recommendations,
         "maps_api_key": settings.google_maps_api_key,
+        "tile_url": TILE_PROXY_URL if settings.tile_proxy_enabled else OSM_TILE_URL,
     })
 
 
+@router.get("/api/trip/{trip_id}/route")
+async def get_trip_route(
+    trip_id: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """API: Geocode the trip's endpoints and route between them within a deadline."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    trip_statement = select(Trip).where(Trip.id == trip_id)
+    trip_result = await session.execute(trip_statement)
+    trip = trip_result.scalar_one_or_none()
+
+    if not trip:
+        return JSONResponse({"error": "Trip not found"}, status_code=404)
+
+    link_statement = select(TripUserLink).where(
+        TripUserLink.trip_id == trip_id,
+        TripUserLink.user_id == user.id
+    )
+    link_result = await session.execute(link_statement)
+    if not link_result.scalar_one_or_none():
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + settings.map_deadline_seconds
+
+    # The two geocodes are independent — run them side by side.
+    destination_coords, start_coords = await geocode_many(
+        [trip.destination, trip.start_location], timeout=settings.map_deadline_seconds
+    )
+
+    route = None
+    if start_coords and destination_coords:
+        points = [start_coords, destination_coords]
+        try:
+            route = await asyncio.wait_for(
+                routing.route(points), timeout=max(deadline - loop.time(), 0.1),
+            )
+        except (asyncio.TimeoutError, RoutingError):
+            logger.warning(f"Route for trip {trip_id} missed the map deadline")
+            route = await GreatCircleProvider().route(points)
+
+    return JSONResponse({
+        "start_coords": list(start_coords) if start_coords else None,
+        "destination_coords": list(destination_coords) if destination_coords else None,
+        "route_path": [[lat, lon] for lat, lon in route["path"]] if route else [],
+        "distance_km": round(route["distance_m"] / 1000, 1) if route else None,
+        "duration_min": round(route["duration_s"] / 60) if route else None,
+        "route_provider": route["provider"] if route else None,
+    })
+
+
+@router.get("/api/trip/{trip_id}/day/{day_number}/legs")
+async def get_day_legs(
+    trip_id: int,
+    day_number: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """API: Travel distance/time between a day's geocoded stops, from one matrix request."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    link_statement = select(TripUserLink).where(
+        TripUserLink.trip_id == trip_id,
+        TripUserLink.user_id == user.id
+    )
+    link_result = await session.execute(link_statement)
+    if not link_result.scalar_one_or_none():
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    items_statement = select(ItineraryItem).where(
+        ItineraryItem.trip_id == trip_id,
+        ItineraryItem.day_number == day_number,
+        ItineraryItem.latitude.is_not(None),
+    ).order_by(ItineraryItem.time, ItineraryItem.id)
+    items_result = await session.execute(items_statement)
+    stops = items_result.scalars().all()
+
+    stop_list = [
+        {"id": s.id, "time": s.time, "activity": s.activity, "lat": s.latitude, "lon": s.longitude}
+        for s in stops
+    ]
+    if len(stops) < 2:
+        return JSONResponse({"stops": stop_list, "legs": [], "matrix": None})
+
+    points = [(s.latitude, s.longitude) for s in stops]
+    try:
+        matrix = await asyncio.wait_for(routing.matrix(points), timeout=settings.map_deadline_seconds)
+    except (asyncio.TimeoutError, RoutingError):
+        logger.warning(f"Day {day_number} matrix for trip {trip_id} missed the map deadline")
+        matrix = await GreatCircleProvider().matrix(points)
+
+    legs = []
+    for i in range(len(stops) - 1):
+        distance = matrix["distances_m"][i][i + 1] if matrix["distances_m"] else None
+        duration = matrix["durations_s"][i][i + 1] if matrix["durations_s"] else None
+        legs.append({
+            "from_id": stops[i].id,
+            "to_id": stops[i + 1].id,
+            "distance_km": round(distance / 1000, 2) if distance is not None else None,
+            "duration_min": round(duration / 60) if duration is not None else None,
+        })
+    return JSONResponse({"stops": stop_list, "legs": legs, "matrix": matrix})
+
+
+@router.get("/api/trip/{trip_id}/markers")
+async def get_trip_markers(
+    trip_id: int,
+    background_tasks: BackgroundTasks,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """API: Precomputed map markers for every geocoded itinerary stop, in one response."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    link_statement = select(TripUserLink).where(
+        TripUserLink.trip_id == trip_id,
+        TripUserLink.user_id == user.id
+    )
+    link_result = await session.execute(link_statement)
+    if not link_result.scalar_one_or_none():
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    items_statement = select(ItineraryItem).where(
+        ItineraryItem.trip_id == trip_id
+    ).order_by(ItineraryItem.day_number, ItineraryItem.time)
+    items_result = await session.execute(items_statement)
+    items = items_result.scalars().all()
+
+    # Backfill stops that predate geocoding (or failed last time) in the background.
+    pending = sum(1 for i in items if i.location and i.location != i.geocoded_location)
+    if pending and claim_geocode_retry(trip_id):
+        background_tasks.add_task(geocode_trip_itinerary, trip_id)
+
+    markers = [
+        {
+            "id": i.id,
+            "day": i.day_number,
+            "time": i.time,
+            "activity": i.activity,
+            "location": i.location,
+            "category": i.category,
+            "lat": i.latitude,
+            "lon": i.longitude,
+        }
+        for i in items if i.latitude is not None and i.longitude is not None
+    ]
+    return JSONResponse({"markers": markers, "pending": pending})
+
+
+@router.get("/api/trip/{trip_id}/nearby")
+async def get_nearby_places(
+    trip_id: int,
+    lat: float,
+    lon: float,
+    background_tasks: BackgroundTasks,
+    radius: float = 2.0,
+    limit: int = 20,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """API: Itinerary stops and booked places within `radius` km of a point, nearest first."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    link_statement = select(TripUserLink).where(
+        TripUserLink.trip_id == trip_id,
+        TripUserLink.user_id == user.id
+    )
+    link_result = await session.execute(link_statement)
+    if not link_result.scalar_one_or_none():
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return JSONResponse({"error": "Invalid coordinates"}, status_code=400)
+
+    radius = max(0.05, min(radius, 50.0))
+    places = await find_nearby(session, trip_id, lat, lon, radius, limit=max(1, min(limit, 100)))
+    if not places and claim_geocode_retry(trip_id):
+        # Trips geocoded before the index existed get indexed on first use.
+        background_tasks.add_task(geocode_trip_itinerary, trip_id)
+    return JSONResponse({"places": places, "radius_km": radius})
+
+
+@router.get("/tiles/{z}/{x}/{y}.png")
+async def get_map_tile(
+    z: int,
+    x: int,
+    y: int,
+    user: User = Depends(get_current_user),
+):
+    """Map tile through the on-disk cache (only when tile_proxy_enabled)."""
+    if not settings.tile_proxy_enabled:
+        return Response(status_code=404)
+    if not user:
+        return Response(status_code=401)
+    if not tile_cache.valid(z, x, y):
+        return Response(status_code=404)
+    try:
+        path = await tile_cache.get(z, x, y)
+    except TileUnavailable as e:
+        logger.warning(f"Tile {z}/{x}/{y} unavailable: {e}")
+        return Response(status_code=502)
+    return FileResponse(path, media_type="image/png", headers={"Cache-Control": "public, max-age=86400"})
+
+
+@router.get("/api/destinations/autocomplete")
+async def autocomplete_destinations(
+    q: str = "",
+    limit: int = 8,
+    user: User = Depends(get_current_user),
+):
+    """API: Destination suggestions from the offline gazetteer (no network calls)."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return JSONResponse(gazetteer.search(q, limit=max(1, min(limit, 20))))
+
+
 @router.get("/api/trip/{trip_id}/recommendations")
 async def get_recommendations(
     trip_id: int,
@@ -278,10 +482,7 @@ async def get_recommendations(
     if not link_result.scalar_one_or_none():
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
-    import asyncio
-    recommendations = await asyncio.get_event_loop().run_in_executor(
-        None, get_gemini_recommendations, trip.destination
-    )
+    recommendations = await recommendation_cache.get(trip.destination)
     return JSONResponse(recommendations)
 
 
@@ -312,8 +513,87 @@ async def get_ai_itinerary(
 
     duration = (trip.end_date - trip.start_date).days + 1
 
-    import asyncio
-    itinerary = await asyncio.get_event_loop().run_in_executor(
-        None, get_gemini_itinerary, trip.destination, duration, trip.start_location
-    )
+    try:
+        itinerary = await llm_executor.run(
+            fetch_gemini_itinerary, trip.destination, duration, trip.start_location
+        )
+    except Exception as e:
+        # Includes timeouts and an open circuit breaker — fail fast to empty.
+        logger.error(f"Gemini itinerary error: {e!r}")
+        itinerary = []
     return JSONResponse(itinerary)
+
+
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.get("/api/trip/{trip_id}/ai-itinerary/stream")
+async def stream_ai_itinerary(
+    trip_id: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """API: Stream AI itinerary days as server-sent events while Gemini generates them."""
+    if not user:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    trip_statement = select(Trip).where(Trip.id == trip_id)
+    trip_result = await session.execute(trip_statement)
+    trip = trip_result.scalar_one_or_none()
+
+    if not trip:
+        return JSONResponse({"error": "Trip not found"}, status_code=404)
+
+    link_statement = select(TripUserLink).where(
+        TripUserLink.trip_id == trip_id,
+        TripUserLink.user_id == user.id
+    )
+    link_result = await session.execute(link_statement)
+    if not link_result.scalar_one_or_none():
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    duration = (trip.end_date - trip.start_date).days + 1
+    days = llm_executor.stream(
+        stream_gemini_itinerary, trip.destination, duration, trip.start_location
+    )
+
+    async def events():
+        # Open the stream right away so proxies see bytes before Gemini does.
+        yield ": stream open\n\n"
+        count = 0
+        next_day = asyncio.ensure_future(days.__anext__())
+        try:
+            while True:
+                done, _ = await asyncio.wait({next_day}, timeout=SSE_HEARTBEAT_SECONDS)
+                if not done:
+                    yield ": keep-alive\n\n"
+                    continue
+                try:
+                    day = next_day.result()
+                except StopAsyncIteration:
+                    break
+                count += 1
+                yield _sse("day", day)
+                next_day = asyncio.ensure_future(days.__anext__())
+            yield _sse("done", {"days": count})
+        except Exception as e:
+            logger.error(f"Gemini itinerary stream error: {e!r}")
+            yield _sse("error", {"days": count})
+        finally:
+            if not next_day.done():
+                next_day.cancel()
+                try:
+                    await next_day
+                except (asyncio.CancelledError, Exception):
+                    pass
+            await days.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
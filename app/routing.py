@@ -0,0 +1,183 @@
+"""
+Routing providers for the trip map.
+
+`RoutingProvider` has two calls: `route` (road geometry plus distance and
+duration through a list of points) and `matrix` (distances and durations
+between every pair of points, in one request). Implementations:
+
+  - `OSRMProvider`: any OSRM HTTP server. The public demo server and a
+    self-hosted instance (`osrm_url`) are just two instances of it; pointing
+    `osrm_url` at a local stub server is how tests exercise the HTTP path.
+  - `GreatCircleProvider`: offline estimate from haversine distance, a road
+    detour factor and an average speed. Never fails.
+
+`RoutingChain` tries providers in order and caches real (non-estimated)
+routes, so an OSRM outage degrades to an estimate instead of an error.
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+
+import httpx
+
+from app.config import settings
+from app.spatial import haversine_km
+
+logger = logging.getLogger(__name__)
+
+Coords = Tuple[float, float]
+
+
+class RoutingError(Exception):
+    """A provider could not answer; the chain moves on to the next one."""
+
+
+class RoutingProvider(ABC):
+    """Interface: coordinates are (lat, lon) everywhere."""
+
+    name = "base"
+
+    @abstractmethod
+    async def route(self, points: Sequence[Coords]) -> Dict:
+        """Return {"path", "distance_m", "duration_s", "provider", "estimated"}."""
+
+    @abstractmethod
+    async def matrix(self, points: Sequence[Coords]) -> Dict:
+        """Return {"distances_m", "durations_s", "provider", "estimated"}; N x N lists."""
+
+
+class OSRMProvider(RoutingProvider):
+    def __init__(self, base_url: str, name: str = "osrm", profile: str = "driving",
+                 timeout: float = settings.routing_timeout_seconds):
+        self.base_url = base_url.rstrip("/")
+        self.name = name
+        self.profile = profile
+        self.timeout = timeout
+
+    def _coords(self, points: Sequence[Coords]) -> str:
+        return ";".join(f"{lon},{lat}" for lat, lon in points)
+
+    async def _get(self, service: str, points: Sequence[Coords], params: Dict) -> Dict:
+        url = f"{self.base_url}/{service}/v1/{self.profile}/{self._coords(points)}"
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.get(url, params=params)
+                data = response.json()
+        except Exception as e:
+            raise RoutingError(f"{self.name} {service} request failed: {e}") from e
+        if data.get("code") != "Ok":
+            raise RoutingError(f"{self.name} {service} answered {data.get('code')}: {data.get('message')}")
+        return data
+
+    async def route(self, points: Sequence[Coords]) -> Dict:
+        data = await self._get("route", points, {"overview": "full", "geometries": "geojson"})
+        best = data["routes"][0]
+        return {
+            "path": [(lat, lon) for lon, lat in best["geometry"]["coordinates"]],
+            "distance_m": best["distance"],
+            "duration_s": best["duration"],
+            "provider": self.name,
+            "estimated": False,
+        }
+
+    async def matrix(self, points: Sequence[Coords]) -> Dict:
+        data = await self._get("table", points, {"annotations": "duration,distance"})
+        return {
+            "distances_m": data.get("distances"),
+            "durations_s": data.get("durations"),
+            "provider": self.name,
+            "estimated": False,
+        }
+
+
+class GreatCircleProvider(RoutingProvider):
+    name = "estimate"
+
+    def __init__(self, speed_kmh: float = settings.routing_estimate_speed_kmh,
+                 detour_factor: float = settings.routing_estimate_detour_factor):
+        self.speed_kmh = speed_kmh
+        self.detour_factor = detour_factor
+
+    def _road_km(self, origin: Coords, targets: Sequence[Coords]) -> List[float]:
+        km = haversine_km(origin[0], origin[1], [t[0] for t in targets], [t[1] for t in targets])
+        return (km * self.detour_factor).tolist()
+
+    async def route(self, points: Sequence[Coords]) -> Dict:
+        legs_km = [self._road_km(a, [b])[0] for a, b in zip(points, points[1:])]
+        distance_m = sum(legs_km) * 1000
+        return {
+            "path": list(points),
+            "distance_m": distance_m,
+            "duration_s": distance_m / (self.speed_kmh / 3.6),
+            "provider": self.name,
+            "estimated": True,
+        }
+
+    async def matrix(self, points: Sequence[Coords]) -> Dict:
+        distances = [[km * 1000 for km in self._road_km(p, points)] for p in points]
+        mps = self.speed_kmh / 3.6
+        return {
+            "distances_m": distances,
+            "durations_s": [[d / mps for d in row] for row in distances],
+            "provider": self.name,
+            "estimated": True,
+        }
+
+
+class RoutingChain:
+    """Try each provider in turn; cache real routes by rounded endpoints."""
+
+    _CACHE_MAX = 2000
+
+    def __init__(self, providers: Sequence[RoutingProvider]):
+        self.providers = list(providers)
+        self._cache: Dict[tuple, Dict] = {}
+
+    @staticmethod
+    def _key(points: Sequence[Coords]) -> tuple:
+        # ~100m rounding so tiny geocoder differences share an entry.
+        return tuple((round(lat, 3), round(lon, 3)) for lat, lon in points)
+
+    def get_cached(self, points: Sequence[Coords]) -> Optional[Dict]:
+        """Return a previously fetched route without any I/O."""
+        if len(points) < 2 or not all(points):
+            return None
+        return self._cache.get(self._key(points))
+
+    async def route(self, points: Sequence[Coords]) -> Dict:
+        cached = self.get_cached(points)
+        if cached:
+            return cached
+        result = await self._first("route", points)
+        if not result["estimated"]:
+            if len(self._cache) >= self._CACHE_MAX:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[self._key(points)] = result
+        return result
+
+    async def matrix(self, points: Sequence[Coords]) -> Dict:
+        return await self._first("matrix", points)
+
+    async def _first(self, call: str, points: Sequence[Coords]) -> Dict:
+        for provider in self.providers:
+            try:
+                return await getattr(provider, call)(points)
+            except RoutingError as e:
+                logger.warning(str(e))
+            except Exception as e:
+                logger.error(f"Routing provider {provider.name} {call} error: {e}")
+        raise RoutingError(f"No routing provider could answer {call}")
+
+
+def build_routing_chain() -> RoutingChain:
+    """Self-hosted OSRM (if configured), then public OSRM (if allowed), then the estimate."""
+    providers: List[RoutingProvider] = []
+    if settings.osrm_url:
+        providers.append(OSRMProvider(settings.osrm_url, name="osrm_self_hosted"))
+    if settings.osrm_public_enabled:
+        providers.append(OSRMProvider(settings.osrm_public_url, name="osrm_public"))
+    providers.append(GreatCircleProvider())
+    return RoutingChain(providers)
+
+
+routing = build_routing_chain()
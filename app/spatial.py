@@ -0,0 +1,192 @@
+"""
+Spatial index for "what's near here" queries over a trip's geocoded places.
+
+Every geocoded itinerary stop and document location gets a `GeoPlace` row
+carrying a geohash. A radius query picks the geohash precision whose cells
+are at least as large as the radius, so the 3x3 block of cells around the
+query point covers the whole circle; the nine cells become nine indexed
+range scans on (trip_id, geohash). The candidates are then ranked by exact
+great-circle distance, computed for the whole batch at once with NumPy.
+
+The geohash index lives in the main database (SQLite locally, PostgreSQL on
+Render), so the same code path works in both.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+
+import numpy as np
+from sqlalchemy import and_, delete, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.models import GeoPlace
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 9  # ~5m cells; shorter prefixes are used for queries
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+# Smaller side (km, at the equator) of a geohash cell per precision.
+_CELL_KM = {1: 4992.6, 2: 624.1, 3: 156.0, 4: 19.5, 5: 4.89, 6: 0.61, 7: 0.153, 8: 0.019}
+
+
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """Return (min_lat, max_lat, min_lon, max_lon) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for c in geohash:
+        value = _DECODE[c]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def geohash_neighbors(geohash: str) -> List[str]:
+    """The cell itself plus its eight neighbours (fewer at the poles)."""
+    min_lat, max_lat, min_lon, max_lon = geohash_bounds(geohash)
+    lat, lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+    dlat, dlon = max_lat - min_lat, max_lon - min_lon
+    cells = []
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            n_lat = lat + i * dlat
+            if not -90 <= n_lat <= 90:
+                continue
+            n_lon = (lon + j * dlon + 180) % 360 - 180
+            cell = geohash_encode(n_lat, n_lon, len(geohash))
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def _prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest geohash string greater than every string starting with `prefix`."""
+    chars = list(prefix)
+    while chars:
+        idx = _DECODE[chars[-1]]
+        if idx + 1 < len(_BASE32):
+            chars[-1] = _BASE32[idx + 1]
+            return "".join(chars)
+        chars.pop()
+    return None
+
+
+def _precision_for_radius(radius_km: float, lat: float) -> int:
+    """Longest geohash whose cells are at least `radius_km` wide at this latitude."""
+    # Cells narrow east-west towards the poles.
+    shrink = max(math.cos(math.radians(min(abs(lat), 89.0))), 0.01)
+    for precision in range(8, 0, -1):
+        if _CELL_KM[precision] * shrink >= radius_km:
+            return precision
+    return 1
+
+
+def haversine_km(lat: float, lon: float, lats: Sequence[float], lons: Sequence[float]) -> np.ndarray:
+    """Vectorized great-circle distance from one point to many, in km."""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+async def replace_places(
+    session: AsyncSession,
+    trip_id: int,
+    source: str,
+    places: Iterable[Tuple[int, str, Optional[str], float, float]],
+):
+    """Replace all `source` places of a trip with (source_id, name, location, lat, lon) rows. Caller commits."""
+    await session.execute(
+        delete(GeoPlace).where(GeoPlace.trip_id == trip_id, GeoPlace.source == source)
+    )
+    for source_id, name, location, lat, lon in places:
+        session.add(GeoPlace(
+            trip_id=trip_id,
+            source=source,
+            source_id=source_id,
+            name=name,
+            location=location,
+            latitude=lat,
+            longitude=lon,
+            geohash=geohash_encode(lat, lon),
+        ))
+
+
+async def remove_place(session: AsyncSession, source: str, source_id: int):
+    """Drop the index entry for a deleted itinerary item or document. Caller commits."""
+    await session.execute(
+        delete(GeoPlace).where(GeoPlace.source == source, GeoPlace.source_id == source_id)
+    )
+
+
+async def find_nearby(
+    session: AsyncSession,
+    trip_id: int,
+    lat: float,
+    lon: float,
+    radius_km: float,
+    limit: int = 20,
+) -> List[Dict]:
+    """Places of a trip within `radius_km` of (lat, lon), nearest first."""
+    precision = _precision_for_radius(radius_km, lat)
+    ranges = []
+    for cell in geohash_neighbors(geohash_encode(lat, lon, precision)):
+        upper = _prefix_upper_bound(cell)
+        cond = GeoPlace.geohash >= cell
+        ranges.append(and_(cond, GeoPlace.geohash < upper) if upper else cond)
+
+    result = await session.execute(
+        select(GeoPlace).where(GeoPlace.trip_id == trip_id, or_(*ranges))
+    )
+    candidates = result.scalars().all()
+    if not candidates:
+        return []
+
+    distances = haversine_km(
+        lat, lon,
+        [p.latitude for p in candidates],
+        [p.longitude for p in candidates],
+    )
+    order = np.argsort(distances)
+    nearby = []
+    for idx in order:
+        distance = float(distances[idx])
+        if distance > radius_km or len(nearby) >= limit:
+            break
+        place = candidates[idx]
+        nearby.append({
+            "source": place.source,
+            "source_id": place.source_id,
+            "name": place.name,
+            "location": place.location,
+            "lat": place.latitude,
+            "lon": place.longitude,
+            "distance_km": round(distance, 3),
+        })
+    return nearby
@@ -420,14 +420,37 @@ const GojoApp = (function () {
                     <p style="color:var(--text-3);">Generating personalized itinerary...</p>
                 </div>
             `;
-            try {
-                const resp = await fetch(`/api/trip/${tripId}/ai-itinerary`);
-                if (!resp.ok) throw new Error('API error');
-                const days = await resp.json();
-                this._renderItinerary(container, days);
-            } catch (e) {
-                container.innerHTML = `<p style="color:var(--text-3);text-align:center;">Could not generate itinerary suggestions.</p>`;
+            if (!window.EventSource) {
+                try {
+                    const resp = await fetch(`/api/trip/${tripId}/ai-itinerary`);
+                    if (!resp.ok) throw new Error('API error');
+                    const days = await resp.json();
+                    this._renderItinerary(container, days);
+                } catch (e) {
+                    container.innerHTML = `<p style="color:var(--text-3);text-align:center;">Could not generate itinerary suggestions.</p>`;
+                }
+                return;
             }
+
+            // Stream days over SSE so day 1 shows while the rest is generated
+            await new Promise(resolve => {
+                const days = [];
+                const source = new EventSource(`/api/trip/${tripId}/ai-itinerary/stream`);
+                const finish = () => { source.close(); resolve(); };
+                source.addEventListener('day', (e) => {
+                    days.push(JSON.parse(e.data));
+                    this._renderItinerary(container, days, true);
+                });
+                source.addEventListener('done', () => {
+                    this._renderItinerary(container, days);
+                    finish();
+                });
+                source.onerror = () => {
+                    if (days.length) this._renderItinerary(container, days);
+                    else container.innerHTML = `<p style="color:var(--text-3);text-align:center;">Could not generate itinerary suggestions.</p>`;
+                    finish();
+                };
+            });
         },
 
         _render(container, data) {
@@ -508,7 +531,7 @@ const GojoApp = (function () {
             tabs.init();
         },
 
-        _renderItinerary(container, days) {
+        _renderItinerary(container, days, pending = false) {
             if (!days || !days.length) {
                 container.innerHTML = '<p style="color:var(--text-3);">Could not generate itinerary. Try again.</p>';
                 return;
@@ -540,7 +563,11 @@ const GojoApp = (function () {
                         `).join('')}
                     </div>
                 </div>
-            `).join('');
+            `).join('') + (pending ? `
+                <div style="display:flex;align-items:center;gap:var(--space-2);color:var(--text-3);font-size:var(--text-sm);">
+                    <span class="spinner" style="width:14px;height:14px;border-width:2px;"></span> Planning the next day...
+                </div>
+            ` : '');
         },
 
         _esc(str) {
@@ -551,7 +578,7 @@ const GojoApp = (function () {
     // ===== Map (Leaflet) =====
     const mapModule = {
         map: null,
-        init(elementId, destCoords, startCoords, routePath, mapsApiKey) {
+        init(elementId, destCoords, startCoords, routePath, mapsApiKey, tileUrl) {
             if (!document.getElementById(elementId)) return;
             if (typeof L === 'undefined') { console.error('[Map] Leaflet not loaded'); return; }
 
@@ -561,12 +588,46 @@ const GojoApp = (function () {
                 zoomControl: true
             });
 
-            // Use OSM tiles (free, no API key)
-            L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+            // OSM tiles (free, no API key), directly or through our caching proxy
+            L.tileLayer(tileUrl || 'https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
                 attribution: '© <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors',
                 maxZoom: 19
             }).addTo(this.map);
 
+            this.layers = L.layerGroup().addTo(this.map);
+            this._draw(destCoords, startCoords, routePath);
+
+            // Resize fix for hidden containers
+            setTimeout(() => this.map.invalidateSize(), 300);
+        },
+
+        // Replace markers and route once they've been resolved server-side
+        setRoute(destCoords, startCoords, routePath) {
+            if (!this.map) return;
+            this.layers.clearLayers();
+            this._draw(destCoords, startCoords, routePath);
+            if (!(routePath && routePath.length > 1)) this.map.setView(destCoords, startCoords ? 7 : 11);
+        },
+
+        // Numbered itinerary stops, one marker per geocoded item
+        setMarkers(markers) {
+            if (!this.map || !markers || !markers.length) return;
+            if (this.stops) this.stops.clearLayers();
+            else this.stops = L.layerGroup().addTo(this.map);
+            markers.forEach(m => {
+                const icon = L.divIcon({
+                    html: `<div style="background:#F59E0B;color:white;min-width:20px;height:20px;border-radius:10px;border:2px solid white;box-shadow:0 2px 6px rgba(0,0,0,0.3);font-size:11px;font-weight:700;display:flex;align-items:center;justify-content:center;padding:0 4px;">${m.day}</div>`,
+                    className: '',
+                    iconSize: [20, 20],
+                    iconAnchor: [10, 10]
+                });
+                L.marker([m.lat, m.lon], { icon })
+                  .addTo(this.stops)
+                  .bindPopup(`<b>Day ${m.day}${m.time ? ' · ' + recommendations._esc(m.time) : ''}</b><br>${recommendations._esc(m.activity)}<br><small>📍 ${recommendations._esc(m.location)}</small>`);
+            });
+        },
+
+        _draw(destCoords, startCoords, routePath) {
             // Destination marker
             const destIcon = L.divIcon({
                 html: '<div style="background:#4F46E5;width:16px;height:16px;border-radius:50%;border:3px solid white;box-shadow:0 2px 8px rgba(0,0,0,0.3);"></div>',
@@ -575,7 +636,7 @@ const GojoApp = (function () {
                 iconAnchor: [8, 8]
             });
             L.marker(destCoords, { icon: destIcon })
-              .addTo(this.map)
+              .addTo(this.layers)
               .bindPopup(`<b>📍 Destination</b>`)
               .openPopup();
 
@@ -588,7 +649,7 @@ const GojoApp = (function () {
                     iconAnchor: [7, 7]
                 });
                 L.marker(startCoords, { icon: startIcon })
-                  .addTo(this.map)
+                  .addTo(this.layers)
                   .bindPopup('<b>🟢 Start Location</b>');
             }
 
@@ -599,16 +660,13 @@ const GojoApp = (function () {
                     weight: 4,
                     opacity: 0.8,
                     dashArray: null
-                }).addTo(this.map);
+                }).addTo(this.layers);
 
                 const group = L.featureGroup();
                 if (startCoords) group.addLayer(L.marker(startCoords));
                 group.addLayer(L.marker(destCoords));
                 this.map.fitBounds(group.getBounds().pad(0.2));
             }
-
-            // Resize fix for hidden containers
-            setTimeout(() => this.map.invalidateSize(), 300);
         }
     };
 
@@ -696,6 +754,147 @@ const GojoApp = (function () {
         }
     };
 
+    // ===== Destination Autocomplete (offline gazetteer) =====
+    const placeAutocomplete = {
+        init() {
+            document.querySelectorAll('input[data-autocomplete="place"]').forEach((input, i) => {
+                const list = document.createElement('datalist');
+                list.id = `placeSuggestions${i}`;
+                input.setAttribute('list', list.id);
+                input.setAttribute('autocomplete', 'off');
+                input.after(list);
+
+                let timer = null;
+                input.addEventListener('input', () => {
+                    clearTimeout(timer);
+                    const q = input.value.trim();
+                    if (q.length < 2) return;
+                    timer = setTimeout(async () => {
+                        try {
+                            const resp = await fetch(`/api/destinations/autocomplete?q=${encodeURIComponent(q)}`);
+                            if (!resp.ok) return;
+                            const places = await resp.json();
+                            list.innerHTML = places.map(p => `<option value="${recommendations._esc(p.name)}, ${recommendations._esc(p.country)}"></option>`).join('');
+                        } catch (e) { /* suggestions are best-effort */ }
+                    }, 150);
+                });
+            });
+        }
+    };
+
+    // ===== Resumable Uploads (large videos over flaky connections) =====
+    const resumableUpload = {
+        CHUNK_SIZE: 5 * 1024 * 1024,
+        PARALLEL: 3,
+
+        async upload(file, tripId, caption, onProgress) {
+            const key = `gojo-upload:${tripId}:${file.name}:${file.size}:${file.lastModified}`;
+            let url = localStorage.getItem(key);
+            let received = [];
+
+            if (url) {
+                const head = await fetch(url, { method: 'HEAD' });
+                if (head.ok) received = this._parseRanges(head.headers.get('Upload-Ranges'));
+                else url = null;
+            }
+            if (!url) {
+                const meta = [`filename ${this._b64(file.name)}`];
+                if (caption) meta.push(`caption ${this._b64(caption)}`);
+                const resp = await fetch(`/trip/${tripId}/uploads/resumable`, {
+                    method: 'POST',
+                    headers: { 'Tus-Resumable': '1.0.0', 'Upload-Length': String(file.size), 'Upload-Metadata': meta.join(',') }
+                });
+                if (resp.status !== 201) throw new Error((await resp.json().catch(() => ({}))).error || 'Upload failed');
+                url = resp.headers.get('Location');
+                localStorage.setItem(key, url);
+            }
+
+            // Only send chunks the server doesn't already have
+            const chunks = [];
+            for (let start = 0; start < file.size; start += this.CHUNK_SIZE) {
+                const end = Math.min(start + this.CHUNK_SIZE, file.size);
+                if (!received.some(([s, e]) => s <= start && e >= end)) chunks.push([start, end]);
+            }
+            let done = file.size - chunks.reduce((n, [s, e]) => n + (e - s), 0);
+            onProgress?.(done / file.size);
+
+            let photoId = null;
+            const worker = async () => {
+                while (chunks.length) {
+                    const [start, end] = chunks.shift();
+                    const resp = await this._sendChunk(url, file, start, end);
+                    photoId = resp.headers.get('Upload-Photo-Id') || photoId;
+                    done += end - start;
+                    onProgress?.(done / file.size);
+                }
+            };
+            await Promise.all(Array.from({ length: this.PARALLEL }, worker));
+            localStorage.removeItem(key);
+            return photoId;
+        },
+
+        async _sendChunk(url, file, start, end, attempt = 0) {
+            try {
+                const resp = await fetch(url, {
+                    method: 'PATCH',
+                    headers: { 'Tus-Resumable': '1.0.0', 'Upload-Offset': String(start), 'Content-Type': 'application/offset+octet-stream' },
+                    body: file.slice(start, end)
+                });
+                if (resp.status === 204) return resp;
+                if (resp.status < 500) throw Object.assign(new Error(`Chunk rejected (${resp.status})`), { fatal: true });
+                throw new Error(`Chunk failed (${resp.status})`);
+            } catch (e) {
+                if (e.fatal || attempt >= 4) throw e;
+                await new Promise(r => setTimeout(r, 1000 * 2 ** attempt));
+                return this._sendChunk(url, file, start, end, attempt + 1);
+            }
+        },
+
+        _parseRanges(header) {
+            return (header || '').split(',').filter(Boolean).map(r => {
+                const [s, e] = r.split('-').map(Number);
+                return [s, e + 1];
+            });
+        },
+
+        _b64(str) {
+            return btoa(unescape(encodeURIComponent(str)));
+        }
+    };
+
+    // ===== Direct uploads (browser → object storage via presigned PUT) =====
+    const directUpload = {
+        // The whole file is read to hash it; bigger files use the resumable endpoint.
+        MAX_SIZE: 200 * 1024 * 1024,
+
+        async upload(file, tripId, caption) {
+            const sha256 = await this._sha256(file);
+            const start = await this._post(`/trip/${tripId}/uploads/direct`, { filename: file.name, size: file.size, sha256 });
+            if (!start.exists) {
+                const resp = await fetch(start.upload.url, { method: start.upload.method, headers: start.upload.headers, body: file });
+                if (!resp.ok) throw new Error(`Upload to storage failed (${resp.status})`);
+            }
+            const done = await this._post(`/trip/${tripId}/uploads/direct/complete`, { filename: file.name, sha256, caption, token: start.token });
+            return done.photo_id;
+        },
+
+        async _post(url, body) {
+            const resp = await fetch(url, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(body)
+            });
+            const data = await resp.json().catch(() => ({}));
+            if (!resp.ok) throw new Error(data.error || `Upload failed (${resp.status})`);
+            return data;
+        },
+
+        async _sha256(file) {
+            const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+            return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+        }
+    };
+
     // ===== Init =====
     function init() {
         // Prevent FOUC for theme
@@ -704,6 +903,7 @@ const GojoApp = (function () {
         tabs.init();
         lightbox.init();
         pwa.init();
+        placeAutocomplete.init();
 
         // Global click handlers
         document.addEventListener('click', (e) => {
@@ -727,7 +927,7 @@ const GojoApp = (function () {
 
     document.addEventListener('DOMContentLoaded', init);
 
-    return { theme, toast, modal, tabs, chat, push, pwa, recommendations, mapModule, lightbox, dragDrop };
+    return { theme, toast, modal, tabs, chat, push, pwa, recommendations, mapModule, lightbox, dragDrop, resumableUpload, directUpload };
 })();
 
 // ===== Global helpers =====
@@ -0,0 +1,317 @@
+"""
+Where uploaded blobs live.
+
+`StorageBackend` stores objects by key (`blobs/<aa>/<bb>/<sha><ext>` and the
+thumbnails next to them; see app/blob_store.py). Implementations:
+
+  - `LocalStorage`: files under `uploads/`. Objects can be served straight
+    from disk, so there are no presigned URLs; uploads and downloads go
+    through the app as before.
+  - `S3Storage`: any S3-compatible service (AWS S3, Cloudflare R2, MinIO),
+    path-style, signed with AWS Signature V4. Browsers upload with a
+    presigned PUT (carrying `x-amz-checksum-sha256`, so the service rejects
+    bytes that don't match the hash we'll store them under) and download
+    with presigned GETs, so media bytes don't pass through the app. The
+    server's own calls (copying a form upload in, thumbnailing, deletes) use
+    presigned URLs too, which keeps this to plain httpx requests. Any
+    endpoint works, so tests point it at a local stand-in (MinIO works too).
+    Browser uploads need a bucket CORS rule allowing PUT from the app's
+    origin with the `x-amz-checksum-sha256` header. They land under
+    `direct/` and are moved into place once registered; a lifecycle rule
+    expiring `direct/` after a day clears uploads that were never finished.
+
+Uploads from before the storage backends existed stay in `uploads/<trip_id>/`
+and `uploads/docs/` on local disk.
+"""
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import quote, urlsplit
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import tempfile
+
+import aiofiles
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+UPLOADS_ROOT = Path(__file__).parent.parent / "uploads"
+CHUNK_SIZE = 256 * 1024
+
+
+class StorageError(Exception):
+    """The backend couldn't complete an operation."""
+
+
+class StorageBackend(ABC):
+    """Interface. Keys are `/`-separated paths relative to the storage root."""
+
+    name = "base"
+    is_local = False
+
+    @abstractmethod
+    async def put_file(self, key: str, src: Path, content_type: Optional[str] = None):
+        """Store `src` under `key`, consuming (moving or deleting) `src`."""
+
+    @abstractmethod
+    async def size(self, key: str) -> Optional[int]:
+        """Object size in bytes, or None if it doesn't exist."""
+
+    async def exists(self, key: str) -> bool:
+        return await self.size(key) is not None
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Remove an object; missing objects are not an error."""
+
+    @abstractmethod
+    async def move(self, src_key: str, dest_key: str):
+        """Rename an object within the store, replacing whatever is at `dest_key`."""
+
+    @abstractmethod
+    def iter_bytes(self, key: str) -> AsyncIterator[bytes]:
+        """Stream an object's bytes."""
+
+    @abstractmethod
+    def local_copy(self, key: str):
+        """Async context manager: a local path with the object's bytes while the block runs."""
+
+    def presign_get(self, key: str, filename: Optional[str] = None,
+                    content_type: Optional[str] = None) -> Optional[str]:
+        """A time-limited download URL, or None if downloads go through the app."""
+        return None
+
+    def presign_put(self, key: str, sha256_hex: str) -> Optional[Dict]:
+        """{"url", "method", "headers"} for a direct browser upload, or None if unsupported."""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    name = "local"
+    is_local = True
+
+    def __init__(self, root: Path = UPLOADS_ROOT):
+        self.root = root
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    async def put_file(self, key: str, src: Path, content_type: Optional[str] = None):
+        dest = self.path(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src, dest)
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            return self.path(key).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    async def delete(self, key: str):
+        try:
+            self.path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    async def move(self, src_key: str, dest_key: str):
+        dest = self.path(dest_key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.path(src_key), dest)
+
+    async def iter_bytes(self, key: str) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self.path(key), "rb") as f:
+            while True:
+                chunk = await f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    @asynccontextmanager
+    async def local_copy(self, key: str):
+        yield self.path(key)
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+class S3Storage(StorageBackend):
+    name = "s3"
+
+    def __init__(self, endpoint_url: str, bucket: str, access_key: str, secret_key: str,
+                 region: str = "us-east-1", expires: int = 3600, timeout: float = 30.0):
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.host = urlsplit(self.endpoint_url).netloc
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.expires = expires
+        self.timeout = timeout
+
+    def _object_path(self, key: str) -> str:
+        """URL path of an object: path-style, which every S3-compatible service accepts."""
+        return "/" + quote(f"{self.bucket}/{key}", safe="/-_.~")
+
+    def presign(self, method: str, key: str, expires: Optional[int] = None,
+                headers: Optional[Dict[str, str]] = None, params: Optional[Dict[str, str]] = None,
+                now: Optional[datetime] = None) -> str:
+        """
+        AWS Signature V4 query-string presigning. `headers` are signed and the
+        caller must send them unchanged; `params` (e.g. response-content-*)
+        are signed into the URL.
+        """
+        now = now or datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{now:%Y%m%d}/{self.region}/s3/aws4_request"
+        signed = {"host": self.host, **{k.lower(): v.strip() for k, v in (headers or {}).items()}}
+        signed_names = ";".join(sorted(signed))
+
+        query = {
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key}/{scope}",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(expires or self.expires),
+            "X-Amz-SignedHeaders": signed_names,
+            **(params or {}),
+        }
+        canonical_query = "&".join(
+            f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query.items())
+        )
+        canonical_uri = self._object_path(key)
+        canonical_request = "\n".join([
+            method,
+            canonical_uri,
+            canonical_query,
+            "".join(f"{name}:{signed[name]}\n" for name in sorted(signed)),
+            signed_names,
+            "UNSIGNED-PAYLOAD",
+        ])
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ])
+        signing_key = _hmac(f"AWS4{self.secret_key}".encode("utf-8"), f"{now:%Y%m%d}")
+        for part in (self.region, "s3", "aws4_request"):
+            signing_key = _hmac(signing_key, part)
+        signature = hmac.new(signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+        return f"{self.endpoint_url}{canonical_uri}?{canonical_query}&X-Amz-Signature={signature}"
+
+    @staticmethod
+    def _checksum_header(sha256_hex: str) -> Dict[str, str]:
+        return {"x-amz-checksum-sha256": base64.b64encode(bytes.fromhex(sha256_hex)).decode()}
+
+    async def put_file(self, key: str, src: Path, content_type: Optional[str] = None):
+        digest = hashlib.sha256()
+        async with aiofiles.open(src, "rb") as f:
+            while chunk := await f.read(CHUNK_SIZE):
+                digest.update(chunk)
+        headers = self._checksum_header(digest.hexdigest())
+        url = self.presign("PUT", key, headers=headers)
+        if content_type:
+            headers["Content-Type"] = content_type
+        headers["Content-Length"] = str(src.stat().st_size)
+
+        async def body():
+            async with aiofiles.open(src, "rb") as f:
+                while chunk := await f.read(CHUNK_SIZE):
+                    yield chunk
+
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                resp = await client.put(url, content=body(), headers=headers)
+        except httpx.HTTPError as e:
+            raise StorageError(f"PUT {key} failed: {e}") from e
+        if resp.status_code >= 300:
+            raise StorageError(f"PUT {key} failed: HTTP {resp.status_code} {resp.text[:200]}")
+        src.unlink(missing_ok=True)
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                resp = await client.head(self.presign("HEAD", key))
+        except httpx.HTTPError as e:
+            raise StorageError(f"HEAD {key} failed: {e}") from e
+        if resp.status_code == 404:
+            return None
+        if resp.status_code >= 300:
+            raise StorageError(f"HEAD {key} failed: HTTP {resp.status_code}")
+        return int(resp.headers.get("content-length", 0))
+
+    async def delete(self, key: str):
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                resp = await client.delete(self.presign("DELETE", key))
+        except httpx.HTTPError as e:
+            raise StorageError(f"DELETE {key} failed: {e}") from e
+        if resp.status_code >= 300 and resp.status_code != 404:
+            raise StorageError(f"DELETE {key} failed: HTTP {resp.status_code}")
+
+    async def move(self, src_key: str, dest_key: str):
+        # Server-side CopyObject, then delete the source. A copy can fail after a 200, with an <Error> body.
+        headers = {"x-amz-copy-source": quote(f"/{self.bucket}/{src_key}", safe="/-_.~")}
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                resp = await client.put(self.presign("PUT", dest_key, headers=headers), headers=headers)
+        except httpx.HTTPError as e:
+            raise StorageError(f"COPY {src_key} failed: {e}") from e
+        if resp.status_code >= 300 or "<Error>" in resp.text:
+            raise StorageError(f"COPY {src_key} failed: HTTP {resp.status_code} {resp.text[:200]}")
+        await self.delete(src_key)
+
+    async def iter_bytes(self, key: str) -> AsyncIterator[bytes]:
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async with client.stream("GET", self.presign("GET", key)) as resp:
+                if resp.status_code >= 300:
+                    raise StorageError(f"GET {key} failed: HTTP {resp.status_code}")
+                async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                    yield chunk
+
+    @asynccontextmanager
+    async def local_copy(self, key: str):
+        # Keep the object's name: thumbnails are written next to it and named after it.
+        with tempfile.TemporaryDirectory(prefix="gojo-") as tmp:
+            path = Path(tmp) / Path(key).name
+            async with aiofiles.open(path, "wb") as out:
+                async for chunk in self.iter_bytes(key):
+                    await out.write(chunk)
+            yield path
+
+    def presign_get(self, key: str, filename: Optional[str] = None,
+                    content_type: Optional[str] = None) -> Optional[str]:
+        params = {}
+        if filename:
+            params["response-content-disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+        if content_type:
+            params["response-content-type"] = content_type
+        return self.presign("GET", key, params=params)
+
+    def presign_put(self, key: str, sha256_hex: str) -> Optional[Dict]:
+        headers = self._checksum_header(sha256_hex)
+        return {"url": self.presign("PUT", key, headers=headers), "method": "PUT", "headers": headers}
+
+
+def build_storage() -> StorageBackend:
+    if settings.storage_backend == "s3":
+        return S3Storage(
+            settings.s3_endpoint_url,
+            settings.s3_bucket,
+            settings.s3_access_key,
+            settings.s3_secret_key,
+            region=settings.s3_region,
+            expires=settings.s3_presign_expiry,
+        )
+    return LocalStorage()
+
+
+storage = build_storage()
@@ -0,0 +1,239 @@
+"""
+Per-trip and per-user storage accounting.
+
+`Trip.storage_bytes` and `User.storage_bytes` hold the bytes of every photo,
+video and document attachment in a trip, and uploaded by a user
+(`Photo.size_bytes` / `Document.size_bytes`, counting a kept original too).
+Content shared through the blob store is counted once per row that uses
+it: this is what each trip and uploader is responsible for, not physical
+disk use.
+
+Counters only change through single `UPDATE ... SET storage_bytes =
+storage_bytes + n` statements in the same transaction as the row they
+account for, so concurrent uploads can't lose an update. `reserve` adds
+that UPDATE a condition that the quota isn't crossed, which makes checking
+and charging one atomic step.
+
+Quotas (`trip_storage_quota`, `user_storage_quota`; 0 = unlimited) are
+also applied before the body arrives: `upload_body_limit` lowers the upload
+middleware's byte limit to the space left (app/uploads.py), and resumable
+and direct uploads check their declared length up front.
+
+`StorageReconciler` periodically recomputes the counters from the rows
+(filling in sizes of rows from before accounting existed), correcting any
+drift.
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import re
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import _session_factory
+from app.models import Blob, Document, Photo, Trip, User
+
+logger = logging.getLogger(__name__)
+
+QUOTA_EXCEEDED = "Storage quota exceeded"
+_STARTUP_DELAY = 60.0  # counters are correct at startup; don't compete with the first requests
+# Multipart uploads that add files to a trip
+UPLOAD_PATH = re.compile(r"^/trip/(\d+)/(?:upload|upload/bulk|documents/add)$")
+
+
+def _increment(model, row_id: int, delta: int, quota: int):
+    statement = update(model).where(model.id == row_id).values(storage_bytes=model.storage_bytes + delta)
+    if quota and delta > 0:
+        statement = statement.where(model.storage_bytes + delta <= quota)
+    return statement
+
+
+async def reserve(session: AsyncSession, trip_id: int, user_id: int, size: int) -> bool:
+    """
+    Charge `size` bytes to the trip and the uploader unless that would cross
+    a quota. Returns False (charging nothing) if it would; the caller then
+    rolls back or discards the upload. Caller commits.
+    """
+    trip = await session.execute(_increment(Trip, trip_id, size, settings.trip_storage_quota))
+    if trip.rowcount != 1:
+        return False
+    user = await session.execute(_increment(User, user_id, size, settings.user_storage_quota))
+    if user.rowcount != 1:
+        await session.execute(_increment(Trip, trip_id, -size, 0))
+        return False
+    return True
+
+
+async def release_bytes(session: AsyncSession, trip_id: int, user_id: int, size: Optional[int]):
+    """Give back a deleted row's bytes. Caller commits."""
+    if size:
+        await session.execute(_increment(Trip, trip_id, -size, 0))
+        await session.execute(_increment(User, user_id, -size, 0))
+
+
+async def release_trip(session: AsyncSession, trip_id: int) -> List[str]:
+    """
+    Before a trip's rows are deleted: give its photos' and documents' bytes
+    back to their uploaders and drop their blob references. Returns the blob
+    filenames that lost their last reference, for `remove_files` once the
+    caller has committed.
+    """
+    from app.blob_store import release
+
+    orphaned = []
+    for model, columns in ((Photo, (Photo.filename, Photo.original_filename)), (Document, (Document.file_path,))):
+        sizes = await session.execute(
+            select(model.user_id, func.sum(model.size_bytes)).where(model.trip_id == trip_id).group_by(model.user_id)
+        )
+        for user_id, size in sizes.all():
+            if size:
+                await session.execute(_increment(User, user_id, -size, 0))
+        names = await session.execute(select(*columns).where(model.trip_id == trip_id))
+        for row in names.all():
+            orphaned += [name for name in row if name and await release(session, name)]
+    return orphaned
+
+
+async def remaining(session: AsyncSession, trip_id: int, user_id: int) -> Optional[int]:
+    """Bytes the trip and user can still take, or None when neither has a quota."""
+    limits = []
+    if settings.trip_storage_quota:
+        used = await session.scalar(select(Trip.storage_bytes).where(Trip.id == trip_id))
+        limits.append(settings.trip_storage_quota - (used or 0))
+    if settings.user_storage_quota:
+        used = await session.scalar(select(User.storage_bytes).where(User.id == user_id))
+        limits.append(settings.user_storage_quota - (used or 0))
+    return max(0, min(limits)) if limits else None
+
+
+def _user_id_from_cookie(headers: Dict[bytes, bytes]) -> Optional[int]:
+    from jose import JWTError, jwt
+    from starlette.requests import cookie_parser
+
+    token = cookie_parser(headers.get(b"cookie", b"").decode("latin-1")).get("access_token", "")
+    scheme, _, token = token.partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return None
+    user_id = payload.get("user_id")
+    return user_id if isinstance(user_id, int) else None
+
+
+async def upload_body_limit(path: str, headers: Dict[bytes, bytes]) -> Optional[int]:
+    """
+    For the upload middleware: the most file bytes this request may carry
+    before a quota is crossed, or None if no quota applies. Requests it
+    can't attribute are left to the handlers, which check again.
+    """
+    if not (settings.trip_storage_quota or settings.user_storage_quota):
+        return None
+    match = UPLOAD_PATH.match(path)
+    if not match:
+        return None
+    user_id = _user_id_from_cookie(headers)
+    if user_id is None:
+        return None
+    async with _session_factory() as session:
+        return await remaining(session, int(match.group(1)), user_id)
+
+
+async def _legacy_sizes(session: AsyncSession, model, path_for, limit: int = 500) -> int:
+    """Stat files of rows from before accounting (and the blob store) existed."""
+    name = Photo.filename if model is Photo else Document.file_path
+    rows = (await session.execute(
+        select(model.id, model.trip_id, name).where(model.size_bytes.is_(None), name.is_not(None)).limit(limit)
+    )).all()
+    loop = asyncio.get_running_loop()
+    for row_id, trip_id, filename in rows:
+        path: Path = path_for(trip_id, filename)
+        size = await loop.run_in_executor(None, lambda: path.stat().st_size if path.is_file() else 0)
+        await session.execute(update(model).where(model.id == row_id).values(size_bytes=size))
+    return len(rows)
+
+
+async def reconcile(session: AsyncSession) -> Tuple[int, int]:
+    """Fill in missing row sizes and reset counters that drifted. Returns (trips, users) corrected."""
+    from app.storage import UPLOADS_ROOT
+
+    # Blob-store rows: the blob's size. (Kept originals only exist on rows that were sized at upload.)
+    for model in (Photo, Document):
+        await session.execute(
+            update(model)
+            .where(model.size_bytes.is_(None), model.sha256.is_not(None))
+            .values(size_bytes=select(Blob.size).where(Blob.sha256 == model.sha256).scalar_subquery())
+            .execution_options(synchronize_session=False)
+        )
+    await _legacy_sizes(session, Photo, lambda trip_id, name: UPLOADS_ROOT / str(trip_id) / name)
+    await _legacy_sizes(session, Document, lambda trip_id, name: UPLOADS_ROOT / "docs" / name)
+
+    corrected = []
+    for owner, key in ((Trip, "trip_id"), (User, "user_id")):
+        actual = (
+            select(func.coalesce(func.sum(Photo.size_bytes), 0))
+            .where(getattr(Photo, key) == owner.id).scalar_subquery()
+            + select(func.coalesce(func.sum(Document.size_bytes), 0))
+            .where(getattr(Document, key) == owner.id).scalar_subquery()
+        )
+        result = await session.execute(
+            update(owner)
+            .where(or_(owner.storage_bytes.is_(None), owner.storage_bytes != actual))
+            .values(storage_bytes=actual)
+            .execution_options(synchronize_session=False)
+        )
+        corrected.append(result.rowcount)
+    await session.commit()
+    return corrected[0], corrected[1]
+
+
+class StorageReconciler:
+    """Recomputes storage counters every `storage_reconcile_interval` seconds."""
+
+    def __init__(self, interval: float = settings.storage_reconcile_interval):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.trips_corrected = 0
+        self.users_corrected = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self):
+        async with _session_factory() as session:
+            trips, users = await reconcile(session)
+        self.runs += 1
+        self.trips_corrected += trips
+        self.users_corrected += users
+        if trips or users:
+            logger.warning(f"Storage counters corrected: {trips} trips, {users} users")
+
+    async def _loop(self):
+        await asyncio.sleep(_STARTUP_DELAY)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Storage reconciliation failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict:
+        return {"runs": self.runs, "trips_corrected": self.trips_corrected, "users_corrected": self.users_corrected}
+
+
+storage_reconciler = StorageReconciler()
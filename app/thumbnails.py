@@ -0,0 +1,186 @@
+"""
+Gallery thumbnails.
+
+Every uploaded image gets WebP renditions at THUMBNAIL_WIDTHS (never
+upscaled), written next to the original as `<stem>_<width>.webp`. The
+widths actually produced are recorded on `Photo.thumbnail_widths`
+("320,640,1280"; "" when the file can't be thumbnailed, None when not yet
+processed), and the gallery builds a `srcset` from them. Photos stored in
+the blob store share their thumbnails with every other photo of the same
+content, so a duplicate upload reuses the widths already generated.
+
+`generate_thumbnails` runs in the media process pool. It uses JPEG draft
+mode to decode at reduced scale and downsizes progressively from the largest
+rendition to the smallest.
+"""
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WEBP_METHOD = 2  # 0-6; 4+ is ~2.5x slower for a few % smaller files
+# Animated GIFs would lose their animation, so they're shown as uploaded.
+THUMBNAIL_EXT = {".jpg", ".jpeg", ".png", ".webp"}
+
+# photo ids queued or being processed, so repeat gallery views don't requeue them
+_in_progress: Set[int] = set()
+
+
+def thumbnail_filename(filename: str, width: int) -> str:
+    return f"{Path(filename).stem}_{width}.webp"
+
+
+def thumbnail_widths(photo) -> List[int]:
+    return [int(w) for w in (photo.thumbnail_widths or "").split(",") if w]
+
+
+def can_thumbnail(filename: str, media_type: str) -> bool:
+    return media_type == "image" and Path(filename).suffix.lower() in THUMBNAIL_EXT
+
+
+def generate_thumbnails(src: str, widths: Sequence[int] = THUMBNAIL_WIDTHS) -> List[int]:
+    """Write WebP thumbnails next to `src`; returns the widths written. Runs in a worker process."""
+    from PIL import Image, ImageOps
+
+    src_path = Path(src)
+    with Image.open(src_path) as original:
+        largest = max(widths)
+        # Decode JPEGs at the smallest DCT scale that still covers the largest width.
+        original.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        targets = [w for w in sorted(widths, reverse=True) if w < image.width] or [min(widths)]
+        written = []
+        current = image
+        for width in targets:
+            if width < current.width:
+                height = max(1, round(current.height * width / current.width))
+                current = current.resize((width, height), Image.LANCZOS)
+            dest = src_path.with_name(thumbnail_filename(src_path.name, width))
+            tmp = dest.with_suffix(".tmp")
+            current.save(tmp, "WEBP", quality=THUMBNAIL_QUALITY, method=THUMBNAIL_WEBP_METHOD)
+            os.replace(tmp, dest)
+            written.append(width)
+    return sorted(written)
+
+
+def remove_thumbnails(src_path: Path, widths: Iterable[int]):
+    for width in widths:
+        try:
+            src_path.with_name(thumbnail_filename(src_path.name, width)).unlink()
+        except FileNotFoundError:
+            pass
+
+
+async def _thumbnail_blob(filename: str) -> List[int]:
+    """Thumbnail a blob-store file; with remote storage, via a temp copy whose thumbnails are uploaded."""
+    from app.blob_store import blob_key, local_copy
+    from app.media_pool import run_in_media_pool
+    from app.storage import storage
+
+    async with local_copy(filename) as src:
+        widths = await run_in_media_pool(generate_thumbnails, str(src))
+        if not storage.is_local:
+            for width in widths:
+                name = thumbnail_filename(filename, width)
+                await storage.put_file(blob_key(name), src.with_name(name), "image/webp")
+    return widths
+
+
+async def create_thumbnails(photo_id: int, src_path: Path):
+    """Background job: thumbnail one photo and record the widths on its row."""
+    from sqlmodel import select
+
+    from app.blob_store import blob_sha
+    from app.database import _session_factory
+    from app.media_pool import run_in_media_pool
+    from app.models import Photo
+
+    _in_progress.add(photo_id)
+    try:
+        # The session is closed while the media pool works: with SQLite every
+        # session shares one connection, so an open transaction would hold up
+        # every other request for the length of the thumbnailing.
+        async with _session_factory() as session:
+            photo = await session.get(Photo, photo_id)
+            if not photo or photo.thumbnail_widths is not None:
+                return
+            if photo.sha256:
+                done = await session.execute(
+                    select(Photo.thumbnail_widths)
+                    .where(Photo.sha256 == photo.sha256, Photo.filename == photo.filename)
+                    .where(Photo.thumbnail_widths.is_not(None))
+                    .limit(1)
+                )
+                existing = done.scalars().first()
+                if existing is not None:
+                    photo.thumbnail_widths = existing
+                    session.add(photo)
+                    await session.commit()
+                    return
+            filename, media_type = photo.filename, photo.media_type
+
+        widths: List[int] = []
+        if can_thumbnail(filename, media_type):
+            try:
+                if blob_sha(filename):
+                    widths = await _thumbnail_blob(filename)
+                elif src_path.exists():
+                    widths = await run_in_media_pool(generate_thumbnails, str(src_path))
+            except Exception as e:
+                logger.warning(f"Thumbnailing photo {photo_id} failed: {e}")
+
+        async with _session_factory() as session:
+            photo = await session.get(Photo, photo_id)
+            if photo and photo.thumbnail_widths is None:
+                photo.thumbnail_widths = ",".join(str(w) for w in widths)
+                session.add(photo)
+                await session.commit()
+    finally:
+        _in_progress.discard(photo_id)
+
+
+async def backfill_thumbnails(items: Sequence[Tuple[int, Path]]):
+    """Thumbnail photos uploaded before thumbnails existed, one at a time."""
+    for photo_id, src_path in items:
+        await create_thumbnails(photo_id, src_path)
+
+
+async def create_thumbnails_batch(items: Sequence[Tuple[int, Path]]):
+    """Thumbnail a batch of new uploads, keeping every media worker busy."""
+    from app.config import settings
+
+    semaphore = asyncio.Semaphore(max(1, settings.media_workers))
+
+    async def one(photo_id: int, src_path: Path):
+        async with semaphore:
+            await create_thumbnails(photo_id, src_path)
+
+    await asyncio.gather(*(one(photo_id, src_path) for photo_id, src_path in items))
+
+
+def claim_for_backfill(photos, src_path_for, limit: int = 50) -> List[Tuple[int, Path]]:
+    """Pick unprocessed photos not already queued, and mark them queued."""
+    items = []
+    for photo in photos:
+        if photo.thumbnail_widths is None and photo.id not in _in_progress:
+            _in_progress.add(photo.id)
+            items.append((photo.id, src_path_for(photo)))
+            if len(items) >= limit:
+                break
+    return items
+
+
+def srcset(base_url: str, filename: str, widths: Sequence[int]) -> Optional[str]:
+    """`srcset` value for the given thumbnail widths under `base_url`."""
+    if not widths:
+        return None
+    return ", ".join(f"{base_url}/{thumbnail_filename(filename, w)} {w}w" for w in widths)
@@ -0,0 +1,215 @@
+"""
+Caching proxy for map tiles.
+
+When `tile_proxy_enabled` is set, the map loads tiles from /tiles/{z}/{x}/{y}.png
+instead of the public OSM servers. Tiles are kept on disk under
+`tile_cache_dir` as z/x/y.png with a small z/x/y.json sidecar holding the
+upstream ETag / Last-Modified. A tile is served straight from disk while it
+is younger than `tile_cache_fresh_seconds`; after that it is revalidated with
+a conditional request (a 304 just renews it). If upstream is down, the stale
+copy is served. Concurrent misses for the same tile share one upstream fetch,
+and the cache is trimmed least-recently-used first to `tile_cache_max_bytes`.
+The size index is rebuilt from disk once, on first use; all file I/O runs in
+the default executor so a slow disk doesn't stall the event loop.
+"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Tuple
+import asyncio
+import json
+import logging
+import os
+import time
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+TileKey = Tuple[int, int, int]
+
+
+class TileUnavailable(Exception):
+    """Upstream could not provide the tile and nothing is cached."""
+
+
+class TileCache:
+    def __init__(
+        self,
+        cache_dir: str = settings.tile_cache_dir,
+        upstream_url: str = settings.tile_upstream_url,
+        max_bytes: int = settings.tile_cache_max_bytes,
+        fresh_seconds: int = settings.tile_cache_fresh_seconds,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.upstream_url = upstream_url
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        # key -> size in bytes, least recently used first
+        self._lru: "OrderedDict[TileKey, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._scanned = False
+        self._scan_lock = asyncio.Lock()
+        self._inflight: Dict[TileKey, asyncio.Task] = {}
+        self.hits = self.misses = self.revalidated = 0
+
+    @staticmethod
+    def valid(z: int, x: int, y: int) -> bool:
+        return 0 <= z <= 19 and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+    def _path(self, key: TileKey) -> Path:
+        z, x, y = key
+        return self.cache_dir / str(z) / str(x) / f"{y}.png"
+
+    def _scan(self) -> List[Tuple[TileKey, int]]:
+        """List cached tiles as (key, size), oldest first. Blocking."""
+        entries = []
+        if self.cache_dir.exists():
+            for path in self.cache_dir.glob("*/*/*.png"):
+                try:
+                    stat = path.stat()
+                    key = (int(path.parent.parent.name), int(path.parent.name), int(path.stem))
+                except (OSError, ValueError):
+                    continue
+                entries.append((stat.st_atime, key, stat.st_size))
+        return [(key, size) for _, key, size in sorted(entries)]
+
+    async def _ensure_scanned(self):
+        """Build the index once; concurrent first requests wait for the same scan."""
+        async with self._scan_lock:
+            if self._scanned:
+                return
+            entries = await asyncio.get_event_loop().run_in_executor(None, self._scan)
+            self._lru = OrderedDict(entries)
+            self._total_bytes = sum(self._lru.values())
+            self._scanned = True
+
+    async def get(self, z: int, x: int, y: int) -> Path:
+        """Return the path of a fresh-enough cached tile, fetching it if needed."""
+        if not self._scanned:
+            await self._ensure_scanned()
+        key = (z, x, y)
+        path = self._path(key)
+        if key in self._lru:
+            try:
+                mtime = await asyncio.get_event_loop().run_in_executor(None, lambda: path.stat().st_mtime)
+                age = time.time() - mtime
+            except OSError:
+                self._forget(key)
+            else:
+                # Another request may have evicted it while we were off the loop.
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    if age < self.fresh_seconds:
+                        self.hits += 1
+                        return path
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: TileKey) -> Path:
+        path = self._path(key)
+        meta_path = path.with_suffix(".json")
+        cached = key in self._lru
+        headers = {"User-Agent": settings.tile_user_agent}
+        loop = asyncio.get_event_loop()
+        if cached:
+            meta = await loop.run_in_executor(None, self._read_meta, meta_path)
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        z, x, y = key
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.get(self.upstream_url.format(z=z, x=x, y=y), headers=headers)
+        except Exception as e:
+            if cached:
+                logger.warning(f"Tile upstream error for {key}, serving stale: {e}")
+                return path
+            raise TileUnavailable(str(e)) from e
+
+        if response.status_code == 304 and cached:
+            self.revalidated += 1
+            try:
+                await loop.run_in_executor(None, os.utime, path, None)
+            except OSError:
+                pass
+            return path
+        if response.status_code != 200:
+            if cached:
+                return path
+            raise TileUnavailable(f"upstream returned {response.status_code}")
+
+        self.misses += 1
+        await self._store(key, response.content, {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+        })
+        return path
+
+    @staticmethod
+    def _read_meta(meta_path: Path) -> dict:
+        """Load a tile's validator sidecar; empty if missing or corrupt. Blocking."""
+        try:
+            return json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_tile(path: Path, content: bytes, meta: dict):
+        """Atomically write a tile and its sidecar. Blocking."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+        path.with_suffix(".json").write_text(json.dumps(meta))
+
+    async def _store(self, key: TileKey, content: bytes, meta: dict):
+        await asyncio.get_event_loop().run_in_executor(None, self._write_tile, self._path(key), content, meta)
+
+        self._total_bytes += len(content) - self._lru.pop(key, 0)
+        self._lru[key] = len(content)
+        victims = self._evict()
+        if victims:
+            await asyncio.get_event_loop().run_in_executor(None, self._remove_files, victims)
+
+    def _evict(self) -> list:
+        """Drop least-recently-used tiles from the index until under budget; returns their paths."""
+        victims = []
+        while self._total_bytes > self.max_bytes and len(self._lru) > 1:
+            key = next(iter(self._lru))
+            self._forget(key)
+            victims.append(self._path(key))
+        return victims
+
+    @staticmethod
+    def _remove_files(paths: list):
+        """Delete evicted tiles and their sidecars. Blocking."""
+        for path in paths:
+            for stale in (path, path.with_suffix(".json")):
+                try:
+                    stale.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _forget(self, key: TileKey):
+        self._total_bytes -= self._lru.pop(key, 0)
+
+    def stats(self) -> dict:
+        return {
+            "tiles": len(self._lru),
+            "bytes": self._total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+        }
+
+
+tile_cache = TileCache()
@@ -0,0 +1,164 @@
+"""
+Streaming upload handling.
+
+Two layers keep large uploads from being buffered in memory or fully
+received before they're rejected:
+
+  - `UploadLimitMiddleware` looks at multipart requests before the form is
+    parsed: a Content-Length over the limit is refused immediately, and a body
+    without one is counted as it streams in and cut off once it crosses the
+    limit. (Starlette spools parsed file parts to disk past 1MB.)
+  - `save_upload` copies an `UploadFile` to a temp file in the destination
+    directory in fixed-size chunks, hashing each chunk on the same pass, and
+    `os.replace`s it into place, so a half-written file is never visible under
+    its final name.
+
+Uploads into a trip are also held to the storage quota left for the trip
+and uploader (app/storage_quota.py), the same way.
+"""
+from pathlib import Path
+from typing import NamedTuple, Optional
+from urllib.parse import quote_plus, urlsplit
+import hashlib
+import logging
+import os
+import re
+import uuid
+
+import aiofiles
+from fastapi import UploadFile
+from starlette.responses import PlainTextResponse, RedirectResponse
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+MULTIPART_OVERHEAD = 64 * 1024  # boundaries, headers and small form fields
+BULK_UPLOAD_PATH = re.compile(r"^/trip/\d+/upload/bulk$")
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"upload exceeds {limit} bytes")
+        self.limit = limit
+
+
+class StoredUpload(NamedTuple):
+    path: Path
+    filename: str
+    size: int
+    sha256: str
+
+
+async def save_upload(upload: UploadFile, dest_dir: Path, ext: str, max_bytes: int) -> StoredUpload:
+    """Stream `upload` into `dest_dir` as `<uuid><ext>`; raises UploadTooLarge past `max_bytes`."""
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    filename = f"{uuid.uuid4()}{ext}"
+    final_path = dest_dir / filename
+    tmp_path = dest_dir / f".{filename}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                await out.write(chunk)
+        os.replace(tmp_path, final_path)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+    return StoredUpload(final_path, filename, size, digest.hexdigest())
+
+
+def request_body_limit(path: str) -> int:
+    """Largest multipart body accepted for a request path."""
+    if BULK_UPLOAD_PATH.match(path):
+        # Each file is still held to max_upload_size by save_upload.
+        return settings.max_bulk_upload_size + MULTIPART_OVERHEAD
+    return settings.max_upload_size + MULTIPART_OVERHEAD
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class UploadLimitMiddleware:
+    """Refuse oversized multipart bodies before (or while) they are received."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+
+        from app.storage_quota import QUOTA_EXCEEDED, upload_body_limit
+
+        limit = request_body_limit(scope["path"])
+        reason = None
+        quota = await upload_body_limit(scope["path"], headers)
+        if quota is not None and quota + MULTIPART_OVERHEAD < limit:
+            limit = quota + MULTIPART_OVERHEAD
+            reason = QUOTA_EXCEEDED
+        declared: Optional[str] = headers.get(b"content-length", b"").decode() or None
+        if declared and declared.isdigit() and int(declared) > limit:
+            return await self._reject(scope, headers, send, limit, reason)
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if exceeded and not response_started:
+                # FastAPI turns the aborted body into a 400; send our rejection instead.
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            pass
+        if exceeded and not response_started:
+            await self._reject(scope, headers, send, limit, reason)
+
+    async def _reject(self, scope, headers, send, limit: int, reason: Optional[str] = None):
+        logger.info(f"Rejected upload to {scope['path']}: body over {limit} bytes")
+        message = reason or f"File too large (max {limit // (1024 * 1024)}MB)"
+        referer = headers.get(b"referer", b"").decode()
+        if referer:
+            # Same UX as the handlers' own validation errors: back to the form with a message.
+            parts = urlsplit(referer)
+            response = RedirectResponse(f"{parts.path or '/'}?error={quote_plus(message)}", status_code=302)
+        else:
+            response = PlainTextResponse(reason or "Upload too large", status_code=413)
+        await response(scope, self._drain, send)
+
+    @staticmethod
+    async def _drain():
+        return {"type": "http.disconnect"}
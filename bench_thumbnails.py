@@ -0,0 +1,70 @@
+"""
+Benchmark the gallery thumbnail pipeline.
+
+Generates synthetic phone-sized JPEGs and thumbnails them serially and
+through the media process pool, printing thumbnails/second for each.
+
+    python bench_thumbnails.py --images 24 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from app.thumbnails import THUMBNAIL_WIDTHS, generate_thumbnails
+
+
+def make_images(directory: Path, count: int, size=(4032, 3024)):
+    # A gradient plus noise compresses roughly like a real photo.
+    noise = Image.effect_noise(size, 64).convert("RGB")
+    gradient = Image.linear_gradient("L").resize(size).convert("RGB")
+    base = Image.blend(noise, gradient, 0.5)
+    paths = []
+    for i in range(count):
+        path = directory / f"photo_{i}.jpg"
+        base.rotate(i % 4 * 90, expand=False).save(path, "JPEG", quality=90)
+        paths.append(str(path))
+    return paths
+
+
+def bench_serial(paths):
+    start = time.perf_counter()
+    made = sum(len(generate_thumbnails(p)) for p in paths)
+    return made, time.perf_counter() - start
+
+
+async def bench_pool(paths, workers):
+    from app import media_pool
+    media_pool.get_media_pool(workers)
+    # Warm the pool so process start-up isn't counted.
+    await asyncio.gather(*(media_pool.run_in_media_pool(len, "x") for _ in range(workers)))
+    start = time.perf_counter()
+    results = await asyncio.gather(*(media_pool.run_in_media_pool(generate_thumbnails, p) for p in paths))
+    elapsed = time.perf_counter() - start
+    media_pool.shutdown_media_pool()
+    return sum(len(r) for r in results), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_images(Path(tmp), args.images)
+        print(f"{args.images} images 4032x3024, widths {THUMBNAIL_WIDTHS}")
+
+        made, elapsed = bench_serial(paths)
+        print(f"serial:            {made / elapsed:7.1f} thumbnails/s ({args.images / elapsed:.1f} images/s)")
+
+        made, elapsed = asyncio.run(bench_pool(paths, args.workers))
+        print(f"pool ({args.workers} workers): {made / elapsed:7.1f} thumbnails/s ({args.images / elapsed:.1f} images/s)")
+
+
+if __name__ == "__main__":
+    main()
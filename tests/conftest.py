@@ -0,0 +1,94 @@
+"""
+Shared test setup. Settings are read at import time, so the environment is
+filled in before any `app` module is imported.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, List, NamedTuple
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_TMP = Path(tempfile.mkdtemp(prefix="gojo-tests-"))
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_TMP / 'test.db'}")
+
+
+class StubRequest(NamedTuple):
+    method: str
+    path: str
+    headers: dict
+    body: bytes
+
+
+class StubServer:
+    """
+    A local HTTP server for exercising outbound HTTP code paths. Each request
+    is recorded and answered by `handler(request) -> (status, headers, body)`.
+    """
+
+    def __init__(self):
+        self.requests: List[StubRequest] = []
+        self.handler: Callable[[StubRequest], tuple] = lambda request: (404, {}, b"")
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = StubRequest(
+                    self.command, self.path,
+                    {k.lower(): v for k, v in self.headers.items()},
+                    self.rfile.read(length) if length else b"",
+                )
+                stub.requests.append(request)
+                status, headers, body = stub.handler(request)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            do_GET = do_PUT = do_POST = do_HEAD = do_DELETE = _dispatch
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def run_db():
+    """`run_db(coro)`: run a coroutine against the initialised test database, disposing the engine after."""
+    from app.database import engine, init_db
+
+    def run(coro):
+        async def wrapper():
+            try:
+                await init_db()
+                return await coro
+            finally:
+                await engine.dispose()
+        return asyncio.run(wrapper())
+    return run
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from app import blob_store
+from app.blob_store import add_ref, blob_key, release, remove_files
+from app.database import _session_factory
+from app.models import Blob
+from app.storage import LocalStorage
+
+SHA, OTHER_SHA = "d" * 64, "e" * 64
+FILENAME, OTHER_FILENAME = f"{SHA}.jpg", f"{OTHER_SHA}.jpg"
+
+
+class PausingStorage(LocalStorage):
+    """Local storage whose deletes wait for `resume` so a race can be staged."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.deleting = asyncio.Event()
+        self.resume = asyncio.Event()
+
+    async def delete(self, key):
+        self.deleting.set()
+        await self.resume.wait()
+        await super().delete(key)
+
+
+@pytest.fixture
+def paused_storage(tmp_path, monkeypatch):
+    storage = PausingStorage(tmp_path / "store")
+    monkeypatch.setattr(blob_store, "storage", storage)
+    return storage
+
+
+def upload(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b"photo bytes")
+    return path
+
+
+def test_reupload_during_last_delete_keeps_the_file(tmp_path, paused_storage, run_db):
+    async def scenario():
+        async with _session_factory() as session:
+            await add_ref(session, upload(tmp_path, "first.tmp"), SHA, 11, ".jpg")
+            await session.commit()
+            assert await release(session, FILENAME)
+            await session.commit()
+
+        removing = asyncio.create_task(remove_files(FILENAME))
+        await paused_storage.deleting.wait()
+
+        async def reupload():
+            async with _session_factory() as session:
+                filename = await add_ref(session, upload(tmp_path, "second.tmp"), SHA, 11, ".jpg")
+                await session.commit()
+                return filename
+
+        adding = asyncio.create_task(reupload())
+        await asyncio.sleep(0.05)
+        assert not adding.done()  # waits for the delete instead of trusting the file it would remove
+        paused_storage.resume.set()
+        await removing
+        filename = await adding
+        async with _session_factory() as session:
+            return filename, (await session.get(Blob, SHA)).refcount
+
+    filename, refcount = run_db(scenario())
+    assert (filename, refcount) == (FILENAME, 1)
+    assert paused_storage.path(blob_key(FILENAME)).read_bytes() == b"photo bytes"
+
+
+def test_remove_skips_content_that_was_referenced_again(tmp_path, paused_storage, run_db):
+    paused_storage.resume.set()
+
+    async def scenario():
+        async with _session_factory() as session:
+            await add_ref(session, upload(tmp_path, "first.tmp"), OTHER_SHA, 11, ".jpg")
+            await session.commit()
+            assert await release(session, OTHER_FILENAME)
+            await add_ref(session, upload(tmp_path, "second.tmp"), OTHER_SHA, 11, ".jpg")
+            await session.commit()
+        await remove_files(OTHER_FILENAME)
+
+    run_db(scenario())
+    assert not paused_storage.deleting.is_set()
+    assert paused_storage.path(blob_key(OTHER_FILENAME)).exists()
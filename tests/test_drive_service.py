@@ -0,0 +1,93 @@
+import asyncio
+from types import SimpleNamespace
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from app import drive_service
+from app.drive_service import PARENT_FOLDER_NAME, create_trip_folder_for_user
+
+
+class FakeDrive:
+    """A Drive service stand-in that records each executed files() call."""
+
+    def __init__(self, folders=None, missing=()):
+        self.calls = []
+        self.folders = dict(folders or {})  # id -> name
+        self.missing = set(missing)  # parent ids that answer 404
+
+    def files(self):
+        return self
+
+    def _request(self, action):
+        return SimpleNamespace(execute=action)
+
+    def list(self, q, **kwargs):
+        def run():
+            self.calls.append("list")
+            return {"files": [{"id": fid, "name": name} for fid, name in self.folders.items()
+                              if name == PARENT_FOLDER_NAME]}
+        return self._request(run)
+
+    def create(self, body, **kwargs):
+        def run():
+            self.calls.append("create")
+            parent = (body.get("parents") or [None])[0]
+            if parent in self.missing:
+                raise HttpError(httplib2.Response({"status": 404}), b"File not found")
+            if parent == "forbidden":
+                raise HttpError(httplib2.Response({"status": 403}), b"Forbidden")
+            folder_id = f"folder-{len(self.folders) + 1}"
+            self.folders[folder_id] = body["name"]
+            return {"id": folder_id}
+        return self._request(run)
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    fake = FakeDrive()
+    monkeypatch.setattr(drive_service, "get_drive_service", lambda token: fake)
+    return fake
+
+
+def create(user, trip_name="Goa 2026"):
+    return asyncio.run(create_trip_folder_for_user("token", user, trip_name))
+
+
+def test_cached_parent_folder_means_one_api_call(drive):
+    drive.folders = {"parent-1": PARENT_FOLDER_NAME}
+    user = SimpleNamespace(id=1, drive_parent_folder_id="parent-1")
+    folder_id = create(user)
+    assert drive.calls == ["create"]
+    assert drive.folders[folder_id] == "Goa 2026"
+    assert user.drive_parent_folder_id == "parent-1"
+
+
+def test_first_trip_creates_and_caches_the_parent_folder(drive):
+    user = SimpleNamespace(id=1, drive_parent_folder_id=None)
+    create(user)
+    assert drive.calls == ["list", "create", "create"]
+    assert drive.folders[user.drive_parent_folder_id] == PARENT_FOLDER_NAME
+
+    drive.calls.clear()
+    create(user, "Jaipur")
+    assert drive.calls == ["create"]
+
+
+def test_deleted_parent_folder_is_looked_up_again(drive):
+    drive.folders = {"parent-2": PARENT_FOLDER_NAME}
+    drive.missing = {"parent-gone"}
+    user = SimpleNamespace(id=1, drive_parent_folder_id="parent-gone")
+    folder_id = create(user)
+    assert drive.calls == ["create", "list", "create"]
+    assert user.drive_parent_folder_id == "parent-2"
+    assert drive.folders[folder_id] == "Goa 2026"
+
+
+def test_other_drive_errors_are_raised(drive):
+    user = SimpleNamespace(id=1, drive_parent_folder_id="forbidden")
+    with pytest.raises(HttpError):
+        create(user)
+    assert drive.calls == ["create"]
+    assert user.drive_parent_folder_id == "forbidden"
@@ -0,0 +1,188 @@
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import blob_store
+from app.auth_utils import decrypt_secret, encrypt_secret
+from app.database import _session_factory
+from app.drive_sync import DriveAuthError, DriveSyncWorker
+from app.models import DriveSyncJob, Photo, Trip, User
+
+
+class HttpError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.resp = type("Resp", (), {"status": status})()
+
+
+class FakeDrive:
+    """Records the token each upload used; fails the first chunk with `fail_with` statuses in turn."""
+
+    def __init__(self, fail_with=()):
+        self.tokens = []
+        self.fail_with = list(fail_with)
+
+    def __call__(self, token):
+        self.tokens.append(token)
+        return self
+
+    def upload(self, path, folder_id, mimetype, chunk_size, resumable_uri=None, progress=0):
+        drive = self
+
+        class Upload:
+            resumable_uri = "https://drive.example/session"
+            progress = 0
+
+            def next_chunk(self):
+                if drive.fail_with:
+                    raise HttpError(drive.fail_with.pop(0))
+                return "drive-file-id"
+
+        return Upload()
+
+
+class FakeRefresher:
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    async def __call__(self, refresh_token):
+        self.calls.append(refresh_token)
+        if self.error:
+            raise self.error
+        return f"fresh-{len(self.calls)}", 3600
+
+
+@pytest.fixture(autouse=True)
+def photo_bytes(tmp_path, monkeypatch):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(b"\xff\xd8 not really a jpeg")
+
+    @asynccontextmanager
+    async def local_copy(filename):
+        yield path
+
+    monkeypatch.setattr(blob_store, "local_copy", local_copy)
+
+
+_users = 0
+
+
+async def make_job(access_token="stale", expires_in=timedelta(hours=-1), refresh_token="refresh-1"):
+    global _users
+    _users += 1
+    async with _session_factory() as session:
+        user = User(
+            email=f"drive{_users}@example.com",
+            drive_connected=True,
+            drive_access_token=encrypt_secret(access_token),
+            drive_token_expires_at=datetime.utcnow() + expires_in,
+            drive_refresh_token=encrypt_secret(refresh_token),
+        )
+        trip = Trip(name="T", destination="Goa", start_date=datetime.utcnow().date(),
+                    end_date=datetime.utcnow().date(), join_code=f"DRIVE{_users}", drive_folder_id="folder")
+        session.add_all([user, trip])
+        await session.commit()
+        photo = Photo(trip_id=trip.id, user_id=user.id, filename="photo.jpg")
+        session.add(photo)
+        await session.commit()
+        job = DriveSyncJob(photo_id=photo.id, user_id=user.id, folder_id="folder")
+        session.add(job)
+        await session.commit()
+        return user.id, job.id
+
+
+async def load(user_id, job_id):
+    async with _session_factory() as session:
+        return await session.get(User, user_id), await session.get(DriveSyncJob, job_id)
+
+
+async def drain(worker):
+    while await worker.run_once():
+        pass
+
+
+def test_expired_access_token_is_refreshed_before_upload(run_db):
+    drive, refresher = FakeDrive(), FakeRefresher()
+    worker = DriveSyncWorker(client_factory=drive, token_refresher=refresher, retry_base=0)
+
+    async def scenario():
+        ids = await make_job()
+        await drain(worker)
+        return await load(*ids)
+
+    user, job = run_db(scenario())
+    assert refresher.calls == ["refresh-1"]
+    assert drive.tokens == ["fresh-1"]
+    assert job.status == "done"
+    assert decrypt_secret(user.drive_access_token) == "fresh-1"
+    assert user.drive_token_expires_at > datetime.utcnow() + timedelta(minutes=50)
+
+
+def test_valid_access_token_is_used_without_refreshing(run_db):
+    drive, refresher = FakeDrive(), FakeRefresher()
+    worker = DriveSyncWorker(client_factory=drive, token_refresher=refresher, retry_base=0)
+
+    async def scenario():
+        ids = await make_job(access_token="current", expires_in=timedelta(minutes=30))
+        await drain(worker)
+        return await load(*ids)
+
+    _, job = run_db(scenario())
+    assert refresher.calls == []
+    assert drive.tokens == ["current"]
+    assert job.status == "done"
+
+
+def test_rejected_upload_refreshes_token_on_retry(run_db):
+    drive, refresher = FakeDrive(fail_with=[401]), FakeRefresher()
+    worker = DriveSyncWorker(client_factory=drive, token_refresher=refresher, retry_base=0)
+
+    async def scenario():
+        ids = await make_job(access_token="current", expires_in=timedelta(minutes=30))
+        await drain(worker)
+        return await load(*ids)
+
+    _, job = run_db(scenario())
+    assert drive.tokens == ["current", "fresh-1"]
+    assert job.status == "done"
+    assert job.attempts == 1
+
+
+def test_without_refresh_token_job_needs_auth_until_sign_in(run_db):
+    drive = FakeDrive()
+    worker = DriveSyncWorker(client_factory=drive, token_refresher=FakeRefresher(), retry_base=0)
+
+    async def scenario():
+        user_id, job_id = await make_job(refresh_token=None)
+        await drain(worker)
+        _, paused = await load(user_id, job_id)
+        async with _session_factory() as session:
+            user = await session.get(User, user_id)
+            user.drive_access_token = encrypt_secret("signed-in-again")
+            user.drive_token_expires_at = datetime.utcnow() + timedelta(hours=1)
+            await worker.resume_user(session, user_id)
+            await session.commit()
+        await drain(worker)
+        return paused, (await load(user_id, job_id))[1]
+
+    paused, job = run_db(scenario())
+    assert (paused.status, paused.next_attempt_at, paused.attempts) == ("needs_auth", None, 0)
+    assert drive.tokens == ["signed-in-again"]
+    assert job.status == "done"
+
+
+def test_revoked_refresh_token_is_dropped_and_job_needs_auth(run_db):
+    worker = DriveSyncWorker(
+        client_factory=FakeDrive(), token_refresher=FakeRefresher(DriveAuthError("invalid_grant")), retry_base=0
+    )
+
+    async def scenario():
+        ids = await make_job()
+        await drain(worker)
+        return await load(*ids)
+
+    user, job = run_db(scenario())
+    assert job.status == "needs_auth"
+    assert user.drive_refresh_token is None
@@ -0,0 +1,27 @@
+import gzip
+
+from app.gazetteer import Gazetteer
+
+
+def build(tmp_path, rows):
+    source = tmp_path / "gazetteer.tsv.gz"
+    with gzip.open(source, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write("\t".join(str(field) for field in row) + "\n")
+    gazetteer = Gazetteer(source=source, db_path=str(tmp_path / "gazetteer.sqlite3"))
+    gazetteer.ensure_built()
+    return gazetteer
+
+
+def test_typo_of_alternate_name_finds_place(tmp_path):
+    gazetteer = build(tmp_path, [
+        (1277333, "Bengaluru", "IN", "19", 12.97, 77.59, 8495492, "Bangalore,Bengalooru"),
+        (1277324, "Bangaon", "IN", "28", 23.04, 88.83, 111693, "Bongaon"),
+    ])
+    assert gazetteer.search("Bangalroe")[0]["name"] == "Bengaluru"
+
+
+def test_exact_alternate_name_lookup(tmp_path):
+    gazetteer = build(tmp_path, [(1, "Zürich", "CH", "25", 47.37, 8.54, 341730, "Zurich,Zuerich")])
+    assert gazetteer.lookup("Zuerich") == (47.37, 8.54)
+    assert gazetteer.search("Zurch")[0]["name"] == "Zürich"
@@ -0,0 +1,110 @@
+import asyncio
+
+from app import geocoding
+
+GOA = (15.2993, 74.1240)
+HONOLULU_AIRPORT = (21.3187, -157.9225)
+DABOLIM_AIRPORT = (15.3808, 73.8314)
+
+
+def resolve(monkeypatch, location, offline=None, online=None):
+    queries = []
+
+    async def fake_get_coordinates(query, precise=False):
+        queries.append(query)
+        return (online or {}).get(query)
+
+    monkeypatch.setattr(geocoding.gazetteer, "lookup", lambda query, partial=True: (offline or {}).get(query))
+    monkeypatch.setattr(geocoding, "get_coordinates_async", fake_get_coordinates)
+    return asyncio.run(geocoding._resolve_stop(location, "Goa", GOA)), queries
+
+
+def test_distant_offline_hit_is_ignored_for_qualified_query(monkeypatch):
+    coords, queries = resolve(
+        monkeypatch, "Airport",
+        offline={"Airport": HONOLULU_AIRPORT},
+        online={"Airport, Goa": DABOLIM_AIRPORT},
+    )
+    assert coords == DABOLIM_AIRPORT
+    assert queries == ["Airport, Goa"]
+
+
+def test_nearby_offline_hit_skips_network(monkeypatch):
+    coords, queries = resolve(monkeypatch, "Airport", offline={"Airport": DABOLIM_AIRPORT})
+    assert coords == DABOLIM_AIRPORT
+    assert queries == []
+
+
+def test_bare_fallback_must_be_near_destination(monkeypatch):
+    coords, _ = resolve(monkeypatch, "Old Town", online={"Old Town": (48.14, 17.10)})
+    assert coords is None
+    coords, _ = resolve(monkeypatch, "Fontainhas", online={"Fontainhas": (15.4989, 73.8278)})
+    assert coords == (15.4989, 73.8278)
+
+
+def test_unplaceable_destination_keeps_offline_hit(monkeypatch):
+    async def no_network(query, precise=False):
+        return None
+
+    monkeypatch.setattr(geocoding.gazetteer, "lookup", lambda query, partial=True: (26.91, 75.79))
+    monkeypatch.setattr(geocoding, "get_coordinates_async", no_network)
+    assert asyncio.run(geocoding._resolve_stop("Jaipur", "Rajasthan", None)) == (26.91, 75.79)
+
+
+def test_stop_edited_back_after_a_failed_edit_is_geocoded_again(monkeypatch, run_db):
+    from datetime import date
+
+    from app.database import _session_factory
+    from app.models import ItineraryItem, Trip
+
+    known = {"Fontainhas": (15.4989, 73.8278)}
+
+    async def fake_resolve(location, destination, anchor):
+        return known.get(location)
+
+    async def fake_get_coordinates(query, precise=False):
+        return GOA
+
+    monkeypatch.setattr(geocoding, "_resolve_stop", fake_resolve)
+    monkeypatch.setattr(geocoding, "get_coordinates_async", fake_get_coordinates)
+
+    async def edit(trip_id, item_id, location):
+        async with _session_factory() as session:
+            item = await session.get(ItineraryItem, item_id)
+            item.location = location
+            await session.commit()
+        await geocoding._geocode_pending_items(trip_id)
+        async with _session_factory() as session:
+            item = await session.get(ItineraryItem, item_id)
+            return item.latitude, item.longitude, item.geocoded_location
+
+    async def scenario():
+        async with _session_factory() as session:
+            trip = Trip(name="T", destination="Goa", start_date=date.today(), end_date=date.today(),
+                        join_code="GEOBACK1")
+            session.add(trip)
+            await session.commit()
+            trip_id = trip.id
+            item = ItineraryItem(trip_id=trip_id, day_number=1, activity="Walk", location="Fontainhas")
+            session.add(item)
+            await session.commit()
+            item_id = item.id
+        return [await edit(trip_id, item_id, location) for location in ("Fontainhas", "Nowhere Lane", "Fontainhas")]
+
+    first, failed, restored = run_db(scenario())
+    assert first == (15.4989, 73.8278, "Fontainhas")
+    assert failed == (None, None, None)
+    assert restored == first
+
+
+def test_map_views_queue_retries_at_most_once_per_interval(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(geocoding.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(geocoding.settings, "geocode_retry_interval", 600)
+    monkeypatch.setattr(geocoding, "_retry_queued_at", {})
+
+    assert geocoding.claim_geocode_retry(7)
+    assert not geocoding.claim_geocode_retry(7)
+    assert geocoding.claim_geocode_retry(8)
+    clock[0] += 600
+    assert geocoding.claim_geocode_retry(7)
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import io
+import struct
+from datetime import date
+
+import pytest
+from PIL import Image, ImageCms
+from sqlmodel import select
+
+from app import blob_store
+from app.config import settings
+from app.database import _session_factory
+from app.image_normalize import normalize_image
+from app.models import Trip, User
+from app.storage import LocalStorage
+
+
+def _s15(value):
+    return struct.pack(">i", round(value * 65536))
+
+
+def gray_profile(gamma=2.2) -> bytes:
+    """A minimal ICC v2 greyscale display profile (white point, gamma curve)."""
+    def pad(data):
+        return data + b"\0" * (-len(data) % 4)
+
+    text = b"Test Gray\0"
+    tags = [
+        (b"desc", pad(b"desc" + b"\0" * 4 + struct.pack(">I", len(text)) + text + b"\0" * 78)),
+        (b"wtpt", b"XYZ " + b"\0" * 4 + _s15(0.9642) + _s15(1.0) + _s15(0.8249)),
+        (b"kTRC", pad(b"curv" + b"\0" * 4 + struct.pack(">IH", 1, round(gamma * 256)))),
+        (b"cprt", pad(b"text" + b"\0" * 4 + b"none\0")),
+    ]
+    offset = 128 + 4 + 12 * len(tags)
+    table = data = b""
+    for signature, body in tags:
+        table += signature + struct.pack(">II", offset + len(data), len(body))
+        data += body
+    header = (
+        struct.pack(">I", offset + len(data)) + b"\0" * 4 + struct.pack(">I", 0x02100000)
+        + b"mntrGRAYXYZ " + b"\0" * 12 + b"acsp" + b"\0" * 28
+        + _s15(0.9642) + _s15(1.0) + _s15(0.8249) + b"\0" * 48
+    )
+    return header + struct.pack(">I", len(tags)) + table + data
+
+
+def colour_space(path):
+    with Image.open(path) as image:
+        profile = image.info.get("icc_profile")
+    return ImageCms.ImageCmsProfile(io.BytesIO(profile)).profile.xcolor_space.strip() if profile else None
+
+
+def save_jpeg(path, image, **options):
+    image.save(path, "JPEG", **options)
+    return str(path)
+
+
+def test_greyscale_jpeg_is_converted_through_its_profile(tmp_path):
+    grey = Image.linear_gradient("L").resize((400, 300))
+    src = save_jpeg(tmp_path / "grey.jpg", grey, quality=95, icc_profile=gray_profile())
+
+    path, _, _, ext = normalize_image(src, str(tmp_path), 200, 85)
+    with Image.open(path) as out:
+        assert (out.mode, out.size, ext) == ("RGB", (200, 150), ".jpg")
+        r, g, b = out.getpixel((100, 75))
+        assert abs(r - g) <= 2 and abs(g - b) <= 2
+    assert colour_space(path) == "RGB"
+
+
+def test_cmyk_jpeg_never_carries_a_non_rgb_profile(tmp_path):
+    cmyk = Image.new("CMYK", (400, 300), (0, 255, 255, 0))
+    plain = save_jpeg(tmp_path / "plain.jpg", cmyk, quality=95)
+    mismatched = save_jpeg(tmp_path / "tagged.jpg", cmyk, quality=95, icc_profile=gray_profile())
+
+    for src in (plain, mismatched):
+        path, _, _, _ = normalize_image(src, str(tmp_path), 200, 85)
+        with Image.open(path) as out:
+            assert out.mode == "RGB"
+            r, g, b = out.getpixel((100, 75))
+            assert r > 200 and g < 60 and b < 60
+        assert colour_space(path) is None
+
+
+def test_rgb_profile_is_kept(tmp_path):
+    srgb = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    src = save_jpeg(tmp_path / "rgb.jpg", Image.new("RGB", (400, 300), "teal"), icc_profile=srgb)
+    path, _, _, _ = normalize_image(src, str(tmp_path), 200, 85)
+    with Image.open(path) as out:
+        assert out.info["icc_profile"] == srgb
+
+
+def test_upright_small_photo_that_would_grow_is_kept_as_is(tmp_path):
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    noisy = Image.effect_noise((300, 200), 80).convert("RGB")
+    src = save_jpeg(tmp_path / "small.jpg", noisy, quality=20)
+    assert normalize_image(src, str(out_dir), 2048, 95) is None
+    assert list(out_dir.iterdir()) == []
+
+
+def test_rotated_photo_is_transposed_and_slimmed(tmp_path):
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 CW to display
+    exif[0x010F] = "Camera Co"
+    exif.get_ifd(0x8769)[0x9003] = "2024:03:01 10:20:30"
+    exif.get_ifd(0x8769)[0x927C] = b"maker note" * 10
+    exif.get_ifd(0x8825).update({1: "N", 2: (15.0, 30.0, 0.0), 3: "E", 4: (73.0, 50.0, 0.0)})
+    src = save_jpeg(tmp_path / "rotated.jpg", Image.new("RGB", (400, 300), "orange"), exif=exif.tobytes())
+
+    path, sha256, size, _ = normalize_image(src, str(tmp_path), 2048, 85)
+    data = open(path, "rb").read()
+    assert (sha256, size) == (hashlib.sha256(data).hexdigest(), len(data))
+    with Image.open(path) as out:
+        assert out.size == (300, 400)
+        slim = out.getexif()
+    assert 0x0112 not in slim
+    assert slim[0x010F] == "Camera Co"
+    assert slim.get_ifd(0x8769) == {0x9003: "2024:03:01 10:20:30"}
+    assert slim.get_ifd(0x8825)[1] == "N"
+
+
+@pytest.fixture
+def local_blobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "storage", LocalStorage(tmp_path / "store"))
+    monkeypatch.setattr(settings, "trip_storage_quota", 0)
+    monkeypatch.setattr(settings, "user_storage_quota", 0)
+
+
+_trips = 0
+
+
+@pytest.mark.parametrize("keep_originals", [False, True])
+def test_upload_charges_the_original_only_when_kept(tmp_path, local_blobs, run_db, keep_originals):
+    from app.routers.gallery import _add_upload_ref
+
+    global _trips
+    _trips += 1
+    original, copy = tmp_path / "original.jpg", tmp_path / "normalized.jpg"
+    original.write_bytes(b"o" * 1000)
+    copy.write_bytes(b"n" * 300)
+    original_sha = hashlib.sha256(b"o" * 1000).hexdigest()
+    copy_sha = hashlib.sha256(b"n" * 300).hexdigest()
+
+    async def scenario():
+        async with _session_factory() as session:
+            user = User(email=f"normalize{_trips}@example.com")
+            trip = Trip(name="T", destination="Goa", start_date=date.today(), end_date=date.today(),
+                        join_code=f"NORM{_trips}", keep_originals=keep_originals)
+            session.add_all([user, trip])
+            await session.commit()
+            added = await _add_upload_ref(
+                session, trip.id, user.id, trip.keep_originals,
+                original, original_sha, 1000, ".jpg", (str(copy), copy_sha, 300, ".jpg"),
+            )
+            await session.commit()
+            return added, (await session.scalar(select(Trip.storage_bytes).where(Trip.id == trip.id)))
+
+    (filename, sha256, original_filename, charged), trip_bytes = run_db(scenario())
+    assert (filename, sha256) == (f"{copy_sha}.jpg", copy_sha)
+    assert not original.exists() and not copy.exists()
+    if keep_originals:
+        assert original_filename == f"{original_sha}.jpg"
+        assert charged == trip_bytes == 1300
+    else:
+        assert original_filename is None
+        assert charged == trip_bytes == 300
+
+
+def test_upload_over_quota_discards_both_files(tmp_path, local_blobs, run_db, monkeypatch):
+    from app.routers.gallery import _add_upload_ref
+
+    monkeypatch.setattr(settings, "trip_storage_quota", 100)
+    original, copy = tmp_path / "original.jpg", tmp_path / "normalized.jpg"
+    original.write_bytes(b"o" * 1000)
+    copy.write_bytes(b"n" * 300)
+
+    async def scenario():
+        async with _session_factory() as session:
+            user = User(email="normalize-quota@example.com")
+            trip = Trip(name="T", destination="Goa", start_date=date.today(), end_date=date.today(),
+                        join_code="NORMQUOTA")
+            session.add_all([user, trip])
+            await session.commit()
+            return await _add_upload_ref(
+                session, trip.id, user.id, False, original, "f" * 64, 1000, ".jpg", (str(copy), "a" * 64, 300, ".jpg"),
+            )
+
+    assert run_db(scenario()) is None
+    assert not original.exists() and not copy.exists()
@@ -0,0 +1,56 @@
+import json
+
+from app.json_stream import JSONArrayStreamParser
+
+DAYS = [
+    {"day": 1, "title": "Arrive {and} settle [in]", "note": 'say "namaste"\\n'},
+    {"day": 2, "activities": [{"time": "09:00", "what": "Fort"}, {"time": "18:00", "what": "Ghats"}]},
+    {"day": 3, "title": "Back slash \\ and brace }"},
+]
+
+
+def feed_in_chunks(text, size):
+    parser = JSONArrayStreamParser()
+    elements = []
+    for start in range(0, len(text), size):
+        elements.extend(parser.feed(text[start:start + size]))
+    return elements
+
+
+def test_elements_split_across_every_chunk_boundary():
+    text = json.dumps(DAYS, indent=2)
+    for size in (1, 2, 3, 7, 64, len(text)):
+        assert feed_in_chunks(text, size) == DAYS
+
+
+def test_each_element_is_emitted_as_soon_as_it_closes():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"day": 1, "title": "x"') == []
+    assert parser.feed('}, {"day": 2') == [{"day": 1, "title": "x"}]
+    assert parser.feed("}]") == [{"day": 2}]
+    assert parser.feed(', {"day": 3}]') == []
+
+
+def test_leading_prose_and_code_fence_are_skipped():
+    text = "Sure! Here's your itinerary:\n\n```json\n" + json.dumps(DAYS) + "\n```\nEnjoy the trip."
+    assert feed_in_chunks(text, 5) == DAYS
+
+
+def test_truncated_final_element_is_not_emitted():
+    text = json.dumps(DAYS)
+    cut = text[:text.rindex('"title"')]
+    assert feed_in_chunks(cut, 4) == DAYS[:2]
+
+
+def test_malformed_element_is_skipped_and_parsing_continues():
+    text = '[{"day": 1}, {"day": 2,, "oops": }, {"day": 3}]'
+    assert feed_in_chunks(text, 3) == [{"day": 1}, {"day": 3}]
+
+
+def test_buffer_only_keeps_the_element_in_progress():
+    parser = JSONArrayStreamParser()
+    parser.feed("[")
+    for day in range(1, 200):
+        parser.feed(json.dumps({"day": day, "padding": "x" * 100}) + ", ")
+    parser.feed('{"day": 200, "pad')
+    assert parser._buffer == '{"day": 200, "pad'
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.llm_executor import CircuitBreaker, CircuitOpenError, LLMExecutor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def open_breaker(clock: FakeClock) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+
+def test_breaker_opens_after_threshold_and_rejects():
+    breaker = open_breaker(FakeClock())
+    assert not breaker.allow()
+    assert breaker.total_rejections == 1
+
+
+def test_half_open_admits_a_single_probe():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 10
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_probe_success_closes_breaker():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_probe_failure_reopens_breaker():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now = 19
+    assert not breaker.allow()
+    clock.now = 20
+    assert breaker.allow()
+
+
+def test_released_probe_lets_next_call_probe():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 10
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+
+
+def half_open_executor(max_concurrency: int = 1) -> LLMExecutor:
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 10
+    return LLMExecutor(max_workers=1, max_concurrency=max_concurrency, timeout=5, stream_timeout=5, breaker=breaker)
+
+
+def test_run_probe_success_closes_breaker():
+    executor = half_open_executor()
+    assert asyncio.run(executor.run(lambda: 42)) == 42
+    assert executor.breaker.state == CircuitBreaker.CLOSED
+    executor.shutdown()
+
+
+def test_run_fails_fast_while_open():
+    executor = LLMExecutor(max_workers=1, max_concurrency=1, breaker=open_breaker(FakeClock()))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(executor.run(lambda: 42))
+    executor.shutdown()
+
+
+def test_probe_cancelled_while_waiting_for_a_slot_is_released():
+    executor = half_open_executor()
+
+    async def scenario():
+        await executor.semaphore.acquire()  # every slot busy
+        probe = asyncio.create_task(executor.run(lambda: 1))
+        await asyncio.sleep(0.01)
+        assert executor.breaker._probe_in_flight
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        executor.semaphore.release()
+        return await executor.run(lambda: 2)
+
+    assert asyncio.run(scenario()) == 2
+    assert executor.breaker.state == CircuitBreaker.CLOSED
+    executor.shutdown()
+
+
+def test_stream_probe_cancelled_while_waiting_for_a_slot_is_released():
+    executor = half_open_executor()
+
+    async def consume():
+        return [item async for item in executor.stream(lambda: iter([1, 2]))]
+
+    async def scenario():
+        await executor.semaphore.acquire()
+        probe = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        executor.semaphore.release()
+        return await consume()
+
+    assert asyncio.run(scenario()) == [1, 2]
+    executor.shutdown()
+
+
+def test_call_admitted_while_closed_does_not_release_the_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    executor = LLMExecutor(max_workers=2, max_concurrency=2, timeout=5, stream_timeout=5, breaker=breaker)
+    finish = threading.Event()
+
+    async def scenario():
+        stale = asyncio.create_task(executor.run(finish.wait))
+        await asyncio.sleep(0.01)
+        breaker.record_failure()
+        breaker.record_failure()
+        clock.now = 10
+        probe = asyncio.create_task(executor.run(finish.wait))
+        await asyncio.sleep(0.01)
+        stale.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await stale
+        second_probe_admitted = breaker.allow()
+        finish.set()
+        await probe
+        return second_probe_admitted
+
+    assert asyncio.run(scenario()) is False
+    assert breaker.state == CircuitBreaker.CLOSED
+    executor.shutdown()
@@ -0,0 +1,68 @@
+import random
+
+import numpy as np
+from PIL import Image
+
+from app.near_duplicates import _BLOCK_ROWS, dhash, find_groups, hamming_matrix
+
+MAX_DISTANCE = 6
+
+
+def flip(value: int, bits: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), bits):
+        value ^= 1 << bit
+    return value
+
+
+def test_hamming_matrix_matches_popcount():
+    rng = random.Random(1)
+    values = [rng.getrandbits(64) for _ in range(40)] + [0, 2 ** 64 - 1, 2 ** 63]
+    hashes = np.array(values, dtype=np.uint64)
+    matrix = hamming_matrix(hashes[:7], hashes)
+    assert matrix.shape == (7, len(values))
+    for i in range(7):
+        for j, other in enumerate(values):
+            assert matrix[i, j] == bin(values[i] ^ other).count("1")
+
+
+def test_groups_across_block_boundaries():
+    rng = random.Random(2)
+    n = _BLOCK_ROWS + 300
+    values = [rng.getrandbits(64) for _ in range(n)]
+    # (first index, second index, distance); each pair straddles a block boundary
+    pairs = [(3, _BLOCK_ROWS + 90, 0), (10, _BLOCK_ROWS + 8, 1), (100, _BLOCK_ROWS + 188, MAX_DISTANCE),
+             (200, _BLOCK_ROWS + 288, MAX_DISTANCE + 1)]
+    for a, b, distance in pairs:
+        values[b] = flip(values[a], distance, rng)
+    values[0] = 2 ** 64 - 1  # top bit set survives the uint64 conversion
+    values[n - 1] = flip(values[0], 2, rng)
+    ids = [1000 + i for i in range(n)]
+
+    groups = find_groups(ids, [f"{v:016x}" for v in values], MAX_DISTANCE)
+
+    expected = [[ids[a], ids[b]] for a, b, distance in pairs if distance <= MAX_DISTANCE]
+    expected.append([ids[0], ids[n - 1]])
+    assert sorted(groups) == sorted(expected)
+
+
+def test_chained_hashes_form_one_group_in_input_order():
+    rng = random.Random(3)
+    a = rng.getrandbits(64)
+    b = flip(a, MAX_DISTANCE, rng)
+    c = b
+    while bin(a ^ c).count("1") <= MAX_DISTANCE:
+        c = flip(b, MAX_DISTANCE, rng)
+    lone = a ^ (2 ** 64 - 1)
+    groups = find_groups([7, 8, 9, 10], [f"{v:016x}" for v in (c, lone, a, b)], MAX_DISTANCE)
+    assert groups == [[7, 9, 10]]
+    assert find_groups([1], ["0" * 16], MAX_DISTANCE) == []
+
+
+def test_dhash_is_stable_under_resize_and_reencode():
+    base = Image.linear_gradient("L").rotate(30).resize((640, 480)).convert("RGB")
+    smaller = base.resize((320, 240))
+    other = base.transpose(Image.FLIP_LEFT_RIGHT)
+    near = int(dhash(base), 16) ^ int(dhash(smaller), 16)
+    far = int(dhash(base), 16) ^ int(dhash(other), 16)
+    assert len(dhash(base)) == 16
+    assert bin(near).count("1") <= 4 < bin(far).count("1")
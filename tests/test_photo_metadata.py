@@ -0,0 +1,116 @@
+from datetime import datetime
+from fractions import Fraction
+
+import pytest
+from PIL import Image
+
+from app.photo_metadata import _gps_coord, _parse_exif_time, read_metadata
+
+
+def jpeg_with_exif(path, size=(400, 300), orientation=None, taken=None, gps=None):
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    if taken is not None:
+        exif.get_ifd(0x8769)[0x9003] = taken
+    if gps is not None:
+        exif.get_ifd(0x8825).update(gps)
+    Image.linear_gradient("L").resize(size).convert("RGB").save(path, "JPEG", exif=exif.tobytes())
+    return str(path)
+
+
+@pytest.mark.parametrize("orientation, size", [
+    (None, (400, 300)), (1, (400, 300)), (3, (400, 300)), (4, (400, 300)),
+    (5, (300, 400)), (6, (300, 400)), (7, (300, 400)), (8, (300, 400)), (9, (400, 300)),
+])
+def test_quarter_turn_orientations_swap_displayed_size(tmp_path, orientation, size):
+    metadata = read_metadata(jpeg_with_exif(tmp_path / "p.jpg", orientation=orientation))
+    assert (metadata["width"], metadata["height"]) == size
+    assert metadata["orientation"] == (orientation if orientation in range(1, 9) else 1)
+    assert metadata["phash"] is not None
+
+
+def test_southern_western_gps_is_negative(tmp_path):
+    gps = {1: "S", 2: (33.0, 52.0, 4.0), 3: "W", 4: (151.0, 12.0, 36.0)}
+    metadata = read_metadata(jpeg_with_exif(tmp_path / "p.jpg", gps=gps))
+    assert metadata["latitude"] == pytest.approx(-(33 + 52 / 60 + 4 / 3600))
+    assert metadata["longitude"] == pytest.approx(-(151 + 12 / 60 + 36 / 3600))
+
+
+def test_zero_zero_gps_is_no_fix(tmp_path):
+    gps = {1: "N", 2: (0.0, 0.0, 0.0), 3: "E", 4: (0.0, 0.0, 0.0)}
+    metadata = read_metadata(jpeg_with_exif(tmp_path / "p.jpg", gps=gps))
+    assert metadata["latitude"] is None and metadata["longitude"] is None
+
+
+def test_capture_time_and_zeroed_dates(tmp_path):
+    metadata = read_metadata(jpeg_with_exif(tmp_path / "a.jpg", taken="2024:03:01 10:20:30"))
+    assert metadata["taken_at"] == datetime(2024, 3, 1, 10, 20, 30)
+    metadata = read_metadata(jpeg_with_exif(tmp_path / "b.jpg", taken="0000:00:00 00:00:00"))
+    assert metadata["taken_at"] is None
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024:03:01 10:20:30", datetime(2024, 3, 1, 10, 20, 30)),
+    ("2024:03:01 10:20:30\x00", datetime(2024, 3, 1, 10, 20, 30)),
+    ("0000:00:00 00:00:00", None),
+    ("    :  :     :  :  ", None),
+    ("", None),
+    (None, None),
+    (b"2024:03:01 10:20:30", None),
+])
+def test_parse_exif_time(value, expected):
+    assert _parse_exif_time(value) == expected
+
+
+@pytest.mark.parametrize("value, ref, expected", [
+    ((Fraction(15), Fraction(30), Fraction(0)), b"N", 15.5),
+    ((15.0, 30.0, 0.0), "s", -15.5),
+    ((73.0, 30.0, 0.0), b"W\x00", -73.5),
+    ((95.0, 0.0, 0.0), "N", None),  # beyond the latitude limit
+    ((15.0, 30.0), "N", None),
+    (None, "N", None),
+])
+def test_gps_coord(value, ref, expected):
+    result = _gps_coord(value, ref, 90)
+    assert result == (pytest.approx(expected) if expected is not None else None)
+
+
+def test_unreadable_file_is_marked_with_orientation_zero(tmp_path, run_db, monkeypatch):
+    from contextlib import asynccontextmanager
+    from datetime import date
+
+    from app import photo_metadata
+    from app.database import _session_factory
+    from app.models import Photo, Trip, User
+
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"\xff\xd8 not a jpeg at all")
+
+    @asynccontextmanager
+    async def source(photo):
+        yield broken
+
+    async def in_process(fn, *args):
+        return fn(*args)
+
+    monkeypatch.setattr(photo_metadata, "_photo_source", source)
+    monkeypatch.setattr("app.media_pool.run_in_media_pool", in_process)
+
+    async def scenario():
+        async with _session_factory() as session:
+            user = User(email="exif-broken@example.com")
+            trip = Trip(name="T", destination="Goa", start_date=date.today(), end_date=date.today(),
+                        join_code="EXIFBROKEN")
+            session.add_all([user, trip])
+            await session.commit()
+            photo = Photo(trip_id=trip.id, user_id=user.id, filename="broken.jpg", media_type="image")
+            session.add(photo)
+            await session.commit()
+            photo_id = photo.id
+        await photo_metadata.extract_metadata(photo_id)
+        async with _session_factory() as session:
+            photo = await session.get(Photo, photo_id)
+            return photo.orientation, photo.width, photo_metadata.needs_extraction(photo)
+
+    assert run_db(scenario()) == (0, None, False)
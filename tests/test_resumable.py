@@ -0,0 +1,115 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.resumable import ResumableUploadStore, UploadSessionError, format_ranges, merge_ranges
+
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def write(store, upload_id, offset, *chunks):
+    return asyncio.run(store.write_chunk(upload_id, offset, body(*chunks)))
+
+
+def test_merge_and_format_ranges():
+    merged = merge_ranges([(10, 20), (0, 5), (5, 8), (15, 30)])
+    assert merged == [(0, 8), (10, 30)]
+    assert format_ranges(merged) == "0-7,10-29"
+
+
+def test_offset_advances_with_sequential_chunks(tmp_path):
+    store = ResumableUploadStore(tmp_path)
+    state = store.create(1, 1, 10, "clip.mp4", ".mp4")
+    assert store.contiguous_offset(state) == 0
+
+    state = write(store, state["id"], 0, b"abc", b"de")
+    assert store.contiguous_offset(state) == 5
+    assert not store.is_complete(state)
+
+    state = write(store, state["id"], 5, b"fghij")
+    assert store.contiguous_offset(state) == 10
+    assert store.is_complete(state)
+
+
+def test_out_of_order_chunks_fill_gap(tmp_path):
+    store = ResumableUploadStore(tmp_path)
+    upload_id = store.create(1, 1, 9, "clip.mp4", ".mp4")["id"]
+
+    state = write(store, upload_id, 6, b"ghi")
+    assert store.contiguous_offset(state) == 0
+    state = write(store, upload_id, 0, b"abc")
+    assert store.contiguous_offset(state) == 3
+    assert format_ranges([tuple(r) for r in state["ranges"]]) == "0-2,6-8"
+
+    # Overlapping resend of a partly received chunk is merged, not double counted.
+    state = write(store, upload_id, 2, b"cdef")
+    assert state["ranges"] == [[0, 9]]
+
+    dest = tmp_path / "out"
+    path, filename, _ = asyncio.run(store.finalize(upload_id, dest))
+    assert path.read_bytes() == b"abcdefghi"
+    assert filename.endswith(".mp4")
+
+
+def test_state_survives_a_new_store(tmp_path):
+    upload_id = ResumableUploadStore(tmp_path).create(1, 1, 6, "clip.mp4", ".mp4")["id"]
+    write(ResumableUploadStore(tmp_path), upload_id, 0, b"abc")
+
+    resumed = ResumableUploadStore(tmp_path)
+    state = resumed.status(upload_id)
+    assert resumed.contiguous_offset(state) == 3
+    state = write(resumed, upload_id, 3, b"def")
+    assert resumed.is_complete(state)
+
+
+def test_dropped_stream_keeps_received_bytes(tmp_path):
+    store = ResumableUploadStore(tmp_path)
+    upload_id = store.create(1, 1, 10, "clip.mp4", ".mp4")["id"]
+
+    async def flaky():
+        yield b"abcd"
+        raise ConnectionError("client went away")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(store.write_chunk(upload_id, 0, flaky()))
+    assert store.contiguous_offset(store.status(upload_id)) == 4
+
+
+def test_rejects_bad_offsets_and_overruns(tmp_path):
+    store = ResumableUploadStore(tmp_path)
+    upload_id = store.create(1, 1, 4, "clip.mp4", ".mp4")["id"]
+
+    with pytest.raises(UploadSessionError) as err:
+        write(store, upload_id, 5, b"x")
+    assert err.value.status_code == 409
+
+    with pytest.raises(UploadSessionError) as err:
+        write(store, upload_id, 2, b"xyz")
+    assert err.value.status_code == 413
+
+    with pytest.raises(UploadSessionError) as err:
+        asyncio.run(store.finalize(upload_id, tmp_path / "out"))
+    assert err.value.status_code == 409
+
+
+def test_unknown_and_expired_sessions(tmp_path):
+    store = ResumableUploadStore(tmp_path)
+    with pytest.raises(UploadSessionError) as err:
+        store.status("../etc")
+    assert err.value.status_code == 404
+
+    upload_id = store.create(1, 1, 4, "clip.mp4", ".mp4")["id"]
+    meta_path = tmp_path / f"{upload_id}.json"
+    state = json.loads(meta_path.read_text())
+    state["expires_at"] = time.time() - 1
+    meta_path.write_text(json.dumps(state))
+
+    with pytest.raises(UploadSessionError) as err:
+        store.status(upload_id)
+    assert err.value.status_code == 410
+    assert not (tmp_path / f"{upload_id}.part").exists()
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.routing import GreatCircleProvider, OSRMProvider, RoutingChain, RoutingError
+
+JAIPUR = (26.9124, 75.7873)
+AJMER = (26.4499, 74.6399)
+PUSHKAR = (26.4897, 74.5511)
+
+
+def osrm_answer(request):
+    if request.path.startswith("/route/v1/driving/75.7873,26.9124;74.6399,26.4499"):
+        return 200, {}, json.dumps({"code": "Ok", "routes": [{
+            "geometry": {"coordinates": [[75.7873, 26.9124], [75.0, 26.7], [74.6399, 26.4499]]},
+            "distance": 135000.0, "duration": 8100.0,
+        }]}).encode()
+    if request.path.startswith("/table/v1/driving/"):
+        return 200, {}, json.dumps({
+            "code": "Ok",
+            "distances": [[0, 135000], [135000, 0]],
+            "durations": [[0, 8100], [8100, 0]],
+        }).encode()
+    return 400, {}, json.dumps({"code": "NoRoute", "message": "Impossible route"}).encode()
+
+
+def test_osrm_route_and_table(stub_server):
+    stub_server.handler = osrm_answer
+    provider = OSRMProvider(stub_server.url, name="osrm_test")
+
+    route = asyncio.run(provider.route([JAIPUR, AJMER]))
+    assert route["path"] == [JAIPUR, (26.7, 75.0), AJMER]
+    assert (route["distance_m"], route["duration_s"]) == (135000.0, 8100.0)
+    assert route["provider"] == "osrm_test" and not route["estimated"]
+    assert "geometries=geojson" in stub_server.requests[0].path
+
+    table = asyncio.run(provider.matrix([JAIPUR, AJMER]))
+    assert table["distances_m"] == [[0, 135000], [135000, 0]]
+    assert table["durations_s"][0][1] == 8100
+    assert "annotations=duration%2Cdistance" in stub_server.requests[1].path
+
+
+def test_osrm_error_code_and_bad_body(stub_server):
+    stub_server.handler = osrm_answer
+    provider = OSRMProvider(stub_server.url)
+    with pytest.raises(RoutingError, match="NoRoute"):
+        asyncio.run(provider.route([AJMER, PUSHKAR]))
+
+    stub_server.handler = lambda request: (502, {}, b"<html>Bad Gateway</html>")
+    with pytest.raises(RoutingError, match="request failed"):
+        asyncio.run(provider.route([JAIPUR, AJMER]))
+
+
+def test_osrm_timeout(stub_server):
+    def slow(request):
+        time.sleep(1.0)
+        return osrm_answer(request)
+
+    stub_server.handler = slow
+    provider = OSRMProvider(stub_server.url, timeout=0.2)
+    started = time.monotonic()
+    with pytest.raises(RoutingError, match="request failed"):
+        asyncio.run(provider.route([JAIPUR, AJMER]))
+    assert time.monotonic() - started < 0.9
+
+
+def test_chain_falls_back_to_estimate_and_caches_only_real_routes(stub_server):
+    stub_server.handler = lambda request: (503, {}, b"")
+    chain = RoutingChain([OSRMProvider(stub_server.url), GreatCircleProvider()])
+
+    estimate = asyncio.run(chain.route([JAIPUR, AJMER]))
+    assert estimate["provider"] == "estimate" and estimate["estimated"]
+    assert 120_000 < estimate["distance_m"] < 200_000
+    assert chain.get_cached([JAIPUR, AJMER]) is None
+
+    matrix = asyncio.run(chain.matrix([JAIPUR, AJMER, PUSHKAR]))
+    assert matrix["estimated"] and len(matrix["distances_m"]) == 3
+    assert matrix["distances_m"][0][0] == 0
+
+    stub_server.handler = osrm_answer
+    real = asyncio.run(chain.route([JAIPUR, AJMER]))
+    assert not real["estimated"]
+    requests = len(stub_server.requests)
+    assert asyncio.run(chain.route([JAIPUR, AJMER])) is real
+    assert len(stub_server.requests) == requests
+
+
+def test_chain_raises_when_every_provider_fails(stub_server):
+    stub_server.handler = lambda request: (503, {}, b"")
+    chain = RoutingChain([OSRMProvider(stub_server.url)])
+    with pytest.raises(RoutingError):
+        asyncio.run(chain.route([JAIPUR, AJMER]))
@@ -0,0 +1,141 @@
+from datetime import date
+
+import pytest
+
+from app import storage_quota
+from app.config import settings
+from app.database import _session_factory
+from app.models import Blob, Document, Photo, Trip, User
+from app.storage_quota import release_bytes, release_trip, remaining, reconcile, reserve
+
+_rows = 0
+
+
+async def with_session(scenario):
+    async with _session_factory() as session:
+        return await scenario(session)
+
+
+async def make_owner(session):
+    global _rows
+    _rows += 1
+    user = User(email=f"quota{_rows}@example.com")
+    trip = Trip(name="T", destination="Goa", start_date=date.today(), end_date=date.today(), join_code=f"QUOTA{_rows}")
+    session.add_all([user, trip])
+    await session.commit()
+    return trip.id, user.id
+
+
+async def counters(session, trip_id, user_id):
+    session.expire_all()
+    return (await session.get(Trip, trip_id)).storage_bytes, (await session.get(User, user_id)).storage_bytes
+
+
+@pytest.fixture
+def quotas(monkeypatch):
+    def set_quotas(trip=0, user=0):
+        monkeypatch.setattr(settings, "trip_storage_quota", trip)
+        monkeypatch.setattr(settings, "user_storage_quota", user)
+    set_quotas()
+    return set_quotas
+
+
+def test_reserve_charges_trip_and_user(quotas, run_db):
+    quotas(trip=1000)
+
+    async def scenario(session):
+        ids = await make_owner(session)
+        assert await reserve(session, *ids, 600)
+        await session.commit()
+        return await counters(session, *ids), await remaining(session, *ids)
+
+    assert run_db(with_session(scenario)) == ((600, 600), 400)
+
+
+def test_reserve_over_trip_quota_charges_nothing(quotas, run_db):
+    quotas(trip=1000)
+
+    async def scenario(session):
+        ids = await make_owner(session)
+        assert await reserve(session, *ids, 600)
+        assert not await reserve(session, *ids, 600)
+        await session.commit()
+        return await counters(session, *ids)
+
+    assert run_db(with_session(scenario)) == (600, 600)
+
+
+def test_reserve_over_user_quota_rolls_back_trip_charge(quotas, run_db):
+    quotas(trip=10_000, user=1000)
+
+    async def scenario(session):
+        ids = await make_owner(session)
+        assert await reserve(session, *ids, 900)
+        assert not await reserve(session, *ids, 200)
+        await session.commit()
+        return await counters(session, *ids)
+
+    assert run_db(with_session(scenario)) == (900, 900)
+
+
+def test_release_gives_bytes_back(quotas, run_db):
+    async def scenario(session):
+        ids = await make_owner(session)
+        await reserve(session, *ids, 700)
+        await release_bytes(session, *ids, 300)
+        await release_bytes(session, *ids, None)
+        await session.commit()
+        return await counters(session, *ids)
+
+    assert run_db(with_session(scenario)) == (400, 400)
+
+
+def test_reconcile_resets_drifted_counters(quotas, monkeypatch, run_db):
+    async def no_legacy_files(*args, **kwargs):
+        return 0
+
+    monkeypatch.setattr(storage_quota, "_legacy_sizes", no_legacy_files)
+
+    async def scenario(session):
+        trip_id, user_id = await make_owner(session)
+        session.add(Blob(sha256="a" * 64, size=250, ext=".jpg", refcount=1))
+        session.add(Photo(trip_id=trip_id, user_id=user_id, filename="p.jpg", size_bytes=100))
+        session.add(Photo(trip_id=trip_id, user_id=user_id, filename=f"{'a' * 64}.jpg", sha256="a" * 64))
+        session.add(Document(trip_id=trip_id, user_id=user_id, doc_type="other", title="d", size_bytes=50))
+        trip = await session.get(Trip, trip_id)
+        trip.storage_bytes = 5
+        await session.commit()
+        await reconcile(session)
+        return await counters(session, trip_id, user_id)
+
+    assert run_db(with_session(scenario)) == (400, 400)
+
+
+def test_release_trip_frees_uploader_bytes_and_blob_refs(quotas, run_db):
+    shared, own = "b" * 64, "c" * 64
+
+    async def scenario(session):
+        trip_id, user_id = await make_owner(session)
+        other_trip, _ = await make_owner(session)
+        session.add_all([
+            Blob(sha256=shared, size=100, ext=".jpg", refcount=2),
+            Blob(sha256=own, size=40, ext=".pdf", refcount=1),
+            Photo(trip_id=trip_id, user_id=user_id, filename=f"{shared}.jpg", sha256=shared, size_bytes=100),
+            Photo(trip_id=other_trip, user_id=user_id, filename=f"{shared}.jpg", sha256=shared, size_bytes=100),
+            Document(trip_id=trip_id, user_id=user_id, doc_type="other", title="d",
+                     file_path=f"{own}.pdf", sha256=own, size_bytes=40),
+        ])
+        user = await session.get(User, user_id)
+        user.storage_bytes = 240
+        await session.commit()
+        orphaned = await release_trip(session, trip_id)
+        await session.commit()
+        session.expire_all()
+        return (
+            orphaned,
+            (await session.get(User, user_id)).storage_bytes,
+            (await session.get(Blob, shared)).refcount,
+            await session.get(Blob, own),
+        )
+
+    assert run_db(with_session(scenario)) == ([f"{'c' * 64}.pdf"], 100, 1, None)
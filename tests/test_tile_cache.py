@@ -0,0 +1,78 @@
+import asyncio
+
+from app.tile_cache import TileCache
+
+PNG = b"\x89PNG" + b"\0" * 96  # 100 bytes
+
+
+def seed(cache_dir, count):
+    for y in range(count):
+        path = cache_dir / "5" / "3" / f"{y}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(PNG)
+
+
+def make_cache(tmp_path, stub_server, **kwargs):
+    kwargs.setdefault("max_bytes", 10_000)
+    return TileCache(
+        cache_dir=str(tmp_path / "tiles"),
+        upstream_url=stub_server.url + "/{z}/{x}/{y}.png",
+        fresh_seconds=3600,
+        **kwargs,
+    )
+
+
+def test_concurrent_first_access_scans_once(tmp_path, stub_server):
+    seed(tmp_path / "tiles", 5)
+    stub_server.handler = lambda request: (200, {"ETag": '"t1"'}, PNG)
+    cache = make_cache(tmp_path, stub_server, max_bytes=600)
+    scans = []
+    scan = cache._scan
+    cache._scan = lambda: scans.append(1) or scan()
+
+    async def scenario():
+        cached = [cache.get(5, 3, y % 5) for y in range(40)]
+        fetched = [cache.get(5, 3, 9) for _ in range(10)]
+        return await asyncio.gather(*cached, *fetched)
+
+    paths = asyncio.run(scenario())
+
+    assert len(scans) == 1
+    assert all(path.read_bytes() == PNG for path in paths)
+    stats = cache.stats()
+    # Five seeded tiles plus one fetched, nothing evicted: the index counted each file once.
+    assert stats["tiles"] == 6 and stats["bytes"] == 600
+    assert stats["hits"] == 40 and stats["misses"] == 1
+    assert [r.path for r in stub_server.requests] == ["/5/3/9.png"]
+    assert len(list((tmp_path / "tiles").glob("*/*/*.png"))) == 6
+
+
+def test_evicts_least_recently_used_over_budget(tmp_path, stub_server):
+    seed(tmp_path / "tiles", 3)
+    stub_server.handler = lambda request: (200, {}, PNG)
+    cache = make_cache(tmp_path, stub_server, max_bytes=300)
+
+    async def scenario():
+        await cache.get(5, 3, 0)  # touch 0 and 1 so tile 2 is least recently used
+        await cache.get(5, 3, 1)
+        await cache.get(5, 3, 7)
+
+    asyncio.run(scenario())
+    assert cache.stats()["bytes"] == 300
+    remaining = sorted(p.stem for p in (tmp_path / "tiles").glob("*/*/*.png"))
+    assert remaining == ["0", "1", "7"]
+
+
+def test_revalidates_stale_tile_and_serves_stale_on_error(tmp_path, stub_server):
+    stub_server.handler = lambda request: (200, {"ETag": '"v1"'}, PNG)
+    cache = make_cache(tmp_path, stub_server)
+    asyncio.run(cache.get(1, 0, 0))
+
+    cache.fresh_seconds = 0
+    stub_server.handler = lambda request: (304, {}, b"")
+    asyncio.run(cache.get(1, 0, 0))
+    assert stub_server.requests[-1].headers["if-none-match"] == '"v1"'
+    assert cache.revalidated == 1
+
+    stub_server.handler = lambda request: (503, {}, b"")
+    assert asyncio.run(cache.get(1, 0, 0)).read_bytes() == PNG